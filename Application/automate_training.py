@@ -1,19 +1,219 @@
 
-# python automate_training.py
+# python automate_training.py [--skip-fetch | --offline] [--force] [--stages prepare train] [--interval 5min]
 
+import hashlib
+import json
 import os
-import subprocess
+import sys
+import time
 
-# Step 1: Fetch new data
-print("Fetching new data...")
-subprocess.run(["python", "scripts/data_fetch.py"], check=True)
+# Add the scripts directory to the system path
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(BASE_DIR, "scripts"))
 
-# Step 2: Prepare the dataset
-print("Preparing dataset...")
-subprocess.run(["python", "data_preparation.py"], check=True)
+from bar_aggregation import BASE_INTERVAL, DERIVED_INTERVALS, interval_path, normalize_interval, update_aggregates
+from database import DATABASE_PATH, connect
+from indicators import stale_symbols, update_indicators
+from instrumentation import profile, timer
+from ticker_registry import load_symbols
 
-# Step 3: Continue training the model
-print("Continuing model training...")
-subprocess.run(["python", "test_ppo.py"], check=True)
+# Stages in dependency order; each one only sees work its inputs say is new
+STAGES = ["fetch", "indicators", "aggregate", "prepare", "train"]
 
+# Fingerprints and watermarks from the last successful run of each stage
+STATE_FILE = os.path.join(BASE_DIR, "pipeline_state.json")
 
+
+def load_pipeline_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_pipeline_state(state, path=STATE_FILE):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+# Stable content hash of any JSON-serializable inputs
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Per-symbol [last bar, bar count], advanced from the previous watermarks by counting only the bars after
+# each symbol's last one on the (symbol, datetime) index, so the cost follows the new bars, not the history.
+# Stages only ever append 1-minute bars; --force starts from scratch if the database was edited by hand.
+def symbol_watermarks(symbols, previous=None):
+    previous = previous or {}
+    conn = connect(DATABASE_PATH)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'intraday_data'").fetchone():
+        conn.close()
+        return {}
+    watermarks = {}
+    for symbol in symbols:
+        last, count = previous.get(symbol, [None, 0])
+        new_last, new_count = conn.execute(
+            "SELECT MAX(datetime), COUNT(*) FROM intraday_data WHERE symbol = ? AND datetime > ?",
+            (symbol, last or ""),
+        ).fetchone()
+        if new_count or last is not None:
+            watermarks[symbol] = [new_last or last, count + new_count]
+    conn.close()
+    return watermarks
+
+
+def run_fetch(symbols, context):
+    from data_fetch import FETCH_OFFLINE, update_intraday_data
+    inserted = update_intraday_data(symbols, update_indicator_columns=False, offline=context["offline"] or FETCH_OFFLINE)
+    return {"inserted": inserted}
+
+
+def run_indicators(symbols, context):
+    conn = connect(DATABASE_PATH)
+    stale = stale_symbols(conn, symbols)
+    conn.close()
+    if not stale:
+        print("Indicators are up to date.")
+        return {"updated_symbols": 0}
+    update_indicators(stale, database_path=DATABASE_PATH)
+    return {"updated_symbols": len(stale)}
+
+
+# Derive the 5min/15min/60min bars (and their indicators) that the new 1-minute bars complete
+def run_aggregate(symbols, context):
+    written = update_aggregates(symbols, DERIVED_INTERVALS, database_path=DATABASE_PATH)
+    for interval in DERIVED_INTERVALS:
+        update_indicators(symbols, database_path=DATABASE_PATH, interval=interval)
+    return {"bars": written}
+
+
+# Rebuild the prepared dataset, reloading only symbols whose watermark moved since the last build
+def run_prepare(symbols, context):
+    import data_preparation as prep
+    from prepared_store import read_manifest
+
+    interval = context["interval"]
+    params = {
+        "features": prep.FEATURE_COLUMNS,
+        "train_fraction": prep.TRAIN_FRACTION,
+        "per_symbol_scaler": context["per_symbol_scaler"],
+        "interval": interval,
+    }
+    watermarks = context["watermarks"]
+    previous = context["previous"]
+    root = interval_path(prep.PREPARED_DATA_DIR, interval)
+    manifest_path = os.path.join(root, "manifest.json")
+
+    changed = None
+    if previous.get("params") == params and os.path.exists(manifest_path) and not context["force"]:
+        stored = read_manifest(root)["symbols"]
+        old_watermarks = previous.get("watermarks", {})
+        changed = [s for s in symbols if s not in stored or watermarks.get(s) != old_watermarks.get(s)]
+
+    prep.run_preparation(symbols, workers=context["workers"], per_symbol_scaler=context["per_symbol_scaler"],
+                         changed=changed, interval=interval)
+    return {"params": params, "watermarks": watermarks, "reloaded": len(symbols) if changed is None else len(changed)}
+
+
+def run_train(symbols, context):
+    import test_ppo
+    if not test_ppo.run_training(context["num_envs"], context["vec_backend"], interval=context["interval"]):
+        raise RuntimeError("Training could not start; see the error above.")
+    return {}
+
+
+STAGE_FUNCTIONS = {
+    "fetch": run_fetch,
+    "indicators": run_indicators,
+    "aggregate": run_aggregate,
+    "prepare": run_prepare,
+    "train": run_train,
+}
+
+
+# Fingerprint of everything a stage's output depends on; None means the stage always runs
+def stage_inputs(stage, symbols, context, state):
+    if stage == "fetch":
+        return None
+    if stage in ("indicators", "aggregate"):
+        return fingerprint(symbols, context["watermarks"])
+    if stage == "prepare":
+        return fingerprint(symbols, context["watermarks"], context["per_symbol_scaler"], context["interval"],
+                           file_hash(os.path.join(BASE_DIR, "data_preparation.py")))
+    if stage == "train":
+        return fingerprint(state.get("prepare", {}).get("fingerprint"),
+                           file_hash(interval_path(os.path.join(BASE_DIR, "feature_scaler.json"), context["interval"])),
+                           file_hash(os.path.join(BASE_DIR, "test_ppo.py")))
+
+
+def run_pipeline(stages=STAGES, force=False, skip_fetch=False, workers=None, per_symbol_scaler=False,
+                 num_envs=1, vec_backend="dummy", offline=False, interval=BASE_INTERVAL):
+    state = load_pipeline_state()
+    symbols = load_symbols()
+    context = {
+        "force": force,
+        "workers": workers,
+        "per_symbol_scaler": per_symbol_scaler,
+        "num_envs": num_envs,
+        "vec_backend": vec_backend,
+        "offline": offline,
+        "interval": normalize_interval(interval),
+        "watermarks": symbol_watermarks(symbols, None if force else state.get("watermarks")),
+    }
+
+    for stage in STAGES:
+        if stage not in stages or (stage == "fetch" and skip_fetch):
+            continue
+        context["previous"] = state.get(stage, {})
+        key = stage_inputs(stage, symbols, context, state)
+        if key is not None and not force and context["previous"].get("fingerprint") == key:
+            print(f"[{stage}] Inputs unchanged since {time.ctime(context['previous']['completed_at'])}, skipping.")
+            continue
+
+        print(f"[{stage}] Running...")
+        start = time.perf_counter()
+        # The stages share this process's metrics file, so each one is timed under its own name
+        with profile(stage), timer(f"stage.{stage}"):
+            outputs = STAGE_FUNCTIONS[stage](symbols, context)
+        elapsed = time.perf_counter() - start
+        print(f"[{stage}] Done in {elapsed:.1f}s.")
+        if stage == "fetch" and outputs["inserted"]:
+            context["watermarks"] = symbol_watermarks(symbols, context["watermarks"])
+
+        # Recompute after the stage ran: indicators and prepare are keyed on the data they just processed
+        key = stage_inputs(stage, symbols, context, state)
+        state[stage] = dict(outputs, fingerprint=key, completed_at=time.time(), seconds=elapsed)
+        state["watermarks"] = context["watermarks"]
+        save_pipeline_state(state)
+    return state
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run (in pipeline order)")
+    parser.add_argument("--skip-fetch", action="store_true", help="Work from the data already in the database")
+    parser.add_argument("--offline", action="store_true", help="Fetch from the response cache instead of the API")
+    parser.add_argument("--force", action="store_true", help="Run every selected stage even if its inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to load symbol batches")
+    parser.add_argument("--per-symbol-scaler", action="store_true")
+    parser.add_argument("--num-envs", type=int, default=1)
+    parser.add_argument("--vec-backend", choices=["dummy", "subproc"], default="dummy")
+    parser.add_argument("--interval", default=BASE_INTERVAL, help="Bar interval to prepare and train on")
+    args = parser.parse_args()
+
+    # Relative paths in the stages (database, prepared data, logs) resolve against the application directory
+    os.chdir(BASE_DIR)
+    run_pipeline(args.stages, force=args.force, skip_fetch=args.skip_fetch, workers=args.workers,
+                 per_symbol_scaler=args.per_symbol_scaler, num_envs=args.num_envs, vec_backend=args.vec_backend,
+                 offline=args.offline, interval=args.interval)
@@ -0,0 +1,83 @@
+# python benchmarks/bench_aggregation.py --symbols 20 --days 60
+
+import os
+import sys
+import contextlib
+import io
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+import data_fetch
+from bar_aggregation import DERIVED_INTERVALS, bar_table, interval_minutes, update_aggregates
+from indicators import update_indicators
+
+
+# Regular-session 1-minute bars with ~5% of the minutes missing, inserted the way the fetcher stores them
+def build_database(path, n_symbols, n_days, seed=0):
+    data_fetch.DATABASE_PATH = path
+    data_fetch.ensure_table_exists()
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range("2024-01-02", periods=n_days)
+    minutes = pd.timedelta_range("09:30:00", "15:59:00", freq="min")
+    stamps = (days.values[:, None] + minutes.values[None, :]).reshape(-1)
+    conn = sqlite3.connect(path)
+    for i in range(n_symbols):
+        keep = rng.random(len(stamps)) > 0.05
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, keep.sum())))
+        volume = rng.integers(100, 10000, keep.sum())
+        labels = pd.DatetimeIndex(stamps[keep]).strftime("%Y-%m-%d %H:%M:%S")
+        with conn:
+            conn.executemany(
+                "INSERT INTO intraday_data (symbol, datetime, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                zip([f"SYM{i:03d}"] * len(labels), labels, (close * 1.0002).tolist(), (close * 1.001).tolist(),
+                    (close * 0.999).tolist(), close.tolist(), volume.tolist()),
+            )
+    conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "bars.db")
+    build_database(path, args.symbols, args.days)
+    with contextlib.redirect_stdout(io.StringIO()):
+        update_indicators(database_path=path)
+    conn = sqlite3.connect(path)
+    base_rows = conn.execute("SELECT COUNT(*) FROM intraday_data").fetchone()[0]
+    print(f"{base_rows} 1-minute bars, {args.symbols} symbols")
+
+    print(f"{'interval':>9} {'bars':>9} {'shrink':>7} {'aggregate s':>12} {'1m rows/s':>11} {'indicators s':>13}")
+    for interval in DERIVED_INTERVALS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            written = update_aggregates(intervals=[interval], database_path=path)[interval]
+            aggregate_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            update_indicators(database_path=path, interval=interval)
+            indicator_seconds = time.perf_counter() - start
+        print(f"{interval:>9} {written:>9} {base_rows / written:>6.1f}x {aggregate_seconds:>12.2f} "
+              f"{base_rows / aggregate_seconds:>11,.0f} {indicator_seconds:>13.2f}")
+
+    # Session VWAP of a derived bar must equal the 1-minute session VWAP at the bar's last minute
+    base = pd.read_sql("SELECT symbol, datetime, vwap FROM intraday_data", conn, parse_dates=["datetime"])
+    for interval in DERIVED_INTERVALS:
+        derived = pd.read_sql(f"SELECT symbol, datetime, vwap FROM {bar_table(interval)}", conn, parse_dates=["datetime"])
+        last_minute = (base.assign(datetime=base["datetime"].dt.floor(f"{interval_minutes(interval)}min"))
+                       .groupby(["symbol", "datetime"], as_index=False)["vwap"].last())
+        merged = derived.merge(last_minute, on=["symbol", "datetime"], suffixes=("", "_1min"))
+        assert len(merged) == len(derived) and np.allclose(merged["vwap"], merged["vwap_1min"]), interval
+    print("Derived session VWAP matches the 1-minute VWAP at every bar close.")
+    conn.close()
+    shutil.rmtree(workdir)
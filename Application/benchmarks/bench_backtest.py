@@ -0,0 +1,55 @@
+# python benchmarks/bench_backtest.py --years 2
+
+import os
+import sys
+import contextlib
+import io
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+from backtest import run_backtest, backtest_environment, PERIODS_PER_YEAR
+from trading_env import TradingEnvironment
+from synthetic import make_prepared_data
+
+
+# Step the gym environment with a fixed action matrix, returning the elapsed time
+def time_environment(env, actions):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.reset()
+        for action in actions:
+            env.step(action)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=float, default=1.0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    # Same actions through the environment and the engine
+    data, stocks = make_prepared_data(100, 5000)
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = TradingEnvironment(data, stocks)
+    actions = rng.integers(0, 3, size=(env.lengths[0] - 1, len(stocks)))
+    env_seconds = time_environment(env, actions)
+    run_backtest(actions[:10], env.close_prices[:10])  # compile outside the timing
+    start = time.perf_counter()
+    result = backtest_environment(env, actions)
+    engine_seconds = time.perf_counter() - start
+    assert np.isclose(result["portfolio_value"][-1], env.total_value)
+    print(f"100 symbols x {len(actions)} bars: env.step() {env_seconds:.2f}s, engine {engine_seconds:.3f}s")
+
+    # Multi-year, many-symbol backtest straight from matrices
+    n_bars = int(args.years * PERIODS_PER_YEAR)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, size=(n_bars, args.symbols)), axis=0))
+    actions = rng.choice(3, size=(n_bars, args.symbols), p=[0.9, 0.05, 0.05]).astype(np.int8)
+    start = time.perf_counter()
+    result = run_backtest(actions, prices)
+    print(f"{args.symbols} symbols x {n_bars} bars: engine {time.perf_counter() - start:.2f}s, metrics {result['metrics']}")
@@ -0,0 +1,46 @@
+# python benchmarks/bench_fetch.py
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+import data_fetch
+from response_cache import ResponseCache
+from stub_alpha_vantage import start_stub_server
+
+# Responses are cached in a scratch directory, never in data/fetch_cache
+CACHE = ResponseCache(tempfile.mkdtemp())
+
+
+# Fetch every symbol from the stub server and return symbols/sec
+def measure(symbols, workers, calls_per_minute):
+    start = time.perf_counter()
+    fetched = sum(1 for _, data, _, _ in data_fetch.fetch_all(symbols, workers=workers, calls_per_minute=calls_per_minute,
+                                                                     cache=CACHE) if data)
+    elapsed = time.perf_counter() - start
+    assert fetched == len(symbols), f"only {fetched}/{len(symbols)} symbols fetched"
+    return len(symbols) / elapsed
+
+
+if __name__ == "__main__":
+    server, url = start_stub_server(bars=500, latency=0.25)
+    data_fetch.BASE_URL = url
+    symbols = [f"SYM{i:03d}" for i in range(60)]
+
+    print(f"{'workers':>8} {'calls/min':>10} {'symbols/s':>10}")
+    for workers, calls_per_minute in ((1, 6000), (8, 6000), (16, 6000), (16, 600)):
+        rate = measure(symbols, workers, calls_per_minute)
+        print(f"{workers:>8} {calls_per_minute:>10} {rate:>10.2f}")
+
+    # Throttled server: the fetcher must back off and still fetch everything
+    server.shutdown()
+    server, url = start_stub_server(bars=100, calls_per_minute=5, window=2.0)
+    data_fetch.BASE_URL = url
+    data_fetch.RETRY_BACKOFF_SECONDS = 1
+    start = time.perf_counter()
+    results = list(data_fetch.fetch_all(symbols[:25], workers=8, calls_per_minute=6000, cache=CACHE))
+    print(f"Throttled stub: {sum(1 for r in results if r[1])}/25 symbols in {time.perf_counter() - start:.1f}s")
+    server.shutdown()
@@ -0,0 +1,91 @@
+# python benchmarks/bench_fetch_cache.py --symbols 50 --bars 20000
+
+import os
+import sys
+import contextlib
+import io
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+# The stub server has no rate limit worth waiting for
+os.environ["ALPHA_VANTAGE_CALLS_PER_MINUTE"] = "60000"
+
+import data_fetch
+from response_cache import ResponseCache
+from stub_alpha_vantage import start_stub_server
+
+
+# One quiet update_intraday_data() pass; returns (seconds, bars inserted, API calls by outputsize)
+def run_update(server, symbols, cache, offline=False):
+    before = dict(server.calls) if server else {}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inserted = data_fetch.update_intraday_data(symbols, update_indicator_columns=False, offline=offline, cache=cache)
+    elapsed = time.perf_counter() - start
+    calls = {size: count - before.get(size, 0) for size, count in (server.calls.items() if server else ())}
+    return elapsed, inserted, {size: count for size, count in calls.items() if count}
+
+
+def bar_count(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM intraday_data").fetchone()[0]
+    conn.close()
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--bars", type=int, default=20000, help="Bars in a full response")
+    parser.add_argument("--new-bars", type=int, default=30, help="Bars published between the two online runs")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    cache = ResponseCache(os.path.join(workdir, "cache"))
+    symbols = [f"SYM{i:03d}" for i in range(args.symbols)]
+
+    # Stub series end at the current exchange time, so the latest stored bars count as recent
+    now = datetime.now(data_fetch.ZoneInfo(data_fetch.MARKET_TIMEZONE)).replace(tzinfo=None, second=0, microsecond=0)
+    server, url = start_stub_server(bars=args.bars, end=(now - timedelta(minutes=args.new_bars)).isoformat(" "))
+    data_fetch.BASE_URL = url
+
+    print(f"{'run':<28} {'seconds':>8} {'inserted':>9}  API calls")
+    data_fetch.DATABASE_PATH = os.path.join(workdir, "online.db")
+    elapsed, inserted, calls = run_update(server, symbols, cache)
+    print(f"{'cold (empty database)':<28} {elapsed:>8.2f} {inserted:>9}  {calls}")
+
+    # Before the cache, every run re-fetched and re-inserted the full series
+    server.end = now.isoformat(" ")
+    data_fetch.DATABASE_PATH = os.path.join(workdir, "always_full.db")
+    shutil.copy(os.path.join(workdir, "online.db"), data_fetch.DATABASE_PATH)
+    start = time.perf_counter()
+    conn = data_fetch.connect(data_fetch.DATABASE_PATH)
+    before = server.calls["full"]
+    full_inserted = sum(data_fetch.save_to_database(symbol, data, conn)[0]
+                        for symbol, data, _, _ in data_fetch.fetch_all(symbols, cache=cache))
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"{'warm, always full':<28} {elapsed:>8.2f} {full_inserted:>9}  {{'full': {server.calls['full'] - before}}}")
+
+    data_fetch.DATABASE_PATH = os.path.join(workdir, "online.db")
+    elapsed, inserted, calls = run_update(server, symbols, cache)
+    print(f"{'warm, compact + new bars':<28} {elapsed:>8.2f} {inserted:>9}  {calls}")
+    server.shutdown()
+
+    # No network at all: rebuild a database from the cache alone
+    data_fetch.DATABASE_PATH = os.path.join(workdir, "offline.db")
+    elapsed, inserted, calls = run_update(None, symbols, cache, offline=True)
+    print(f"{'offline replay (fresh db)':<28} {elapsed:>8.2f} {inserted:>9}  {calls or 'none'}")
+    online, offline = bar_count(os.path.join(workdir, "online.db")), bar_count(data_fetch.DATABASE_PATH)
+    assert online == offline, f"offline replay stored {offline} bars, online {online}"
+
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(cache.root) for name in names)
+    print(f"Cache: {size / 1e6:.1f} MB for {online} bars ({size / online:.1f} bytes/bar)")
+    shutil.rmtree(workdir)
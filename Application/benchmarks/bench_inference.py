@@ -0,0 +1,81 @@
+# python benchmarks/bench_inference.py --symbols 500 --clients 64
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+import contextlib
+import io
+from stable_baselines3 import PPO
+from inference_service import PolicyServer, export_torchscript
+from trading_env import TradingEnvironment
+from synthetic import make_prepared_data
+
+
+# Save an untrained PPO policy sized for `n_symbols`; inference cost does not depend on training
+def make_model(path, n_symbols):
+    data, stocks = make_prepared_data(n_symbols, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = TradingEnvironment(data, stocks)
+    PPO("MlpPolicy", env, device="cpu").save(path)
+    return env.observation_space.shape[0]
+
+
+# One predict() call at a time on the SB3 model, as test_model() does
+def measure_unbatched(model_path, observations):
+    model = PPO.load(model_path, device="cpu")
+    latencies = []
+    start = time.perf_counter()
+    for obs in observations:
+        t = time.perf_counter()
+        model.predict(obs, deterministic=True)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000, len(observations) / elapsed
+
+
+# Concurrent clients against the micro-batching server
+def measure_server(server, observations, clients):
+    chunks = np.array_split(observations, clients)
+    threads = [threading.Thread(target=lambda c=c: [server.predict(obs) for obs in c]) for c in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = server.stats()
+    server.close()
+    return stats["p50_ms"], stats["p99_ms"], stats["throughput_per_sec"], stats["mean_batch_size"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=64)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    model_path = os.path.join(workdir, "model.zip")
+    obs_size = make_model(model_path, args.symbols)
+    observations = np.random.default_rng(0).normal(size=(args.requests, obs_size)).astype(np.float32)
+
+    print(f"{'mode':>22} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9} {'batch':>6}")
+    p50, p99, rate = measure_unbatched(model_path, observations)
+    print(f"{'unbatched predict':>22} {p50:>8.2f} {p99:>8.2f} {rate:>9.0f} {1:>6}")
+
+    p50, p99, rate, batch = measure_server(PolicyServer(model_path), observations, args.clients)
+    print(f"{'batched (eager)':>22} {p50:>8.2f} {p99:>8.2f} {rate:>9.0f} {batch:>6.1f}")
+
+    torchscript_path = export_torchscript(model_path, os.path.join(workdir, "policy.pt"))
+    p50, p99, rate, batch = measure_server(PolicyServer(model_path, torchscript_path=torchscript_path), observations, args.clients)
+    print(f"{'batched (torchscript)':>22} {p50:>8.2f} {p99:>8.2f} {rate:>9.0f} {batch:>6.1f}")
+
+    shutil.rmtree(workdir)
@@ -0,0 +1,92 @@
+# python benchmarks/bench_ingest.py --rows 10000000
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+import data_fetch
+from stub_alpha_vantage import make_intraday_payload
+
+
+# Fill a database with `rows` synthetic bars spread over 500 symbols
+def build_base_database(path, rows):
+    data_fetch.DATABASE_PATH = path
+    data_fetch.ensure_table_exists()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA synchronous=OFF")
+    per_symbol = rows // 500
+    datetimes = pd.date_range("2020-01-02 09:30", periods=per_symbol, freq="min").strftime("%Y-%m-%d %H:%M:%S").tolist()
+    rng = np.random.default_rng(0)
+    for i in range(500):
+        prices = (100 + rng.normal(size=per_symbol)).tolist()
+        with conn:
+            conn.executemany(
+                "INSERT INTO intraday_data (symbol, datetime, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                zip([f"BASE{i:03d}"] * per_symbol, datetimes, prices, prices, prices, prices, [100] * per_symbol),
+            )
+    conn.close()
+
+
+# The original per-row ingest: one execute per bar, default journal settings
+def legacy_save(path, symbol, intraday_data):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    for datetime_str, values in intraday_data.items():
+        cursor.execute("""
+            INSERT OR IGNORE INTO intraday_data (symbol, datetime, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (symbol, datetime_str, float(values["1. open"]), float(values["2. high"]),
+              float(values["3. low"]), float(values["4. close"]), int(values["5. volume"])))
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Rows already in the database")
+    parser.add_argument("--symbols", type=int, default=50, help="Payloads to ingest")
+    parser.add_argument("--bars", type=int, default=20_000, help="Bars per payload")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    base = os.path.join(workdir, "base.db")
+    start = time.perf_counter()
+    build_base_database(base, args.rows)
+    print(f"Built {args.rows}-row base database in {time.perf_counter() - start:.0f}s")
+
+    payloads = {f"NEW{i:03d}": make_intraday_payload(f"NEW{i:03d}", bars=args.bars)["Time Series (1min)"]
+                for i in range(args.symbols)}
+    total = args.symbols * args.bars
+
+    legacy_db = os.path.join(workdir, "legacy.db")
+    shutil.copy(base, legacy_db)
+    start = time.perf_counter()
+    for symbol, payload in payloads.items():
+        legacy_save(legacy_db, symbol, payload)
+    print(f"Legacy per-row ingest: {total / (time.perf_counter() - start):,.0f} rows/s")
+
+    bulk_db = os.path.join(workdir, "bulk.db")
+    shutil.copy(base, bulk_db)
+    data_fetch.DATABASE_PATH = bulk_db
+    for label in ("new bars", "duplicate bars"):
+        conn = data_fetch.connect(bulk_db)
+        start = time.perf_counter()
+        inserted = ignored = 0
+        for symbol, payload in payloads.items():
+            counts = data_fetch.save_to_database(symbol, payload, conn)
+            inserted, ignored = inserted + counts[0], ignored + counts[1]
+        elapsed = time.perf_counter() - start
+        conn.close()
+        print(f"Bulk ingest ({label}): {total / elapsed:,.0f} rows/s ({inserted} inserted, {ignored} ignored)")
+
+    shutil.rmtree(workdir)
@@ -0,0 +1,84 @@
+# python benchmarks/bench_logging.py --symbols 100 --bars 20000
+
+import os
+import sys
+import time
+import contextlib
+import logging
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+from trading_env import TradingEnvironment
+from event_log import TradeRecorder
+from synthetic import make_prepared_data
+
+
+# The previous diagnostics: one print per stock without data on every step
+class PrintingTradingEnvironment(TradingEnvironment):
+    def _get_observation(self):
+        obs = super()._get_observation()
+        missing = np.flatnonzero(~self.started[self.current_step]) if self.current_step < self.n_steps else []
+        for i in missing:
+            print(f"Skipping stock {self.stocks[i]} due to insufficient data at step {self.current_step}")
+        return obs
+
+
+# Step the environment through the actions, recording every trade with `record(step, action, price, value)`
+def run(env, actions, record):
+    env.reset()
+    start = time.perf_counter()
+    for step, action in enumerate(actions):
+        env.step(action)
+        record(step, action, env.close_prices[step, 0], env.total_value)
+    return len(actions) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--bars", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Late listings, so the "no data" diagnostics fire on every step until each stock's first bar
+    data, stocks = make_prepared_data(args.symbols, args.bars)
+    first_bar = np.random.default_rng(2).integers(0, args.bars, size=len(stocks))
+    data = data[data.groupby("symbol", sort=False).cumcount().to_numpy() >= np.repeat(first_bar, args.bars)]
+    n_steps = TradingEnvironment(data, stocks).n_steps
+    actions = np.random.default_rng(1).integers(0, 3, size=(n_steps - 1, len(stocks)))
+    env_logger = logging.getLogger("trading_env")
+    tmp = tempfile.mkdtemp()
+
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Before: per-stock prints plus one formatted line written per step
+        env = PrintingTradingEnvironment(data, stocks)
+        with open(os.path.join(tmp, "trade_log.txt"), "w") as log:
+            results["print + line-by-line log"] = run(
+                env, actions, lambda step, action, price, value: log.write(f"{step},{action},{price},{value}\n")
+            )
+
+        # After: rate-limited DEBUG diagnostics (to /dev/null) and the batched recorder
+        for label, level in (("logging on (DEBUG, rate limited)", logging.DEBUG), ("logging off", logging.WARNING)):
+            env_logger.setLevel(level)
+            for handler in env_logger.handlers:
+                handler.stream = devnull
+            env = TradingEnvironment(data, stocks)
+            with TradeRecorder(os.path.join(tmp, "events"), stocks, os.path.join(tmp, "trade_log.txt")) as recorder:
+                results[label] = run(env, actions, recorder.record)
+
+    # Recording alone, without stepping the environment
+    with TradeRecorder(os.path.join(tmp, "events"), stocks, os.path.join(tmp, "trade_log.txt")) as recorder:
+        start = time.perf_counter()
+        for step, action in enumerate(actions):
+            recorder.record(step, action, 100.0, 10000.0)
+    record_rate = len(actions) / (time.perf_counter() - start)
+
+    print(f"{args.symbols} symbols x {len(actions)} steps")
+    baseline = results["print + line-by-line log"]
+    for label, rate in results.items():
+        print(f"{label:>34}: {rate:>10.0f} steps/s ({rate / baseline:.1f}x)")
+    print(f"{'TradeRecorder.record alone':>34}: {record_rate:>10.0f} events/s")
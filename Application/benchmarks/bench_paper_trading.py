@@ -0,0 +1,33 @@
+# python benchmarks/bench_paper_trading.py --bars 300
+
+import os
+import sys
+import contextlib
+import io
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from paper_trading import PaperTrader, run_paper_trading, untrained_policy
+from market_feed import StubFeed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=300)
+    args = parser.parse_args()
+
+    # Unpaced stub feed, so bars/s is the ceiling the daemon could keep up with
+    print(f"{'symbols':>8} {'bars/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for n_symbols in (100, 500, 1000):
+        symbols = [f"SYM{i:04d}" for i in range(n_symbols)]
+        policy, _ = untrained_policy(n_symbols)
+        trader = PaperTrader(policy, symbols)
+        feed = StubFeed(symbols, interval=0, bars=args.bars, missing=0.05)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = run_paper_trading(trader, feed, report_every=args.bars)
+        rate = args.bars / (time.perf_counter() - start)
+        print(f"{n_symbols:>8} {rate:>10.0f} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f}")
@@ -0,0 +1,81 @@
+# python benchmarks/bench_prepared_data.py --symbols 100 --bars 50000
+
+import os
+import sys
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+import pandas as pd
+from prepared_store import save_columnar, load_columnar
+from synthetic import make_prepared_data
+
+ENV_COLUMNS = ["datetime", "close", "ema_8", "ema_21", "rsi_14", "macd", "macd_signal", "vwap"]
+
+
+# Peak resident set of this process; VmHWM starts fresh at exec, unlike ru_maxrss which counts the forked parent
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Runs in a fresh interpreter: load the training subset the way test_ppo.load_data does
+def load_and_report(fmt, path, symbols):
+    start = time.perf_counter()
+    if fmt == "csv":
+        data = pd.read_csv(path, usecols=["symbol"] + ENV_COLUMNS)
+        data = data[data["symbol"].isin(symbols)]
+    else:
+        data = load_columnar(path, symbols=symbols, columns=ENV_COLUMNS)
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(json.dumps({"rows": len(data), "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def measure(fmt, path, symbols):
+    output = subprocess.run(
+        [sys.executable, __file__, "--load", fmt, "--path", path, "--subset", ",".join(symbols)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--bars", type=int, default=50_000)
+    parser.add_argument("--load", choices=["csv", "columnar"])
+    parser.add_argument("--path")
+    parser.add_argument("--subset")
+    args = parser.parse_args()
+
+    if args.load:
+        load_and_report(args.load, args.path, args.subset.split(","))
+        sys.exit()
+
+    workdir = tempfile.mkdtemp()
+    data, symbols = make_prepared_data(args.symbols, args.bars)
+    csv_path = os.path.join(workdir, "prepared_data.csv")
+    columnar_path = os.path.join(workdir, "prepared_data")
+    data.to_csv(csv_path, index=False)
+    save_columnar(data, columnar_path)
+    del data
+    print(f"{args.symbols} symbols x {args.bars} bars, CSV is {os.path.getsize(csv_path) / 2**20:.0f} MiB")
+
+    print(f"{'format':>9} {'subset':>7} {'rows':>10} {'seconds':>8} {'peak RSS MiB':>13}")
+    for subset in (symbols, symbols[: max(1, len(symbols) // 10)]):
+        for fmt, path in (("csv", csv_path), ("columnar", columnar_path)):
+            result = measure(fmt, path, subset)
+            print(f"{fmt:>9} {len(subset):>7} {result['rows']:>10} {result['seconds']:>8.2f} {result['peak_rss_mb']:>13.0f}")
+
+    shutil.rmtree(workdir)
@@ -0,0 +1,76 @@
+# python benchmarks/bench_trading_env.py
+
+import os
+import sys
+import time
+import contextlib
+import io
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+from trading_env import TradingEnvironment, FEATURE_COLUMNS
+from synthetic import make_prepared_data
+
+
+# The original implementation, which filters the DataFrame per stock on every step
+class LegacyTradingEnvironment(TradingEnvironment):
+    def reset(self):
+        obs = super().reset()
+        self.positions = {stock: 0 for stock in self.stocks}
+        return obs
+
+    def _get_observation(self):
+        obs = []
+        for stock in self.stocks:
+            stock_data = self.data[self.data["symbol"] == stock]
+            if self.current_step < len(stock_data):
+                obs.extend(stock_data.iloc[self.current_step][FEATURE_COLUMNS].values)
+            else:
+                obs.extend([0] * len(FEATURE_COLUMNS))
+        obs.append(self.balance)
+        return np.array(obs, dtype=np.float32)
+
+    def step(self, actions):
+        for i, stock in enumerate(self.stocks):
+            stock_data = self.data[self.data["symbol"] == stock]
+            if self.current_step < len(stock_data):
+                current_price = stock_data.iloc[self.current_step]["close"]
+                if actions[i] == 1:
+                    max_shares = self.balance // current_price
+                    self.positions[stock] += max_shares
+                    self.balance -= max_shares * current_price
+                elif actions[i] == 2:
+                    self.balance += self.positions[stock] * current_price
+                    self.positions[stock] = 0
+        self.total_value = self.balance + sum(
+            self.positions[stock] * self.data[self.data["symbol"] == stock].iloc[self.current_step]["close"]
+            for stock in self.stocks if self.current_step < len(self.data[self.data["symbol"] == stock])
+        )
+        self.current_step += 1
+        self.done = self.current_step >= len(self.data[self.data["symbol"] == self.stocks[0]]) - 1
+        reward = self.total_value - self.balance
+        return self._get_observation(), reward, self.done, {}
+
+
+# Measure steps/sec for an environment class over a fixed action sequence
+def measure(env_cls, data, stocks, n_steps):
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = env_cls(data, stocks=stocks)
+        env.reset()
+    actions = np.random.default_rng(1).integers(0, 3, size=(n_steps, len(stocks)))
+    start = time.perf_counter()
+    for action in actions:
+        env.step(action)
+    return n_steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    n_bars = 2000
+    print(f"{'symbols':>8} {'legacy steps/s':>16} {'array steps/s':>16} {'speedup':>9}")
+    for n_symbols in (10, 100, 500):
+        data, stocks = make_prepared_data(n_symbols, n_bars)
+        legacy_steps = max(2, 200 // n_symbols)
+        legacy = measure(LegacyTradingEnvironment, data, stocks, legacy_steps)
+        current = measure(TradingEnvironment, data, stocks, n_bars - 2)
+        print(f"{n_symbols:>8} {legacy:>16.3f} {current:>16.1f} {current / legacy:>8.0f}x")
@@ -0,0 +1,39 @@
+# TRAINING_COMMAND="python Application/benchmarks/fake_training.py --iterations 5" flask run
+
+import sys
+import time
+
+
+# Print the same progress output as test_ppo.py --train (SB3 logger table and ThroughputCallback
+# summary) without training anything, for exercising the /train job scheduler
+def fake_training(iterations, seconds_per_iteration, n_steps, fail):
+    print("Starting train_model function...")
+    for iteration in range(1, iterations + 1):
+        time.sleep(seconds_per_iteration)
+        rate = int(n_steps / seconds_per_iteration)
+        print(f"Rollout: {n_steps} steps in {seconds_per_iteration:.2f}s ({rate} steps/s across 1 envs)")
+        print("-----------------------------------------")
+        print("| time/                   |             |")
+        print(f"|    fps                  | {rate:<11} |")
+        print(f"|    iterations           | {iteration:<11} |")
+        print(f"|    time_elapsed         | {int(iteration * seconds_per_iteration):<11} |")
+        print(f"|    total_timesteps      | {iteration * n_steps:<11} |")
+        print("-----------------------------------------")
+        sys.stdout.flush()
+    if fail:
+        print("Error in train_model: simulated failure")
+        sys.exit(1)
+    print("Training completed. Model saved.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=1.0, help="Wall time per iteration")
+    parser.add_argument("--n-steps", type=int, default=4096)
+    parser.add_argument("--fail", action="store_true", help="Exit with an error after the last iteration")
+    args = parser.parse_args()
+
+    fake_training(args.iterations, args.seconds, args.n_steps, args.fail)
@@ -0,0 +1,108 @@
+# python benchmarks/stub_alpha_vantage.py --port 8765
+# Then point the fetcher at it: ALPHA_VANTAGE_BASE_URL=http://127.0.0.1:8765/query
+
+import json
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+THROTTLE_NOTE = ("Thank you for using Alpha Vantage! Our standard API call frequency is "
+                 "5 calls per minute and 500 calls per day.")
+
+
+# Build a TIME_SERIES_INTRADAY-shaped payload of random-walk bars for a symbol
+def make_intraday_payload(symbol, interval="1min", bars=1000, end="2024-06-28 16:00:00"):
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))  # Same bars in every process
+    minutes = int(interval.replace("min", "")) if interval.endswith("min") else 60
+    datetimes = pd.date_range(end=end, periods=bars, freq=f"{minutes}min").strftime("%Y-%m-%d %H:%M:%S")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, bars)))
+    series = {}
+    for dt, price in zip(reversed(datetimes), reversed(close)):
+        series[dt] = {
+            "1. open": f"{price * 1.0002:.4f}",
+            "2. high": f"{price * 1.001:.4f}",
+            "3. low": f"{price * 0.999:.4f}",
+            "4. close": f"{price:.4f}",
+            "5. volume": str(int(rng.integers(100, 10000))),
+        }
+    return {
+        "Meta Data": {"2. Symbol": symbol, "4. Interval": interval},
+        f"Time Series ({interval})": series,
+    }
+
+
+# Start a stub server in a background thread; returns (server, base_url).
+# With calls_per_minute set, requests beyond that many per `window` seconds get the throttle note.
+# Series end at server.end (settable while running); server.calls counts requests per outputsize.
+# Symbols in server.invalid_json get a truncated JSON body, as from a dropped connection.
+def start_stub_server(port=0, bars=1000, latency=0.0, calls_per_minute=None, window=60.0, end="2024-06-28 16:00:00"):
+    calls = deque()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            time.sleep(latency)
+
+            throttled = False
+            if calls_per_minute:
+                with lock:
+                    now = time.monotonic()
+                    while calls and now - calls[0] > window:
+                        calls.popleft()
+                    throttled = len(calls) >= calls_per_minute
+                    if not throttled:
+                        calls.append(now)
+
+            if throttled:
+                payload = {"Note": THROTTLE_NOTE}
+            elif query.get("function") != "TIME_SERIES_INTRADAY" or "symbol" not in query:
+                payload = {"Error Message": "Invalid API call."}
+            else:
+                outputsize = query.get("outputsize", "compact")
+                with lock:
+                    server.calls[outputsize] += 1
+                size = bars if outputsize == "full" else min(bars, 100)
+                payload = make_intraday_payload(query["symbol"], query.get("interval", "1min"), size, server.end)
+
+            body = json.dumps(payload).encode()
+            if query.get("symbol") in server.invalid_json:
+                body = body[:len(body) // 2]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.end = end
+    server.calls = Counter()
+    server.invalid_json = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/query"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--bars", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated response latency")
+    parser.add_argument("--calls-per-minute", type=int, default=None, help="Throttle after this many calls/minute")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.bars, args.latency, args.calls_per_minute)
+    print(f"Stub Alpha Vantage server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
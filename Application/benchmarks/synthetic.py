@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ["ema_8", "ema_21", "ema_50", "rsi_14", "macd", "macd_signal", "doji", "hammer", "engulfing", "vwap"]
+
+
+# Generate a prepared_data-shaped frame of random-walk 1-minute bars
+def make_prepared_data(n_symbols, n_bars, seed=0, start="2024-01-02 09:30"):
+    rng = np.random.default_rng(seed)
+    symbols = [f"SYM{i:04d}" for i in range(n_symbols)]
+    datetimes = pd.date_range(start, periods=n_bars, freq="min")
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, size=(n_symbols, n_bars)), axis=1))
+    frame = pd.DataFrame({
+        "symbol": np.repeat(symbols, n_bars),
+        "datetime": np.tile(datetimes, n_symbols),
+        "close": close.reshape(-1),
+    })
+    for col in FEATURE_COLUMNS:
+        frame[col] = rng.normal(size=len(frame))
+    return frame, symbols
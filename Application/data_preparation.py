@@ -2,24 +2,52 @@
 
 ## data_preparation.py
 
+import os
+import sys
 import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+
+# Add the scripts directory to the system path
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(BASE_DIR, "scripts"))
+
+from bar_aggregation import BASE_INTERVAL, bar_table, interval_path, normalize_interval
+from feature_scaler import FeatureScaler
+from prepared_store import PreparedDataWriter, load_columnar
+from instrumentation import profile, timer
+from ticker_registry import load_symbols
 
 # Database path
-DATABASE_PATH = "data/intraday_data.db"
+DATABASE_PATH = os.path.join(BASE_DIR, "data", "intraday_data.db")
+
+# Prepared data outputs, where test_ppo.py reads them whatever the working directory
+PREPARED_DATA_DIR = os.path.join(BASE_DIR, "prepared_data")
+PREPARED_DATA_CSV = os.path.join(BASE_DIR, "prepared_data.csv")
+SCALER_FILE = os.path.join(BASE_DIR, "feature_scaler.json")
+
+# Model features, and the share of each symbol's history used to fit the scalers
+FEATURE_COLUMNS = ["ema_8", "ema_21", "ema_50", "rsi_14", "macd", "macd_signal", "doji", "hammer", "engulfing", "vwap"]
+TRAIN_FRACTION = 0.8
+
+# Symbols loaded per query; keeps each worker's result (and the IN list) bounded
+SYMBOL_BATCH_SIZE = 25
 
-# Load data from the database
-def load_data(symbol):
+# Load data for one or more symbols from the bar table of `interval`. The ORDER BY matches the
+# UNIQUE(symbol, datetime) index, so SQLite walks the index instead of sorting.
+def load_data(symbols, interval=BASE_INTERVAL):
+    if isinstance(symbols, str):
+        symbols = [symbols]
     conn = sqlite3.connect(DATABASE_PATH)
     query = f"""
         SELECT symbol, datetime, close, ema_8, ema_21, ema_50, rsi_14, macd, macd_signal, doji, hammer, engulfing, vwap
-        FROM intraday_data
-        WHERE symbol = '{symbol}'
-        ORDER BY datetime ASC
+        FROM {bar_table(interval)}
+        WHERE symbol IN ({", ".join("?" * len(symbols))})
+        ORDER BY symbol, datetime ASC
     """
-    df = pd.read_sql_query(query, conn)
+    df = pd.read_sql_query(query, conn, params=symbols)
     conn.close()
 
     # Ensure no missing values
@@ -31,53 +59,171 @@ def load_data(symbol):
     return df
 
 
+# Label each bar by the sign of its close-to-close change within its symbol: Buy (1), Sell (-1), Hold (0)
+def make_labels(df):
+    returns = df.groupby("symbol", sort=False)["close"].pct_change().to_numpy()
+    return np.nan_to_num(np.sign(returns)).astype(np.int64)
+
+# Mask of each symbol's first TRAIN_FRACTION of rows (time-ordered), the only rows scalers are fitted on
+def training_mask(df):
+    groups = df.groupby("symbol", sort=False)
+    position = groups.cumcount().to_numpy()
+    size = groups["symbol"].transform("size").to_numpy()
+    return position < size * TRAIN_FRACTION
+
 # Prepare data for training
 def prepare_data(df):
-    required_columns = ["ema_8", "ema_21", "ema_50", "rsi_14", "macd", "macd_signal", "doji", "hammer", "engulfing", "vwap"]
-    missing_cols = [col for col in required_columns if col not in df.columns]
+    missing_cols = [col for col in FEATURE_COLUMNS if col not in df.columns]
     if missing_cols:
         raise ValueError(f"Missing required columns in data: {missing_cols}")
-
-    # Features and labels
-    X = df[required_columns]
-    y = df["close"].pct_change().apply(lambda x: 1 if x > 0 else -1 if x < 0 else 0)  # Buy (1), Sell (-1), Hold (0)
-
-    # Drop the first row (NaN from pct_change)
-    X = X.iloc[1:]
-    y = y.iloc[1:]
-
-    # Train-test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, shuffle=False)
-
-    # Normalize the features
-    scaler = StandardScaler()
-    X_train = scaler.fit_transform(X_train)
-    X_test = scaler.transform(X_test)
-
-    return X_train, X_test, y_train, y_test, scaler
-
-# Save prepared data to CSV
-def save_to_csv(df, filename="prepared_data.csv"):
+    if "symbol" not in df.columns:
+        df = df.assign(symbol="")
+
+    # Features and labels; drop each symbol's first row (no previous close to compare against)
+    labels = make_labels(df)
+    keep = df.groupby("symbol", sort=False).cumcount().to_numpy() > 0
+    df, y = df[keep], labels[keep]
+
+    # Chronological train-test split per symbol, normalized with scalers fitted on the training rows only
+    train = training_mask(df)
+    scaler = FeatureScaler(FEATURE_COLUMNS).partial_fit(df[train])
+    X_train = scaler.transform(df[train])
+    X_test = scaler.transform(df[~train])
+
+    return X_train, X_test, y[train], y[~train], scaler
+
+# Add labels to each loaded chunk and fold its training rows into the scaler as it streams past
+def prepare_chunks(chunks, scaler):
+    for df in chunks:
+        with timer("prepare.label_and_fit", count=len(df)):
+            df["label"] = make_labels(df)
+            scaler.partial_fit(df[training_mask(df)])
+        yield df
+
+# Load symbols in batches, fanning out over a process pool. Batches are yielded in order,
+# with at most two per worker in flight, so memory stays bounded however large the universe is.
+def iter_symbol_batches(symbols, workers=None, batch_size=SYMBOL_BATCH_SIZE, interval=BASE_INTERVAL):
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(batches) == 1:
+        for batch in batches:
+            print(f"Loading data for {', '.join(batch)}...")
+            yield load_data(batch, interval)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(load_data, batch, interval)))
+            if len(pending) >= 2 * workers:
+                done_batch, future = pending.popleft()
+                print(f"Loaded data for {', '.join(done_batch)}.")
+                yield future.result()
+        while pending:
+            done_batch, future = pending.popleft()
+            print(f"Loaded data for {', '.join(done_batch)}.")
+            yield future.result()
+
+# Save prepared data to CSV, streaming chunks as they arrive
+def save_to_csv(chunks, filename=PREPARED_DATA_CSV):
     print(f"Saving data to {filename}...")
-    df.to_csv(filename, index=False)
+    for i, df in enumerate(chunks):
+        with timer("prepare.write", count=len(df)):
+            df.to_csv(filename, mode="w" if i == 0 else "a", header=(i == 0), index=False)
     print(f"Data saved to {filename}.")
 
-if __name__ == "__main__":
-    tickers_csv_path = "tickers.csv"
-    tickers_df = pd.read_csv(tickers_csv_path)
-    stock_symbols = tickers_df["Symbol"].dropna().tolist()
+# Save prepared data as a columnar, per-symbol dataset, streaming chunks as they arrive
+def save_to_columnar(chunks, root=PREPARED_DATA_DIR):
+    print(f"Saving data to {root}/...")
+    with PreparedDataWriter(root) as writer:
+        for df in chunks:
+            with timer("prepare.write", count=len(df)):
+                writer.write(df)
+    print(f"Data saved to {root}/.")
+
+# Fold the training rows of symbols carried over from an existing columnar dataset into the scaler
+def fit_reused(root, symbols, scaler):
+    for symbol in symbols:
+        df = load_columnar(root, [symbol], FEATURE_COLUMNS)
+        scaler.partial_fit(df[training_mask(df)])
+
+# Rebuild the columnar dataset, loading only `changed` symbols from the database and
+# hard-linking every other symbol's arrays from the existing dataset at `root`
+def update_columnar(symbols, changed, scaler, workers=None, root=PREPARED_DATA_DIR, interval=BASE_INTERVAL):
+    changed_set = set(changed)
+    reused = [symbol for symbol in symbols if symbol not in changed_set]
+    print(f"Saving data to {root}/ ({len(changed)} symbols reloaded, {len(reused)} reused)...")
+    with PreparedDataWriter(root) as writer:
+        for symbol in reused:
+            writer.link_symbol(root, symbol)
+        fit_reused(root, reused, scaler)
+        if changed:
+            for df in prepare_chunks(iter_symbol_batches(changed, workers=workers, interval=interval), scaler):
+                with timer("prepare.write", count=len(df)):
+                    writer.write(df)
+    print(f"Data saved to {root}/.")
+
+# Build and cache the environment's timestamp-aligned tensor, so training starts from memory-mapped arrays
+def align_prepared(symbols, root=PREPARED_DATA_DIR):
+    from market_tensor import load_market_tensor
+    from trading_env import FEATURE_COLUMNS as ENV_FEATURE_COLUMNS
+    with timer("prepare.align"):
+        market = load_market_tensor(root, symbols, ENV_FEATURE_COLUMNS)
+    print(f"Aligned {len(symbols)} symbols on {len(market)} shared timestamps.")
+
+# Prepare the dataset and scaler for `symbols` from the bars of `interval` (1min datasets keep the plain
+# file names, others get an _<interval> suffix). With `changed`, only those symbols are reloaded
+# from the database and the rest are reused from the existing columnar dataset.
+def run_preparation(symbols, output_format="columnar", workers=None, per_symbol_scaler=False, changed=None,
+                    interval=BASE_INTERVAL):
+    root = interval_path(PREPARED_DATA_DIR, interval)
+    scaler_file = interval_path(SCALER_FILE, interval)
+    scaler = FeatureScaler(FEATURE_COLUMNS, per_symbol=per_symbol_scaler)
+    with profile("prepare"), timer("prepare.total"):
+        if output_format == "columnar" and changed is not None and os.path.exists(root):
+            update_columnar(symbols, changed, scaler, workers=workers, root=root, interval=interval)
+        else:
+            # Stream symbol batches straight to the output; the full dataset is never held in memory
+            chunks = prepare_chunks(iter_symbol_batches(symbols, workers=workers, interval=interval), scaler)
+            if output_format == "csv":
+                save_to_csv(chunks, interval_path(PREPARED_DATA_CSV, interval))
+            else:
+                save_to_columnar(chunks, root)
+        if output_format == "columnar":
+            align_prepared(symbols, root)
+
+    # Persist the fitted normalization for training and inference
+    scaler.save(scaler_file)
+    print(f"Feature scaler saved to {scaler_file}.")
+
+# Derive the bars of a coarser interval (and their indicators) from the stored 1-minute bars,
+# adding only what is new since the last run
+def update_interval_bars(symbols, interval):
+    from bar_aggregation import update_aggregates
+    from indicators import update_indicators
+    update_aggregates(symbols, [interval], database_path=DATABASE_PATH)
+    update_indicators(symbols, database_path=DATABASE_PATH, interval=interval)
 
-    all_data = []
-
-    for symbol in stock_symbols:
-        print(f"Loading data for {symbol}...")
-        df = load_data(symbol)
-        all_data.append(df)
-
-    # Combine data for all stocks into one DataFrame
-    combined_data = pd.concat(all_data, ignore_index=True)
-
-    # Save the combined dataset to CSV
-    save_to_csv(combined_data)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=["columnar", "csv"], default="columnar",
+                        help="Write a memory-mappable per-symbol dataset (default) or export a single CSV")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to load symbol batches (default: all cores)")
+    parser.add_argument("--per-symbol-scaler", action="store_true",
+                        help="Fit one feature scaler per symbol instead of a single global scaler")
+    parser.add_argument("--interval", default=BASE_INTERVAL,
+                        help="Bar interval to prepare: 1min, 5min, 15min or 60min (1h), derived from the 1-minute bars")
+    args = parser.parse_args()
+
+    stock_symbols = load_symbols()
+    interval = normalize_interval(args.interval)
+    if interval != BASE_INTERVAL:
+        update_interval_bars(stock_symbols, interval)
+
+    run_preparation(stock_symbols, args.format, workers=args.workers, per_symbol_scaler=args.per_symbol_scaler,
+                    interval=interval)
 
     print("Data preparation complete.")
@@ -0,0 +1,216 @@
+
+# python paper_trading.py --feed replay --interval 1 --start "2024-06-03"
+# python paper_trading.py --feed stub --stub-symbols 500 --untrained --interval 1 --bars 120
+
+import os
+import sys
+import time
+from collections import deque
+
+# Add the scripts directory to the system path
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(BASE_DIR, "scripts"))
+
+import numpy as np
+from database import DATABASE_PATH, connect
+from event_log import TradeRecorder
+from feature_scaler import FeatureScaler
+from indicators import OUTPUT_COLUMNS, IncrementalIndicators, ensure_state_table, load_state
+from instrumentation import configure, observe
+from market_feed import ReplayFeed, StubFeed
+from ticker_registry import load_symbols
+from trading_env import FEATURE_COLUMNS, execute_actions
+
+# Paths
+MODEL_FILE = os.path.join(BASE_DIR, "ppo_day_trade_bot.zip")
+SCALER_FILE = os.path.join(BASE_DIR, "feature_scaler.json")
+PAPER_TRADE_LOG_FILE = os.path.join(BASE_DIR, "paper_trade_log.txt")
+PAPER_TRADE_EVENTS_DIR = os.path.join(BASE_DIR, "paper_trade_events")
+
+# Bars between latency reports, and how many recent bars the percentiles cover
+REPORT_EVERY = 60
+LATENCY_WINDOW = 10000
+
+
+class PaperTrader:
+    """
+    Turns each bar batch into one decision for the whole portfolio: the symbols' indicators are
+    advanced by one bar, the observation is assembled in the same layout TradingEnvironment uses
+    (the last `lookback` bars of features, then the balance), the policy is called once for all
+    symbols, and the orders are filled with the environment's accounting at the bar's close.
+    """
+
+    def __init__(self, policy, symbols, scaler=None, initial_balance=10000, transaction_cost=0.0, lookback=1,
+                 states=None, recorder=None):
+        self.policy = policy
+        self.symbols = list(symbols)
+        self.transaction_cost = transaction_cost
+        self.recorder = recorder
+        n = len(self.symbols)
+
+        self.indicators = IncrementalIndicators(n, states)
+        self.feature_index = [OUTPUT_COLUMNS.index(col) for col in FEATURE_COLUMNS]
+        if scaler is not None:
+            mean, scale = scaler.stock_params(self.symbols, FEATURE_COLUMNS)
+            self.mean, self.scale = mean.astype(np.float32), scale.astype(np.float32)
+        else:
+            self.mean = self.scale = None
+
+        # Observation buffer: (lookback, symbols, features) window followed by the balance
+        self.observation = np.zeros(lookback * n * len(FEATURE_COLUMNS) + 1, dtype=np.float32)
+        self.window = self.observation[:-1].reshape(lookback, n, len(FEATURE_COLUMNS))
+
+        self.balance = initial_balance
+        self.positions = np.zeros(n, dtype=np.float64)
+        self.last_prices = np.zeros(n, dtype=np.float64)
+        self.total_value = initial_balance
+        self.step = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # Advance the indicators and the observation window by one bar
+    def observe_bar(self, bar):
+        values = self.indicators.update(bar.datetime, bar.mask, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        features = values[:, self.feature_index].astype(np.float32)
+        if self.mean is not None:
+            features = (features - self.mean) / self.scale
+        features[~self.indicators.started] = 0
+        self.window[:-1] = self.window[1:]
+        self.window[-1] = features
+
+    def on_bar(self, bar):
+        self.observe_bar(bar)
+        self.observation[-1] = self.balance
+        actions = np.asarray(self.policy(self.observation))
+        self.balance = execute_actions(actions, bar.close, bar.mask, self.positions, self.last_prices, self.balance,
+                                       self.transaction_cost)
+        self.total_value = self.balance + float(np.dot(self.positions, self.last_prices))
+
+        latency = time.perf_counter() - bar.received_at
+        self.latencies.append(latency)
+        observe("paper.bar_to_decision_ms", latency * 1000)
+        if self.recorder is not None:
+            self.recorder.record(self.step, actions, bar.close[0], self.total_value)
+        self.step += 1
+        return actions
+
+    # Bar-to-decision latency percentiles (ms) over the recent bars
+    def latency_stats(self):
+        if not self.latencies:
+            return {"bars": 0}
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "bars": self.step,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(latencies.max()),
+        }
+
+
+# Deterministic actions from the saved model, served through the micro-batching PolicyServer
+def load_policy(model_path=MODEL_FILE, torchscript_path=None):
+    from inference_service import PolicyServer
+    server = PolicyServer(model_path, torchscript_path=torchscript_path, max_wait_ms=0)
+    return server.predict, server.observation_shape
+
+
+# A freshly initialized MlpPolicy of the right shape, for exercising the loop without a trained model
+def untrained_policy(n_symbols, lookback=1):
+    import torch
+    from gym import spaces
+    from stable_baselines3.common.policies import ActorCriticPolicy
+    from inference_service import DeterministicActor
+
+    shape = (lookback * n_symbols * len(FEATURE_COLUMNS) + 1,)
+    observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=shape, dtype=np.float32)
+    policy = ActorCriticPolicy(observation_space, spaces.MultiDiscrete([3] * n_symbols), lambda _: 0.0)
+    actor = DeterministicActor(policy.eval())
+
+    def predict(observation):
+        with torch.no_grad():
+            return actor(torch.from_numpy(observation[None]))[0].numpy()
+    return predict, shape
+
+
+# Stored indicator state per symbol (None where there is none), to continue live from the database
+def load_indicator_states(symbols, database_path=DATABASE_PATH):
+    conn = connect(database_path)
+    ensure_state_table(conn)
+    states = [load_state(conn, symbol) for symbol in symbols]
+    conn.close()
+    return states
+
+
+def print_report(trader, feed, started_at):
+    stats = trader.latency_stats()
+    elapsed = time.perf_counter() - started_at
+    print(f"[{trader.step} bars, {trader.step / elapsed:.1f} bars/s] bar-to-decision p50 {stats['p50_ms']:.2f} ms, "
+          f"p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms; feed lag {feed.lag * 1000:.1f} ms; "
+          f"portfolio value {trader.total_value:.2f}")
+
+
+# Run the trader over the feed; the first `warmup` bars only prime the indicators
+def run_paper_trading(trader, feed, warmup=0, report_every=REPORT_EVERY):
+    started_at = time.perf_counter()
+    bars = 0
+    try:
+        for bar in feed:
+            bars += 1
+            if bars <= warmup:
+                trader.observe_bar(bar)
+                continue
+            trader.on_bar(bar)
+            if trader.step % report_every == 0:
+                print_report(trader, feed, started_at)
+    except KeyboardInterrupt:
+        print("Stopping paper trading.")
+    if trader.step % report_every:
+        print_report(trader, feed, started_at)
+    return trader.latency_stats()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--feed", choices=["replay", "stub"], default="replay",
+                        help="Replay intraday_data.db or generate random-walk bars")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between bars (0 = as fast as possible)")
+    parser.add_argument("--start", default=None, help="Replay bars from this datetime")
+    parser.add_argument("--end", default=None, help="Replay bars up to this datetime")
+    parser.add_argument("--bars", type=int, default=None, help="Stop the stub feed after this many bars")
+    parser.add_argument("--stub-symbols", type=int, default=None,
+                        help="Generate this many synthetic symbols instead of the registered tickers")
+    parser.add_argument("--warmup", type=int, default=0, help="Bars that only prime the indicators")
+    parser.add_argument("--seed-from-db", action="store_true",
+                        help="Continue the indicators from the state stored by indicators.py")
+    parser.add_argument("--untrained", action="store_true", help="Use a randomly initialized policy of the right shape")
+    parser.add_argument("--torchscript", default=None, help="Serve this TorchScript export of the policy")
+    parser.add_argument("--transaction-cost", type=float, default=0.0)
+    parser.add_argument("--report-every", type=int, default=REPORT_EVERY)
+    args = parser.parse_args()
+    configure(stage="paper_trading")
+
+    if args.stub_symbols:
+        symbols = [f"SYM{i:04d}" for i in range(args.stub_symbols)]
+    else:
+        symbols = load_symbols()
+    if args.feed == "replay":
+        feed = ReplayFeed(symbols, interval=args.interval, start=args.start, end=args.end)
+    else:
+        feed = StubFeed(symbols, interval=args.interval, bars=args.bars)
+
+    if args.untrained:
+        policy, shape = untrained_policy(len(symbols))
+    else:
+        policy, shape = load_policy(MODEL_FILE, args.torchscript)
+    per_bar = len(symbols) * len(FEATURE_COLUMNS)
+    if (shape[0] - 1) % per_bar:
+        raise SystemExit(f"The policy observes {shape[0]} values, which does not fit {len(symbols)} symbols.")
+
+    scaler = FeatureScaler.load(SCALER_FILE) if os.path.exists(SCALER_FILE) and not args.stub_symbols else None
+    states = load_indicator_states(symbols) if args.seed_from_db else None
+    with TradeRecorder(PAPER_TRADE_EVENTS_DIR, symbols, text_path=PAPER_TRADE_LOG_FILE) as recorder:
+        trader = PaperTrader(policy, symbols, scaler=scaler, transaction_cost=args.transaction_cost,
+                             lookback=(shape[0] - 1) // per_bar, states=states, recorder=recorder)
+        print(f"Paper trading {len(symbols)} symbols from the {args.feed} feed, one bar every {args.interval}s...")
+        run_paper_trading(trader, feed, warmup=args.warmup, report_every=args.report_every)
@@ -0,0 +1,130 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional: the same kernel runs as plain Python, just much slower
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Bars per year for annualizing the Sharpe ratio (1-minute bars, 390 per trading day)
+PERIODS_PER_YEAR = 252 * 390
+
+
+# Walk the action matrix with TradingEnvironment.step() accounting: within a bar, flagged positions
+# are sold first, then the cash is split evenly across the stocks being bought (whole shares only).
+# transaction_cost is charged on traded notional; rows without data for a stock (valid == False)
+# are not traded, and positions are valued at the stock's last valid close.
+@njit(cache=True)
+def _simulate(actions, prices, valid, initial_balance, transaction_cost, record_positions):
+    n_steps, n_stocks = actions.shape
+    positions = np.zeros(n_stocks)
+    last_prices = np.zeros(n_stocks)
+    position_history = np.zeros((n_steps if record_positions else 0, n_stocks))
+    cash = np.empty(n_steps)
+    values = np.empty(n_steps)
+    traded = np.empty(n_steps)
+    costs = np.empty(n_steps)
+    buy_trades = 0
+    sell_trades = 0
+    balance = initial_balance
+
+    for t in range(n_steps):
+        proceeds = 0.0
+        n_buy = 0
+        for i in range(n_stocks):
+            if not valid[t, i]:
+                continue
+            last_prices[i] = prices[t, i]
+            if actions[t, i] == 2 and positions[i] > 0:  # Sell
+                sell_trades += 1
+                proceeds += positions[i] * prices[t, i]
+                positions[i] = 0.0
+            elif actions[t, i] == 1:
+                n_buy += 1
+        balance += proceeds * (1 - transaction_cost)
+
+        spent = 0.0
+        bought = 0.0
+        if n_buy > 0:
+            budget = balance / n_buy
+            for i in range(n_stocks):
+                if valid[t, i] and actions[t, i] == 1:  # Buy
+                    unit_cost = prices[t, i] * (1 + transaction_cost)
+                    shares = np.floor(budget / unit_cost)
+                    if shares > 0:
+                        buy_trades += 1
+                    positions[i] += shares
+                    spent += shares * unit_cost
+                    bought += shares * prices[t, i]
+            balance -= spent
+
+        value = balance
+        for i in range(n_stocks):
+            value += positions[i] * last_prices[i]
+        cash[t] = balance
+        values[t] = value
+        traded[t] = proceeds + bought
+        costs[t] = transaction_cost * (proceeds + bought)
+        if record_positions:
+            position_history[t] = positions
+
+    return cash, values, traded, costs, positions, position_history, buy_trades, sell_trades
+
+
+# Sharpe ratio, max drawdown and turnover from a portfolio value series
+def compute_metrics(portfolio_value, traded_notional, initial_balance, periods_per_year=PERIODS_PER_YEAR):
+    values = np.concatenate(([initial_balance], portfolio_value))
+    returns = np.diff(values) / values[:-1]
+    std = returns.std()
+    sharpe = float(returns.mean() / std * np.sqrt(periods_per_year)) if std > 0 else 0.0
+    drawdown = values / np.maximum.accumulate(values) - 1
+    return {
+        "final_value": float(values[-1]),
+        "total_return": float(values[-1] / initial_balance - 1),
+        "sharpe": sharpe,
+        "max_drawdown": float(drawdown.min()),
+        "turnover": float(traded_notional.sum() / values.mean()),
+    }
+
+
+def run_backtest(actions, prices, valid=None, initial_balance=10000, transaction_cost=0.0,
+                 periods_per_year=PERIODS_PER_YEAR, record_positions=False):
+    """
+    Backtest a (timesteps, stocks) action matrix (0=Hold, 1=Buy, 2=Sell) against a matching close
+    price matrix. Returns per-step cash, portfolio value and costs, final positions, trade counts and metrics.
+    """
+    actions = np.ascontiguousarray(actions, dtype=np.int64)
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    valid = np.ones(actions.shape, dtype=bool) if valid is None else np.ascontiguousarray(valid, dtype=bool)
+    if not (actions.shape == prices.shape == valid.shape):
+        raise ValueError(f"Shape mismatch: actions {actions.shape}, prices {prices.shape}, valid {valid.shape}.")
+
+    cash, values, traded, costs, positions, history, buy_trades, sell_trades = _simulate(
+        actions, prices, valid, float(initial_balance), float(transaction_cost), record_positions
+    )
+    result = {
+        "cash": cash,
+        "portfolio_value": values,
+        "traded_notional": traded,
+        "transaction_costs": costs,
+        "final_positions": positions,
+        "buy_actions": int((actions == 1).sum()),
+        "sell_actions": int((actions == 2).sum()),
+        "buy_trades": int(buy_trades),
+        "sell_trades": int(sell_trades),
+        "metrics": compute_metrics(values, traded, initial_balance, periods_per_year),
+    }
+    if record_positions:
+        result["positions"] = history
+    return result
+
+
+# Backtest over exactly the bars the environment's current episode steps through
+def backtest_environment(env, actions, **kwargs):
+    bars = slice(env.episode_start, env.episode_start + len(actions))
+    return run_backtest(
+        actions, env.close_prices[bars], env.valid_mask[bars],
+        initial_balance=env.initial_balance, transaction_cost=env.transaction_cost, **kwargs
+    )
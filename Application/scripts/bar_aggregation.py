@@ -0,0 +1,203 @@
+import os
+import time
+import numpy as np
+from database import DATABASE_PATH, connect
+from instrumentation import timer
+
+# Bar intervals in minutes, named like Alpha Vantage's `interval` parameter. 1min bars are fetched into
+# intraday_data; every other interval is derived from them into its own table.
+INTERVALS = {"1min": 1, "5min": 5, "15min": 15, "60min": 60}
+BASE_INTERVAL = "1min"
+DERIVED_INTERVALS = ["5min", "15min", "60min"]
+INTERVAL_ALIASES = {"1m": "1min", "5m": "5min", "15m": "15min", "60m": "60min", "1h": "60min"}
+
+# Bars read per symbol per query while aggregating, so a long history is never loaded at once
+AGGREGATE_CHUNK_BARS = 500_000
+
+
+def normalize_interval(interval):
+    interval = INTERVAL_ALIASES.get(interval, interval)
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown bar interval {interval!r}; expected one of {', '.join(INTERVALS)}.")
+    return interval
+
+
+def interval_minutes(interval):
+    return INTERVALS[normalize_interval(interval)]
+
+
+# Table holding the bars of an interval: intraday_data for 1min, intraday_data_<interval> otherwise
+def bar_table(interval):
+    interval = normalize_interval(interval)
+    return "intraday_data" if interval == BASE_INTERVAL else f"intraday_data_{interval}"
+
+
+# Per-interval variant of an output path: unchanged for 1min, "prepared_data" -> "prepared_data_5min" and
+# "feature_scaler.json" -> "feature_scaler_5min.json" otherwise, so datasets of different intervals coexist
+def interval_path(path, interval):
+    interval = normalize_interval(interval)
+    if interval == BASE_INTERVAL:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{interval}{ext}"
+
+
+# Derived bars have the columns of intraday_data plus `pv` (sum of typical price x volume over the bar's
+# minutes, so VWAP stays exact at any interval) and `minutes` (1-minute bars the bar was built from)
+def ensure_bar_table(conn, interval):
+    table = bar_table(interval)
+    if table == bar_table(BASE_INTERVAL):
+        return table
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT,
+            datetime TEXT,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER,
+            pv REAL,
+            minutes INTEGER,
+            ema_8 REAL,
+            ema_21 REAL,
+            ema_50 REAL,
+            rsi_14 REAL,
+            macd REAL,
+            macd_signal REAL,
+            doji INTEGER,
+            hammer INTEGER,
+            engulfing INTEGER,
+            vwap REAL,
+            UNIQUE(symbol, datetime)
+        )
+    """)
+    conn.commit()
+    return table
+
+
+def aggregate_bars(datetimes, open_, high, low, close, volume, minutes):
+    """
+    Group time-ordered 1-minute bars of one symbol into `minutes`-long bars aligned to the clock
+    (a bar is labeled with its start, e.g. 09:30-09:34 -> 09:30 for 5min, 09:30-09:59 -> 09:00 for 60min).
+    Each group is one contiguous segment, reduced with ufunc.reduceat: first open, max high, min low,
+    last close, summed volume and typical price x volume. Returns (bar starts, columns, complete),
+    where `complete` is False for a final bar whose last minute has not been seen yet.
+    """
+    stamps = np.asarray(datetimes, dtype="datetime64[m]")
+    buckets = stamps.astype(np.int64) // minutes * minutes
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(buckets)])) - 1
+
+    pv = (high + low + close) / 3.0 * volume
+    columns = {
+        "open": open_[starts],
+        "high": np.maximum.reduceat(high, starts),
+        "low": np.minimum.reduceat(low, starts),
+        "close": close[ends],
+        "volume": np.add.reduceat(volume, starts),
+        "pv": np.add.reduceat(pv, starts),
+        "minutes": ends - starts + 1,
+    }
+    bar_starts = buckets[starts]
+    complete = bar_starts + minutes <= stamps[-1].astype(np.int64) + 1
+    return bar_starts.astype("datetime64[m]"), columns, complete
+
+
+# Aggregate the 1-minute bars of `symbol` that are newer than its last stored `interval` bar.
+# Only complete bars are written, so derived tables are append-only. Returns the number of new bars.
+def aggregate_symbol(conn, symbol, interval, full=False):
+    minutes = interval_minutes(interval)
+    table = bar_table(interval)
+    if full:
+        with conn:
+            conn.execute(f"DELETE FROM {table} WHERE symbol = ?", (symbol,))
+        last = None
+    else:
+        last = conn.execute(f"SELECT MAX(datetime) FROM {table} WHERE symbol = ?", (symbol,)).fetchone()[0]
+    since = "" if last is None else str(np.datetime64(last, "m") + minutes).replace("T", " ") + ":00"
+
+    written = 0
+    while True:
+        rows = conn.execute(
+            "SELECT datetime, open, high, low, close, volume FROM intraday_data "
+            "WHERE symbol = ? AND datetime >= ? ORDER BY datetime LIMIT ?",
+            (symbol, since, AGGREGATE_CHUNK_BARS),
+        ).fetchall()
+        if not rows:
+            break
+        datetimes, open_, high, low, close, volume = zip(*rows)
+        with timer("aggregate.compute", count=len(rows)):
+            bar_starts, columns, complete = aggregate_bars(
+                np.array(datetimes, dtype="datetime64[m]"),
+                np.array(open_, dtype=np.float64),
+                np.array(high, dtype=np.float64),
+                np.array(low, dtype=np.float64),
+                np.array(close, dtype=np.float64),
+                np.array(volume, dtype=np.float64),
+                minutes,
+            )
+        # A chunk cut off mid-bar leaves the last bar for the next chunk, which starts at that bar
+        last_chunk = len(rows) < AGGREGATE_CHUNK_BARS
+        keep = complete if last_chunk else np.arange(len(bar_starts)) < len(bar_starts) - 1
+        if not keep.any():
+            break
+        labels = np.datetime_as_string(bar_starts[keep], unit="s")
+        with timer("aggregate.write", count=int(keep.sum())), conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (symbol, datetime, open, high, low, close, volume, pv, minutes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(
+                    [symbol] * len(labels),
+                    np.char.replace(labels, "T", " ").tolist(),
+                    columns["open"][keep].tolist(),
+                    columns["high"][keep].tolist(),
+                    columns["low"][keep].tolist(),
+                    columns["close"][keep].tolist(),
+                    columns["volume"][keep].astype(np.int64).tolist(),
+                    columns["pv"][keep].tolist(),
+                    columns["minutes"][keep].tolist(),
+                ),
+            )
+        written += int(keep.sum())
+        if last_chunk:
+            break
+        since = str(bar_starts[keep][-1] + minutes).replace("T", " ") + ":00"
+    return written
+
+
+# Derive `intervals` bars for the given symbols (default: every symbol with 1-minute bars)
+def update_aggregates(symbols=None, intervals=DERIVED_INTERVALS, full=False, database_path=DATABASE_PATH):
+    conn = connect(database_path)
+    if symbols is None:
+        symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM intraday_data")]
+
+    written = {}
+    for interval in intervals:
+        interval = normalize_interval(interval)
+        if interval == BASE_INTERVAL:
+            continue
+        ensure_bar_table(conn, interval)
+        start = time.perf_counter()
+        written[interval] = sum(aggregate_symbol(conn, symbol, interval, full=full) for symbol in symbols)
+        print(f"Aggregated {written[interval]} new {interval} bars across {len(symbols)} symbols "
+              f"in {time.perf_counter() - start:.2f}s.")
+    conn.close()
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--intervals", nargs="+", default=DERIVED_INTERVALS, help="Intervals to derive (e.g. 5min 1h)")
+    parser.add_argument("--full", action="store_true", help="Rebuild the derived bars from scratch")
+    parser.add_argument("--skip-indicators", action="store_true", help="Only aggregate OHLCV, volume and pv")
+    args = parser.parse_args()
+
+    update_aggregates(intervals=args.intervals, full=args.full)
+    if not args.skip_indicators:
+        from indicators import update_indicators
+        for interval in args.intervals:
+            update_indicators(full=args.full, interval=interval)
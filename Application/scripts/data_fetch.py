@@ -1,26 +1,48 @@
 import os
-import sqlite3
-import pandas as pd
+import threading
+import numpy as np
 import requests
-from datetime import datetime
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from operator import itemgetter
+from time import sleep, monotonic
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from database import DATABASE_PATH, connect
+from indicators import update_indicators
+from instrumentation import observe, profile, timer
+from response_cache import ResponseCache
+from ticker_registry import load_symbols
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Alpha Vantage API configuration
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
-BASE_URL = "https://www.alphavantage.co/query"
+BASE_URL = os.getenv("ALPHA_VANTAGE_BASE_URL", "https://www.alphavantage.co/query")
 
-# File paths
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-TICKERS_CSV = os.path.join(BASE_DIR, '..', 'tickers.csv')
-DATABASE_PATH = os.path.join(BASE_DIR, '..', 'data', 'intraday_data.db')
+# API plan limits and fetch concurrency
+API_CALLS_PER_MINUTE = float(os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", "5"))
+API_BURST = int(os.getenv("ALPHA_VANTAGE_BURST", "1"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "5"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("FETCH_RETRY_BACKOFF_SECONDS", "15"))
+
+# Replay cached responses instead of calling the API (no network, no API key needed)
+FETCH_OFFLINE = os.getenv("FETCH_OFFLINE", "") not in ("", "0")
+
+# outputsize=compact returns the latest COMPACT_BARS bars. It is requested when fewer than that (less a
+# safety margin) can have been published since a symbol's latest stored bar, counting only weekday
+# extended-hours session time in the exchange's time zone.
+COMPACT_BARS = 100
+COMPACT_MARGIN_BARS = 10
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+SESSION_OPEN, SESSION_CLOSE = time(4, 0), time(20, 0)
 
 # Ensure the database has the appropriate table
 def ensure_table_exists():
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = connect(DATABASE_PATH)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS intraday_data (
@@ -48,77 +70,266 @@ def ensure_table_exists():
     conn.commit()
     conn.close()
 
+# Token-bucket rate limiter shared by all fetch threads
+class TokenBucket:
+    def __init__(self, calls_per_minute, burst=1):
+        self.rate = calls_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+# HTTP session with a connection pool sized for the fetch threads
+def create_session(pool_size=FETCH_WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Alpha Vantage signals throttling with a 200 response carrying a "Note"/"Information" message
+def is_throttled(response):
+    if response.status_code == 429:
+        return True
+    if response.status_code != 200:
+        return False
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    message = str(data.get("Note", "") or data.get("Information", "")).lower()
+    return "call frequency" in message or "rate limit" in message
+
+# Minutes of weekday session time between two naive exchange-time datetimes, counted up to `limit`
+def session_minutes_between(start, end, limit=None):
+    minutes = 0.0
+    day = start.date()
+    while day <= end.date() and (limit is None or minutes < limit):
+        if day.weekday() < 5:
+            lo = max(start, datetime.combine(day, SESSION_OPEN))
+            hi = min(end, datetime.combine(day, SESSION_CLOSE))
+            minutes += max(0.0, (hi - lo).total_seconds() / 60)
+        day += timedelta(days=1)
+    return minutes
+
+# "compact" when the bars published since `latest` (the symbol's last stored bar) fit in a compact response
+def choose_outputsize(latest, interval="1min", now=None):
+    if latest is None or not interval.endswith("min"):
+        return "full"
+    now = now or datetime.now(ZoneInfo(MARKET_TIMEZONE)).replace(tzinfo=None)
+    bar_minutes = int(interval[:-len("min")])
+    budget = (COMPACT_BARS - COMPACT_MARGIN_BARS) * bar_minutes
+    missed = session_minutes_between(datetime.strptime(latest, "%Y-%m-%d %H:%M:%S"), now, limit=budget)
+    return "compact" if missed < budget else "full"
+
 # Fetch intraday data for a specific symbol
-def fetch_intraday_data(symbol, interval="1min"):
+def fetch_intraday_data(symbol, interval="1min", session=None, rate_limiter=None, outputsize="full"):
     params = {
         "function": "TIME_SERIES_INTRADAY",
         "symbol": symbol,
         "interval": interval,
         "apikey": ALPHA_VANTAGE_API_KEY,
-        "outputsize": "full"
+        "outputsize": outputsize
     }
+    http = session or requests
+
+    # Retry with exponential backoff on throttling and connection errors
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            response = http.get(BASE_URL, params=params, timeout=60)
+            if not is_throttled(response):
+                break
+            reason = "rate limited"
+        except requests.RequestException as e:
+            reason = str(e)
+        if attempt == MAX_RETRIES:
+            print(f"Fetching {symbol} failed ({reason}).")
+            continue
+        delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+        print(f"Fetching {symbol} failed ({reason}), retrying in {delay:.0f}s...")
+        sleep(delay)
+    else:
+        print(f"Failed to fetch data for {symbol} after {MAX_RETRIES} retries.")
+        return None
 
-    response = requests.get(BASE_URL, params=params)
     if response.status_code != 200:
         print(f"Failed to fetch data for {symbol}: {response.status_code}")
         return None
 
-    data = response.json()
-    if "Time Series (1min)" not in data:
+    # A truncated or HTML error body must not take down the other symbols' fetches
+    try:
+        data = response.json()
+    except ValueError as e:
+        print(f"Invalid JSON response for {symbol}: {e}")
+        return None
+    key = f"Time Series ({interval})"
+    if key not in data:
         print(f"No intraday data found for {symbol}. Full response: {data}")
         return None
 
-    return data["Time Series (1min)"]
+    return data[key]
 
-# Save data to the database
-def save_to_database(symbol, intraday_data):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+# Fetch a symbol through the response cache. Online, a compact response is tried first when the stored
+# bars are recent enough, and a full one is fetched if the compact one does not reach back to `latest`;
+# every response is cached. Offline, the cached bars are replayed. Returns (time series, source).
+def fetch_symbol(symbol, interval="1min", session=None, rate_limiter=None, latest=None, cache=None, offline=False):
+    cache = cache or ResponseCache()
+    if offline:
+        return cache.load(symbol, interval), "cache"
 
-    for datetime_str, values in intraday_data.items():
-        try:
-            cursor.execute("""
+    outputsize = choose_outputsize(latest, interval)
+    data = fetch_intraday_data(symbol, interval, session, rate_limiter, outputsize)
+    if data and outputsize == "compact" and min(data) > latest:
+        print(f"{symbol}: compact response does not reach back to {latest}, fetching the full series...")
+        outputsize = "full"
+        data = fetch_intraday_data(symbol, interval, session, rate_limiter, outputsize)
+    if data:
+        cache.store(symbol, interval, data)
+    return data, outputsize
+
+# Only the bars after the latest stored one, so parsing and inserting skip what the database already has
+def new_bars(intraday_data, latest=None):
+    if latest is None:
+        return intraday_data
+    return {bar_time: bar for bar_time, bar in intraday_data.items() if bar_time > latest}
+
+# Latest stored bar per symbol, from the (symbol, datetime) index
+def latest_bars(conn, symbols):
+    rows = conn.execute("SELECT symbol, MAX(datetime) FROM intraday_data GROUP BY symbol").fetchall()
+    wanted = set(symbols)
+    return {symbol: latest for symbol, latest in rows if symbol in wanted}
+
+# Parse an Alpha Vantage time series into columnar arrays
+def parse_intraday_payload(intraday_data):
+    datetimes = list(intraday_data.keys())
+    values = list(intraday_data.values())
+    columns = {
+        key: np.fromiter(map(cast, map(itemgetter(field), values)), dtype=dtype, count=len(values))
+        for key, field, cast, dtype in (
+            ("open", "1. open", float, np.float64),
+            ("high", "2. high", float, np.float64),
+            ("low", "3. low", float, np.float64),
+            ("close", "4. close", float, np.float64),
+            ("volume", "5. volume", int, np.int64),
+        )
+    }
+    return datetimes, columns
+
+# Save data to the database in one transaction; returns (inserted, ignored) row counts
+def save_to_database(symbol, intraday_data, conn=None):
+    try:
+        datetimes, columns = parse_intraday_payload(intraday_data)
+    except (KeyError, ValueError) as e:
+        print(f"Error parsing data for {symbol}: {e}")
+        return 0, 0
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(DATABASE_PATH)
+    try:
+        changes_before = conn.total_changes
+        with timer("fetch.db_insert", count=len(datetimes)), conn:
+            conn.executemany("""
                 INSERT OR IGNORE INTO intraday_data (symbol, datetime, open, high, low, close, volume)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                symbol,
-                datetime_str,
-                float(values["1. open"]),
-                float(values["2. high"]),
-                float(values["3. low"]),
-                float(values["4. close"]),
-                int(values["5. volume"])
+            """, zip(
+                [symbol] * len(datetimes),
+                datetimes,
+                columns["open"].tolist(),
+                columns["high"].tolist(),
+                columns["low"].tolist(),
+                columns["close"].tolist(),
+                columns["volume"].tolist(),
             ))
-        except Exception as e:
-            print(f"Error saving data for {symbol} at {datetime_str}: {e}")
+        inserted = conn.total_changes - changes_before
+    finally:
+        if own_conn:
+            conn.close()
+    return inserted, len(datetimes) - inserted
 
-    conn.commit()
-    conn.close()
+# Fetch many symbols concurrently under the plan's rate limit, yielding (symbol, data, seconds, source) as
+# each completes. `latest` maps symbols to their last stored bar, to fetch compact responses where possible.
+def fetch_all(symbols, interval="1min", workers=FETCH_WORKERS, calls_per_minute=API_CALLS_PER_MINUTE, burst=API_BURST,
+              latest=None, cache=None, offline=FETCH_OFFLINE):
+    rate_limiter = TokenBucket(calls_per_minute, burst)
+    session = create_session(workers)
+    cache = cache or ResponseCache()
+    latest = latest or {}
 
-# Update intraday data for multiple symbols
-def update_intraday_data():
-    ensure_table_exists()
+    def fetch(symbol):
+        start = monotonic()
+        data, source = fetch_symbol(symbol, interval, session, rate_limiter, latest.get(symbol), cache, offline)
+        return symbol, data, monotonic() - start, source
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, symbol) for symbol in symbols]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        session.close()
 
-    if not os.path.exists(TICKERS_CSV):
-        print(f"ERROR: {TICKERS_CSV} does not exist.")
-        return
+# Update intraday data for multiple symbols (default: every symbol in the ticker registry).
+# Returns the number of new bars stored.
+def update_intraday_data(symbols=None, update_indicator_columns=True, offline=FETCH_OFFLINE, cache=None):
+    ensure_table_exists()
 
-    # Read symbols from tickers.csv
-    tickers_df = pd.read_csv(TICKERS_CSV)
-    symbols = tickers_df["Symbol"].dropna().tolist()
+    if symbols is None:
+        symbols = load_symbols()
 
     if not symbols:
-        print("No symbols found in tickers.csv.")
-        return
+        print("No symbols found in the ticker registry.")
+        return 0
 
-    for symbol in symbols:
-        print(f"Fetching intraday data for {symbol}...")
-        intraday_data = fetch_intraday_data(symbol)
+    if offline:
+        print(f"Replaying cached intraday data for {len(symbols)} symbols...")
+    else:
+        print(f"Fetching intraday data for {len(symbols)} symbols "
+              f"({FETCH_WORKERS} workers, {API_CALLS_PER_MINUTE:g} calls/min)...")
+    # Results are saved from this thread only, so SQLite sees a single writer
+    conn = connect(DATABASE_PATH)
+    latest = latest_bars(conn, symbols)
+    total_inserted = 0
+    for done, (symbol, intraday_data, seconds, source) in enumerate(
+            fetch_all(symbols, latest=latest, cache=cache, offline=offline), start=1):
+        observe("fetch.symbol_latency_seconds", seconds)
         if intraday_data:
-            save_to_database(symbol, intraday_data)
+            fresh = new_bars(intraday_data, latest.get(symbol))
+            inserted = save_to_database(symbol, fresh, conn)[0] if fresh else 0
+            total_inserted += inserted
+            print(f"[{done}/{len(symbols)}] {symbol}: {inserted} new bars, "
+                  f"{len(intraday_data) - inserted} already stored ({source}, {seconds:.1f}s)")
         else:
-            print(f"Skipping {symbol} due to API data issue.")
-        sleep(15)  # To avoid hitting API rate limits
+            print(f"[{done}/{len(symbols)}] Skipping {symbol} due to API data issue.")
+    conn.close()
+    print(f"Inserted {total_inserted} new bars.")
+
+    # Fill indicator columns for the newly stored bars
+    if update_indicator_columns:
+        update_indicators(symbols, database_path=DATABASE_PATH)
+    return total_inserted
 
 if __name__ == "__main__":
-    update_intraday_data()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true", default=FETCH_OFFLINE,
+                        help="Replay the response cache instead of calling the API")
+    args = parser.parse_args()
+
+    with profile("update_intraday_data"), timer("fetch.total"):
+        update_intraday_data(offline=args.offline)
@@ -0,0 +1,19 @@
+import os
+import sqlite3
+
+# File paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(BASE_DIR, '..', 'data', 'intraday_data.db')
+
+# SQLite tuning: WAL lets readers run during ingest, NORMAL sync is durable across app crashes in WAL mode
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "262144"))
+
+
+# Open a connection with the ingest-friendly settings used by every pipeline stage
+def connect(database_path=DATABASE_PATH):
+    conn = sqlite3.connect(database_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # negative value is in KiB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+
+# Diagnostics from the environment and test loop go through `logging`; they are off (WARNING) unless
+# TRADING_LOG_LEVEL is lowered, and each message key is emitted at most once per TRADING_LOG_INTERVAL seconds
+LOG_LEVEL = os.getenv("TRADING_LOG_LEVEL", "WARNING").upper()
+LOG_INTERVAL = float(os.getenv("TRADING_LOG_INTERVAL", "5"))
+
+# Trade events buffered in memory before each batch is appended to disk
+TRADE_BUFFER_ROWS = 4096
+
+
+def get_logger(name):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+
+class RateLimitedLogger:
+    """
+    Emits each message key at most once per `interval` seconds; the next emitted record says how
+    many were suppressed in between. Callers on hot paths check enabled_for() once and skip
+    building the message entirely when the level is off.
+    """
+
+    def __init__(self, logger, interval=LOG_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self.last_emitted = {}
+        self.suppressed = {}
+
+    def enabled_for(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, key, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self.last_emitted.get(key, -self.interval) < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return
+        self.last_emitted[key] = now
+        suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar suppressed)"
+        self.logger.log(level, msg, *args)
+
+    def debug(self, key, msg, *args):
+        self.log(logging.DEBUG, key, msg, *args)
+
+    def info(self, key, msg, *args):
+        self.log(logging.INFO, key, msg, *args)
+
+    def warning(self, key, msg, *args):
+        self.log(logging.WARNING, key, msg, *args)
+
+
+class TradeRecorder:
+    """
+    Records one event per step (step, per-stock actions, price, portfolio value) into preallocated
+    column buffers and appends them to `<path>/<column>.bin` a batch at a time. With `text_path`
+    each batch is also appended to a CSV in the trade_log.txt format the web backend reads; a new
+    recording replaces that file instead of truncating it.
+    """
+
+    COLUMNS = {"step": np.int64, "price": np.float64, "value": np.float64}
+
+    def __init__(self, path, stocks, text_path=None, buffer_rows=TRADE_BUFFER_ROWS):
+        self.path = path
+        self.n_stocks = len(stocks)
+        self.text_path = text_path
+        self.buffers = {name: np.empty(buffer_rows, dtype=dtype) for name, dtype in self.COLUMNS.items()}
+        self.buffers["action"] = np.empty((buffer_rows, self.n_stocks), dtype=np.int8)
+        self.rows = 0
+        self.total_rows = 0
+
+        # Start a fresh recording
+        os.makedirs(path, exist_ok=True)
+        for name in self.buffers:
+            open(os.path.join(path, f"{name}.bin"), "wb").close()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"stocks": list(stocks),
+                       "columns": {name: buf.dtype.str for name, buf in self.buffers.items()}}, f)
+        if text_path is not None:
+            # Replace rather than truncate, so readers that key on the inode see a new file, not an append
+            tmp_path = f"{text_path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                f.write("Step,Action,Price,Portfolio Value\n")
+            os.replace(tmp_path, text_path)
+
+    def record(self, step, action, price, value):
+        row = self.rows
+        self.buffers["step"][row] = step
+        self.buffers["action"][row] = action
+        self.buffers["price"][row] = price
+        self.buffers["value"][row] = value
+        self.rows += 1
+        if self.rows == len(self.buffers["step"]):
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        n = self.rows
+        for name, buf in self.buffers.items():
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                buf[:n].tofile(f)
+        if self.text_path is not None:
+            with open(self.text_path, "a") as f:
+                f.write(self._format_text(n))
+        self.total_rows += n
+        self.rows = 0
+
+    # CSV rows for the first n buffered events; actions render like numpy's "[0 1 2]"
+    def _format_text(self, n):
+        width = 2 * self.n_stocks + 1
+        chars = np.full((n, width), ord(" "), dtype=np.uint8)
+        chars[:, 0] = ord("[")
+        chars[:, 1:width:2] = self.buffers["action"][:n] + ord("0")
+        chars[:, -1] = ord("]")
+        actions = chars.tobytes().decode("ascii")
+        steps = self.buffers["step"][:n].tolist()
+        prices = self.buffers["price"][:n].tolist()
+        values = self.buffers["value"][:n].tolist()
+        return "".join(
+            f"{steps[i]},{actions[i * width:(i + 1) * width]},{prices[i]},{values[i]}\n" for i in range(n)
+        )
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Read a recording back as {column: array}, with actions shaped (steps, stocks)
+def load_trade_events(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    events = {name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=np.dtype(dtype))
+              for name, dtype in meta["columns"].items()}
+    events["action"] = events["action"].reshape(-1, len(meta["stocks"]))
+    events["stocks"] = meta["stocks"]
+    return events
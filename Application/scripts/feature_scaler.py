@@ -0,0 +1,87 @@
+import json
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+# Key used for the single scaler in global mode
+GLOBAL_KEY = "__global__"
+
+
+class FeatureScaler:
+    """
+    Standardizes feature columns with scalers fitted incrementally over chunks, either one
+    scaler for all symbols or one per symbol. Per-symbol mode also fits the global scaler, which
+    symbols without fitted rows (e.g. tickers added since preparation) fall back to. The fitted
+    state is saved as JSON so training and inference apply exactly the same normalization.
+    """
+
+    def __init__(self, columns, per_symbol=False):
+        self.columns = list(columns)
+        self.per_symbol = per_symbol
+        self.scalers = {}
+
+    def partial_fit(self, df):
+        if self.per_symbol:
+            for symbol, group in df.groupby("symbol", sort=False):
+                self.scalers.setdefault(symbol, StandardScaler()).partial_fit(group[self.columns].to_numpy(np.float64))
+        if len(df):
+            self.scalers.setdefault(GLOBAL_KEY, StandardScaler()).partial_fit(df[self.columns].to_numpy(np.float64))
+        return self
+
+    # Mean and scale for the given columns of one symbol
+    def params(self, symbol, columns=None):
+        key = symbol if self.per_symbol and symbol in self.scalers else GLOBAL_KEY
+        if key not in self.scalers:
+            raise ValueError(f"No fitted scaler for {symbol if self.per_symbol else 'global features'}; "
+                             "re-run data_preparation.py to refit the feature scaler.")
+        scaler = self.scalers[key]
+        index = [self.columns.index(col) for col in (columns or self.columns)]
+        return scaler.mean_[index], scaler.scale_[index]
+
+    # (symbols, columns) arrays of means and scales, ready to broadcast over a feature tensor
+    def stock_params(self, symbols, columns=None):
+        means, scales = zip(*(self.params(symbol, columns) for symbol in symbols))
+        return np.array(means), np.array(scales)
+
+    def transform(self, df, columns=None):
+        columns = columns or self.columns
+        out = df[columns].to_numpy(np.float64, copy=True)
+        if self.per_symbol:
+            for symbol, rows in df.groupby("symbol", sort=False).indices.items():
+                mean, scale = self.params(symbol, columns)
+                out[rows] = (out[rows] - mean) / scale
+        else:
+            mean, scale = self.params(None, columns)
+            out = (out - mean) / scale
+        return out
+
+    def save(self, path):
+        state = {
+            "columns": self.columns,
+            "per_symbol": self.per_symbol,
+            "scalers": {
+                key: {
+                    "mean": scaler.mean_.tolist(),
+                    "var": scaler.var_.tolist(),
+                    "scale": scaler.scale_.tolist(),
+                    "n_samples_seen": int(np.max(scaler.n_samples_seen_)),
+                }
+                for key, scaler in self.scalers.items()
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(state, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        feature_scaler = cls(state["columns"], per_symbol=state["per_symbol"])
+        for key, params in state["scalers"].items():
+            scaler = StandardScaler()
+            scaler.mean_ = np.array(params["mean"])
+            scaler.var_ = np.array(params["var"])
+            scaler.scale_ = np.array(params["scale"])
+            scaler.n_samples_seen_ = params["n_samples_seen"]
+            scaler.n_features_in_ = len(state["columns"])
+            feature_scaler.scalers[key] = scaler
+        return feature_scaler
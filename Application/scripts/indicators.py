@@ -0,0 +1,360 @@
+import time
+import numpy as np
+from scipy.signal import lfilter
+from bar_aggregation import BASE_INTERVAL, bar_table, ensure_bar_table, normalize_interval
+from database import DATABASE_PATH, connect
+from instrumentation import timer
+
+# Indicator parameters
+EMA_SPANS = {"ema_8": 8, "ema_21": 21, "ema_50": 50, "ema_12": 12, "ema_26": 26}
+MACD_SIGNAL_SPAN = 9
+RSI_PERIOD = 14
+
+# Columns written back to the bar tables, in UPDATE order
+OUTPUT_COLUMNS = ["ema_8", "ema_21", "ema_50", "rsi_14", "macd", "macd_signal", "doji", "hammer", "engulfing", "vwap"]
+
+# Always set once a bar has been processed, so NULL marks bars still waiting for their indicators
+PENDING_COLUMN = "ema_8"
+
+# Per-symbol recursive state needed to resume the indicators from the last processed bar
+STATE_COLUMNS = [
+    "last_datetime", "last_open", "last_close",
+    "ema_8", "ema_21", "ema_50", "ema_12", "ema_26", "macd_signal",
+    "avg_gain", "avg_loss", "session", "session_pv", "session_volume",
+]
+
+
+# Indicator state of an interval's bars: indicator_state for 1min, indicator_state_<interval> otherwise
+def state_table(interval=BASE_INTERVAL):
+    interval = normalize_interval(interval)
+    return "indicator_state" if interval == BASE_INTERVAL else f"indicator_state_{interval}"
+
+
+# Ensure the indicator state table exists
+def ensure_state_table(conn, interval=BASE_INTERVAL):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {state_table(interval)} (
+            symbol TEXT PRIMARY KEY,
+            last_datetime TEXT,
+            last_open REAL,
+            last_close REAL,
+            ema_8 REAL,
+            ema_21 REAL,
+            ema_50 REAL,
+            ema_12 REAL,
+            ema_26 REAL,
+            macd_signal REAL,
+            avg_gain REAL,
+            avg_loss REAL,
+            session TEXT,
+            session_pv REAL,
+            session_volume REAL
+        )
+    """)
+
+
+# Partial index over the bars whose indicators are still NULL; it only ever holds unprocessed bars, so
+# finding backfills below a symbol's watermark never scans its processed history
+def ensure_pending_index(conn, interval=BASE_INTERVAL):
+    table = bar_table(interval)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_pending ON {table} (symbol, datetime) "
+                 f"WHERE {PENDING_COLUMN} IS NULL")
+
+
+# Earliest bar of a symbol at or before `last_datetime` that has no indicators yet (a backfill), or None
+def first_backfill(conn, symbol, last_datetime, interval=BASE_INTERVAL):
+    return conn.execute(
+        f"SELECT MIN(datetime) FROM {bar_table(interval)} "
+        f"WHERE symbol = ? AND {PENDING_COLUMN} IS NULL AND datetime <= ?",
+        (symbol, last_datetime),
+    ).fetchone()[0]
+
+
+# Load the stored state for a symbol, or None if it has never been processed
+def load_state(conn, symbol, interval=BASE_INTERVAL):
+    row = conn.execute(
+        f"SELECT {', '.join(STATE_COLUMNS)} FROM {state_table(interval)} WHERE symbol = ?", (symbol,)
+    ).fetchone()
+    return dict(zip(STATE_COLUMNS, row)) if row else None
+
+
+def save_state(conn, symbol, state, interval=BASE_INTERVAL):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {state_table(interval)} (symbol, {', '.join(STATE_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * (len(STATE_COLUMNS) + 1))})",
+        (symbol, *[state[col] for col in STATE_COLUMNS]),
+    )
+
+
+# Exponential moving average y[t] = alpha * x[t] + (1 - alpha) * y[t-1], resumed from prev
+def ewma(values, alpha, prev=None):
+    if prev is None:
+        prev = values[0]  # Seed a fresh series with its first value
+    out, _ = lfilter([alpha], [1.0, alpha - 1.0], values, zi=[(1.0 - alpha) * prev])
+    return out
+
+
+# Compute every indicator for a block of consecutive bars, continuing from state (None for a fresh symbol).
+# `pv` is each bar's typical price x volume; derived bars pass the sum over their 1-minute bars.
+def compute_indicators(datetimes, open_, high, low, close, volume, state=None, pv=None):
+    state = state or {}
+    results = {}
+
+    ema = {name: ewma(close, 2.0 / (span + 1), state.get(name)) for name, span in EMA_SPANS.items()}
+    results["ema_8"], results["ema_21"], results["ema_50"] = ema["ema_8"], ema["ema_21"], ema["ema_50"]
+
+    # MACD (12/26) and its 9-period signal line
+    macd = ema["ema_12"] - ema["ema_26"]
+    results["macd"] = macd
+    results["macd_signal"] = ewma(macd, 2.0 / (MACD_SIGNAL_SPAN + 1), state.get("macd_signal"))
+
+    # Wilder RSI: smoothed average gains and losses with alpha = 1 / period
+    prev_close = np.concatenate(([state.get("last_close", close[0])], close[:-1]))
+    delta = close - prev_close
+    avg_gain = ewma(np.maximum(delta, 0.0), 1.0 / RSI_PERIOD, state.get("avg_gain"))
+    avg_loss = ewma(np.maximum(-delta, 0.0), 1.0 / RSI_PERIOD, state.get("avg_loss"))
+    rs = np.divide(avg_gain, avg_loss, out=np.zeros_like(avg_gain), where=avg_loss > 0)
+    results["rsi_14"] = np.where(avg_loss > 0, 100.0 - 100.0 / (1.0 + rs), np.where(avg_gain > 0, 100.0, 50.0))
+
+    # Candlestick patterns
+    body = np.abs(close - open_)
+    candle_range = high - low
+    upper_shadow = high - np.maximum(open_, close)
+    lower_shadow = np.minimum(open_, close) - low
+    results["doji"] = (body <= 0.1 * candle_range).astype(np.int64)
+    results["hammer"] = ((candle_range > 0) & (lower_shadow >= 2 * body) & (upper_shadow <= body)).astype(np.int64)
+
+    # Engulfing: 1 for bullish, -1 for bearish, 0 otherwise
+    last_open = state.get("last_open")
+    prior_open = np.concatenate(([np.nan if last_open is None else last_open], open_[:-1]))
+    prior_close = np.concatenate(([np.nan if last_open is None else state["last_close"]], close[:-1]))
+    bullish = (prior_close < prior_open) & (close > open_) & (open_ <= prior_close) & (close >= prior_open)
+    bearish = (prior_close > prior_open) & (close < open_) & (open_ >= prior_close) & (close <= prior_open)
+    results["engulfing"] = bullish.astype(np.int64) - bearish.astype(np.int64)
+
+    # Session VWAP from typical price, reset at the start of each trading day
+    sessions = datetimes.astype("U10")
+    if pv is None:
+        pv = (high + low + close) / 3.0 * volume
+    boundary = sessions != np.concatenate(([state.get("session") or ""], sessions[:-1]))
+    segment = np.cumsum(boundary)
+    cum_pv = np.concatenate(([0.0], np.cumsum(pv)))
+    cum_volume = np.concatenate(([0.0], np.cumsum(volume)))
+    starts = np.flatnonzero(boundary)
+    session_pv = cum_pv[1:] - np.concatenate(([-(state.get("session_pv") or 0.0)], cum_pv[starts]))[segment]
+    session_volume = cum_volume[1:] - np.concatenate(([-(state.get("session_volume") or 0.0)], cum_volume[starts]))[segment]
+    typical = (high + low + close) / 3.0
+    results["vwap"] = np.divide(session_pv, session_volume, out=typical.copy(), where=session_volume > 0)
+
+    new_state = {
+        "last_datetime": str(datetimes[-1]),
+        "last_open": float(open_[-1]),
+        "last_close": float(close[-1]),
+        **{name: float(values[-1]) for name, values in ema.items()},
+        "macd_signal": float(results["macd_signal"][-1]),
+        "avg_gain": float(avg_gain[-1]),
+        "avg_loss": float(avg_loss[-1]),
+        "session": str(sessions[-1]),
+        "session_pv": float(session_pv[-1]),
+        "session_volume": float(session_volume[-1]),
+    }
+    return results, new_state
+
+
+class IncrementalIndicators:
+    """
+    The recursive state of compute_indicators() for many symbols at once, held as arrays. update()
+    advances every symbol that has a bar by exactly one bar in O(1) (no history is kept) and
+    produces the same values compute_indicators() would for that bar. Symbols without a bar keep
+    their previous values. Per-symbol state dicts (as in indicator_state) can seed and export it.
+    """
+
+    def __init__(self, n_symbols, states=None):
+        self.started = np.zeros(n_symbols, dtype=bool)
+        self.ema = {name: np.zeros(n_symbols) for name in EMA_SPANS}
+        self.macd_signal = np.zeros(n_symbols)
+        self.avg_gain = np.zeros(n_symbols)
+        self.avg_loss = np.zeros(n_symbols)
+        self.last_open = np.zeros(n_symbols)
+        self.last_close = np.zeros(n_symbols)
+        self.session = np.full(n_symbols, "", dtype="U10")
+        self.session_pv = np.zeros(n_symbols)
+        self.session_volume = np.zeros(n_symbols)
+        self.last_datetime = np.full(n_symbols, None, dtype=object)
+        self.values = np.zeros((n_symbols, len(OUTPUT_COLUMNS)))  # Latest output row per symbol
+        for i, state in enumerate(states or []):
+            if state:
+                self.load(i, state)
+
+    def load(self, i, state):
+        self.started[i] = True
+        for name in EMA_SPANS:
+            self.ema[name][i] = state[name]
+        self.macd_signal[i], self.avg_gain[i], self.avg_loss[i] = state["macd_signal"], state["avg_gain"], state["avg_loss"]
+        self.last_open[i], self.last_close[i] = state["last_open"], state["last_close"]
+        self.session[i], self.session_pv[i], self.session_volume[i] = state["session"], state["session_pv"], state["session_volume"]
+        self.last_datetime[i] = state["last_datetime"]
+
+    def state(self, i):
+        if not self.started[i]:
+            return None
+        return {
+            "last_datetime": self.last_datetime[i],
+            "last_open": float(self.last_open[i]),
+            "last_close": float(self.last_close[i]),
+            **{name: float(values[i]) for name, values in self.ema.items()},
+            "macd_signal": float(self.macd_signal[i]),
+            "avg_gain": float(self.avg_gain[i]),
+            "avg_loss": float(self.avg_loss[i]),
+            "session": str(self.session[i]),
+            "session_pv": float(self.session_pv[i]),
+            "session_volume": float(self.session_volume[i]),
+        }
+
+    # One bar at `datetime` for the symbols selected by `mask`; the price arrays cover every symbol
+    def update(self, datetime, mask, open_, high, low, close, volume):
+        idx = np.flatnonzero(mask)
+        if not len(idx):
+            return self.values
+        o, h, l, c, v = open_[idx], high[idx], low[idx], close[idx], volume[idx]
+        fresh = ~self.started[idx]
+
+        # A fresh symbol's recursions are seeded with its first value, as ewma() does
+        def step(prev, x, alpha):
+            return np.where(fresh, x, alpha * x + (1.0 - alpha) * prev[idx])
+
+        ema = {name: step(self.ema[name], c, 2.0 / (span + 1)) for name, span in EMA_SPANS.items()}
+        macd = ema["ema_12"] - ema["ema_26"]
+        macd_signal = step(self.macd_signal, macd, 2.0 / (MACD_SIGNAL_SPAN + 1))
+
+        delta = c - np.where(fresh, c, self.last_close[idx])
+        avg_gain = step(self.avg_gain, np.maximum(delta, 0.0), 1.0 / RSI_PERIOD)
+        avg_loss = step(self.avg_loss, np.maximum(-delta, 0.0), 1.0 / RSI_PERIOD)
+        rs = np.divide(avg_gain, avg_loss, out=np.zeros_like(avg_gain), where=avg_loss > 0)
+        rsi = np.where(avg_loss > 0, 100.0 - 100.0 / (1.0 + rs), np.where(avg_gain > 0, 100.0, 50.0))
+
+        body = np.abs(c - o)
+        candle_range = h - l
+        upper_shadow = h - np.maximum(o, c)
+        lower_shadow = np.minimum(o, c) - l
+        doji = body <= 0.1 * candle_range
+        hammer = (candle_range > 0) & (lower_shadow >= 2 * body) & (upper_shadow <= body)
+        prior_open = np.where(fresh, np.nan, self.last_open[idx])
+        prior_close = np.where(fresh, np.nan, self.last_close[idx])
+        bullish = (prior_close < prior_open) & (c > o) & (o <= prior_close) & (c >= prior_open)
+        bearish = (prior_close > prior_open) & (c < o) & (o >= prior_close) & (c <= prior_open)
+
+        session = str(datetime)[:10]
+        typical = (h + l + c) / 3.0
+        new_session = self.session[idx] != session
+        session_pv = np.where(new_session, 0.0, self.session_pv[idx]) + typical * v
+        session_volume = np.where(new_session, 0.0, self.session_volume[idx]) + v
+        vwap = np.divide(session_pv, session_volume, out=typical.copy(), where=session_volume > 0)
+
+        for name in EMA_SPANS:
+            self.ema[name][idx] = ema[name]
+        self.macd_signal[idx], self.avg_gain[idx], self.avg_loss[idx] = macd_signal, avg_gain, avg_loss
+        self.last_open[idx], self.last_close[idx] = o, c
+        self.session[idx], self.session_pv[idx], self.session_volume[idx] = session, session_pv, session_volume
+        self.started[idx] = True
+        self.last_datetime[idx] = str(datetime)
+        self.values[idx] = np.column_stack([
+            ema["ema_8"], ema["ema_21"], ema["ema_50"], rsi, macd, macd_signal,
+            doji, hammer, bullish.astype(np.int64) - bearish.astype(np.int64), vwap,
+        ])
+        return self.values
+
+
+# Compute indicators for the bars of one symbol added since its stored state and write them back
+def update_symbol(conn, symbol, full=False, interval=BASE_INTERVAL):
+    table = bar_table(interval)
+    derived = table != bar_table(BASE_INTERVAL)
+    state = None if full else load_state(conn, symbol, interval)
+    # Every indicator is recursive and only the latest state is stored, so bars backfilled behind the
+    # watermark invalidate everything after them: recompute the symbol from its first bar
+    backfill = first_backfill(conn, symbol, state["last_datetime"], interval) if state else None
+    if backfill is not None:
+        print(f"{symbol}: bars backfilled from {backfill} on, recomputing its {interval} indicators...")
+        state = None
+    rows = conn.execute(
+        f"""
+        SELECT id, datetime, open, high, low, close, volume{", pv" if derived else ""}
+        FROM {table}
+        WHERE symbol = ? AND datetime > ?
+        ORDER BY datetime ASC
+        """,
+        (symbol, state["last_datetime"] if state else ""),
+    ).fetchall()
+    if not rows:
+        return 0
+
+    ids, datetimes, open_, high, low, close, volume, *pv = zip(*rows)
+    with timer("indicators.compute", count=len(rows)):
+        results, new_state = compute_indicators(
+            np.array(datetimes),
+            np.array(open_, dtype=np.float64),
+            np.array(high, dtype=np.float64),
+            np.array(low, dtype=np.float64),
+            np.array(close, dtype=np.float64),
+            np.array(volume, dtype=np.float64),
+            state,
+            np.array(pv[0], dtype=np.float64) if derived else None,
+        )
+
+    # One transaction per symbol so the columns and the stored state never disagree
+    with timer("indicators.write", count=len(rows)), conn:
+        conn.executemany(
+            f"UPDATE {table} SET {', '.join(col + ' = ?' for col in OUTPUT_COLUMNS)} WHERE id = ?",
+            zip(*[results[col].tolist() for col in OUTPUT_COLUMNS], ids),
+        )
+        save_state(conn, symbol, new_state, interval)
+    return len(rows)
+
+
+# Symbols with bars newer than their stored indicator state, backfilled bars, or never processed
+def stale_symbols(conn, symbols=None, interval=BASE_INTERVAL):
+    ensure_state_table(conn, interval)
+    ensure_bar_table(conn, interval)
+    ensure_pending_index(conn, interval)
+    rows = conn.execute(f"""
+        SELECT d.symbol
+        FROM (SELECT symbol, MAX(datetime) AS last_bar FROM {bar_table(interval)} GROUP BY symbol) AS d
+        LEFT JOIN {state_table(interval)} AS s ON s.symbol = d.symbol
+        WHERE s.last_datetime IS NULL OR d.last_bar > s.last_datetime OR EXISTS (
+            SELECT 1 FROM {bar_table(interval)} AS b
+            WHERE b.symbol = d.symbol AND b.{PENDING_COLUMN} IS NULL AND b.datetime <= s.last_datetime
+        )
+    """).fetchall()
+    stale = {row[0] for row in rows}
+    return [symbol for symbol in (symbols if symbols is not None else sorted(stale)) if symbol in stale]
+
+
+# Update indicators for the given symbols (default: every symbol in the database) on one interval's bars
+def update_indicators(symbols=None, full=False, database_path=DATABASE_PATH, interval=BASE_INTERVAL):
+    conn = connect(database_path)
+    ensure_state_table(conn, interval)
+    table = ensure_bar_table(conn, interval)
+    ensure_pending_index(conn, interval)
+    if symbols is None:
+        symbols = [row[0] for row in conn.execute(f"SELECT DISTINCT symbol FROM {table}")]
+
+    start = time.perf_counter()
+    total_rows = 0
+    for symbol in symbols:
+        total_rows += update_symbol(conn, symbol, full=full, interval=interval)
+    conn.close()
+
+    print(f"Updated indicators for {total_rows} {normalize_interval(interval)} bars across {len(symbols)} symbols "
+          f"in {time.perf_counter() - start:.2f}s.")
+    return total_rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Recompute every symbol's full history")
+    parser.add_argument("--interval", default=BASE_INTERVAL, help="Bars to compute indicators for (e.g. 5min)")
+    args = parser.parse_args()
+
+    update_indicators(full=args.full, interval=args.interval)
@@ -0,0 +1,169 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import torch
+from stable_baselines3 import PPO
+
+# Micro-batching defaults: flush when the batch is full or the oldest request has waited this long
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "256"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "2"))
+
+# Number of recent requests kept for latency percentiles
+LATENCY_WINDOW = 10000
+
+
+# Deterministic actor path of an SB3 ActorCriticPolicy as a plain module, so it can be traced to TorchScript
+class DeterministicActor(torch.nn.Module):
+    def __init__(self, policy):
+        super(DeterministicActor, self).__init__()
+        self.policy = policy
+        nvec = getattr(policy.action_space, "nvec", None)
+        self.splits = [int(n) for n in nvec] if nvec is not None else [int(policy.action_space.n)]
+
+    def forward(self, obs):
+        features = self.policy.extract_features(obs)
+        if isinstance(features, tuple):
+            features = features[0]
+        logits = self.policy.action_net(self.policy.mlp_extractor.forward_actor(features))
+        return torch.stack([chunk.argmax(dim=1) for chunk in torch.split(logits, self.splits, dim=1)], dim=1)
+
+
+# Trace the policy's deterministic actor to a TorchScript file for CPU serving
+def export_torchscript(model_path, output_path):
+    model = PPO.load(model_path, device="cpu")
+    actor = DeterministicActor(model.policy).eval()
+    example = torch.zeros((1,) + model.observation_space.shape, dtype=torch.float32)
+    with torch.no_grad():
+        traced = torch.jit.trace(actor, example)
+    traced.save(output_path)
+    return output_path
+
+
+class PolicyServer:
+    """
+    Long-lived policy server. The model is loaded once; concurrent predict() calls are
+    queued and a single worker thread runs them through the policy in micro-batches.
+    """
+
+    def __init__(self, model_path, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 torchscript_path=None, deterministic=True):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.deterministic = deterministic
+
+        model = PPO.load(model_path, device="cpu")
+        model.policy.set_training_mode(False)
+        self.observation_shape = model.observation_space.shape
+        if torchscript_path:
+            self.actor = torch.jit.load(torchscript_path, map_location="cpu")
+        elif deterministic:
+            self.actor = DeterministicActor(model.policy).eval()
+        else:
+            self.actor = lambda obs: model.policy._predict(obs, deterministic=False)
+        self.action_shape = model.action_space.shape
+
+        self._requests = queue.Queue()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._completed = deque(maxlen=LATENCY_WINDOW)
+        self._batches = 0
+        self._batched_requests = 0
+        self._stats_lock = threading.Lock()
+        self._running = True
+        self._worker = threading.Thread(target=self._serve, daemon=True)
+        self._worker.start()
+
+    # Queue one observation; the returned Future resolves to its action array
+    def submit(self, observation):
+        observation = np.asarray(observation, dtype=np.float32)
+        if observation.shape != self.observation_shape:
+            raise ValueError(f"Observation shape {observation.shape} does not match {self.observation_shape}.")
+        future = Future()
+        self._requests.put((observation, future, time.perf_counter()))
+        return future
+
+    def predict(self, observation, timeout=None):
+        return self.submit(observation).result(timeout)
+
+    # Predict a batch the caller already has in hand (e.g. every symbol of one bar) in one pass
+    def predict_batch(self, observations, timeout=None):
+        futures = [self.submit(obs) for obs in observations]
+        return np.stack([future.result(timeout) for future in futures])
+
+    def _next_batch(self):
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _serve(self):
+        while self._running:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            observations = torch.from_numpy(np.stack([obs for obs, _, _ in batch]))
+            try:
+                with torch.no_grad():
+                    actions = self.actor(observations).cpu().numpy()
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, queued), action in zip(batch, actions):
+                future.set_result(action.reshape(self.action_shape))
+            with self._stats_lock:
+                self._latencies.extend(done - queued for _, _, queued in batch)
+                self._completed.extend([done] * len(batch))
+                self._batches += 1
+                self._batched_requests += len(batch)
+
+    # Latency percentiles (ms) and throughput over the most recent requests
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000
+            completed = np.array(self._completed)
+            batches, batched = self._batches, self._batched_requests
+        if len(latencies) == 0:
+            return {"requests": 0}
+        span = completed[-1] - completed[0]
+        return {
+            "requests": batched,
+            "batches": batches,
+            "mean_batch_size": batched / batches,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "throughput_per_sec": float(len(completed) / span) if span > 0 else None,
+        }
+
+    def close(self):
+        self._requests.put(None)
+        self._worker.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ppo_day_trade_bot.zip"))
+    parser.add_argument("--export-torchscript", metavar="PATH", required=True,
+                        help="Trace the deterministic policy to a TorchScript file for CPU serving")
+    args = parser.parse_args()
+
+    print(f"TorchScript policy saved to {export_torchscript(args.model, args.export_torchscript)}.")
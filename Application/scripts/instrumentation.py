@@ -0,0 +1,212 @@
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Metrics are collected only when PIPELINE_METRICS is set; each process writes <stage>.json to METRICS_DIR
+METRICS_ENABLED = os.getenv("PIPELINE_METRICS", "") not in ("", "0")
+METRICS_DIR = os.getenv("PIPELINE_METRICS_DIR", os.path.join(BASE_DIR, "..", "metrics"))
+
+# Optional profiling of profile() blocks: "cprofile" (deterministic, .prof) or "sample" (stack sampling, .folded)
+PROFILE_MODE = os.getenv("PIPELINE_PROFILE", "")
+SAMPLE_INTERVAL = float(os.getenv("PIPELINE_PROFILE_INTERVAL_MS", "5")) / 1000.0
+
+# Recent observations kept per metric for percentiles
+SAMPLE_WINDOW = 1000
+
+
+class Metric:
+    __slots__ = ("count", "total", "min", "max", "last", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.last = None
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.last = value
+        self.samples.append(value)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(int(len(samples) * 0.99), len(samples) - 1)],
+        }
+
+
+class Timer:
+    """Times a block into `<name>.seconds`; with `count`, also records `<name>.per_sec`."""
+
+    __slots__ = ("registry", "name", "count", "start", "elapsed")
+
+    def __init__(self, registry, name, count=None):
+        self.registry = registry
+        self.name = name
+        self.count = count
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.registry.observe(f"{self.name}.seconds", self.elapsed)
+        if self.count is not None and self.elapsed > 0:
+            self.registry.observe(f"{self.name}.per_sec", self.count / self.elapsed)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, stage, enabled=METRICS_ENABLED, metrics_dir=METRICS_DIR):
+        self.stage = stage
+        self.enabled = enabled
+        self.metrics_dir = metrics_dir
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric()
+            metric.add(float(value))
+
+    def snapshot(self):
+        with self.lock:
+            metrics = {name: metric.summary() for name, metric in sorted(self.metrics.items())}
+        return {"stage": self.stage, "pid": os.getpid(), "updated_at": time.time(), "metrics": metrics}
+
+    # Write the snapshot to <metrics_dir>/<stage>.json, atomically so readers never see a partial file
+    def dump(self):
+        if not self.enabled or not self.metrics:
+            return None
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, f"{self.stage}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+
+# Process-wide registry, named after the running script (data_fetch, data_preparation, test_ppo, app, ...)
+registry = MetricsRegistry(os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python")
+atexit.register(registry.dump)
+
+_null_timer = nullcontext()
+
+
+def configure(stage=None, enabled=None):
+    if stage is not None:
+        registry.stage = stage
+    if enabled is not None:
+        registry.enabled = enabled
+    return registry
+
+
+def timer(name, count=None):
+    """Context manager timing a block; a shared no-op when metrics are disabled."""
+    if not registry.enabled:
+        return _null_timer
+    return Timer(registry, name, count)
+
+
+def observe(name, value):
+    registry.observe(name, value)
+
+
+# Periodically snapshot one thread's stack and count collapsed stacks (flamegraph "folded" format)
+class StackSampler:
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            self.stacks[";".join(f"{os.path.basename(f.filename)}:{f.name}" for f in stack)] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile(name):
+    """Profile a block when PIPELINE_PROFILE is set, writing <stage>.<name>.prof or .folded to METRICS_DIR."""
+    if PROFILE_MODE not in ("cprofile", "sample"):
+        yield
+        return
+    os.makedirs(registry.metrics_dir, exist_ok=True)
+    path = os.path.join(registry.metrics_dir, f"{registry.stage}.{name}")
+    if PROFILE_MODE == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{path}.prof")
+            print(f"Profile written to {path}.prof")
+    else:
+        sampler = StackSampler(threading.get_ident()).start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.save(f"{path}.folded")
+            print(f"Stack samples written to {path}.folded")
+
+
+# Every stage's last metrics file, keyed by stage name
+def load_metrics(metrics_dir=METRICS_DIR):
+    stages = {}
+    if not os.path.isdir(metrics_dir):
+        return stages
+    for filename in sorted(os.listdir(metrics_dir)):
+        if filename.endswith(".json"):
+            try:
+                with open(os.path.join(metrics_dir, filename)) as f:
+                    stages[filename[:-len(".json")]] = json.load(f)
+            except (OSError, ValueError):
+                continue
+    return stages
@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import time
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+from database import DATABASE_PATH, connect
+
+# One timestamp's bars for every symbol of the feed, as (symbols,) arrays; `mask` marks the symbols that
+# have a bar. `received_at` is the perf_counter() time the bar was released to the consumer.
+BarBatch = namedtuple("BarBatch", ["datetime", "mask", "open", "high", "low", "close", "volume", "received_at"])
+
+
+# Release items no faster than one per `interval` seconds on a fixed schedule (0 = as fast as possible).
+# Returns how far behind schedule the release was, in seconds.
+class Pacer:
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_release = None
+
+    def wait(self):
+        now = time.perf_counter()
+        if self.interval <= 0:
+            return 0.0
+        if self.next_release is None:
+            self.next_release = now
+        delay = self.next_release - now
+        if delay > 0:
+            time.sleep(delay)
+        self.next_release += self.interval
+        return max(0.0, -delay)
+
+
+class ReplayFeed:
+    """
+    Replays intraday_data bar by bar across `symbols`. Each symbol is read in datetime order through
+    the (symbol, datetime) index and the per-symbol cursors are merged, so nothing is sorted or loaded
+    up front. One BarBatch is released per timestamp every `interval` seconds.
+    """
+
+    def __init__(self, symbols, interval=1.0, start=None, end=None, database_path=DATABASE_PATH):
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.start = start or ""
+        self.end = end or "9999"
+        self.database_path = database_path
+        self.lag = 0.0  # Seconds the last bar was released behind schedule
+
+    def _rows(self, conn, index, symbol):
+        return conn.execute(
+            "SELECT datetime, ?, open, high, low, close, volume FROM intraday_data "
+            "WHERE symbol = ? AND datetime >= ? AND datetime <= ? ORDER BY datetime",
+            (index, symbol, self.start, self.end),
+        )
+
+    def __iter__(self):
+        conn = connect(self.database_path)
+        n = len(self.symbols)
+        pacer = Pacer(self.interval)
+        try:
+            cursors = [self._rows(conn, i, symbol) for i, symbol in enumerate(self.symbols)]
+            merged = heapq.merge(*cursors, key=lambda row: row[0])
+            for bar_time, rows in itertools.groupby(merged, key=lambda row: row[0]):
+                rows = list(rows)
+                index = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+                values = np.array([row[2:] for row in rows], dtype=np.float64)
+                mask = np.zeros(n, dtype=bool)
+                mask[index] = True
+                columns = []
+                for col in range(5):
+                    column = np.zeros(n)
+                    column[index] = values[:, col]
+                    columns.append(column)
+                self.lag = pacer.wait()
+                yield BarBatch(bar_time, mask, *columns, time.perf_counter())
+        finally:
+            conn.close()
+
+
+class StubFeed:
+    """Random-walk bars for every symbol, stamped with the wall clock, one batch per `interval` seconds."""
+
+    def __init__(self, symbols, interval=1.0, bars=None, seed=0, missing=0.0):
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.bars = bars
+        self.missing = missing  # Chance a symbol has no bar at a given timestamp
+        self.rng = np.random.default_rng(seed)
+        self.lag = 0.0
+
+    def __iter__(self):
+        n = len(self.symbols)
+        close = np.full(n, 100.0)
+        pacer = Pacer(self.interval)
+        for _ in itertools.count() if self.bars is None else range(self.bars):
+            open_ = close
+            close = open_ * np.exp(self.rng.normal(0, 0.001, n))
+            high = np.maximum(open_, close) * (1 + self.rng.random(n) * 0.0005)
+            low = np.minimum(open_, close) * (1 - self.rng.random(n) * 0.0005)
+            volume = self.rng.integers(100, 10000, n).astype(np.float64)
+            mask = self.rng.random(n) >= self.missing
+            self.lag = pacer.wait()
+            bar_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            yield BarBatch(bar_time, mask, open_, high, low, close, volume, time.perf_counter())
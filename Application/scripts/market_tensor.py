@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from prepared_store import read_manifest
+
+# Aligned tensors built from a columnar dataset are cached under <root>/_aligned/<key>/, keyed by
+# the manifest, symbols and columns. A rebuilt dataset replaces <root> wholesale, dropping stale caches.
+ALIGNED_DIR = "_aligned"
+META_FILE = "meta.json"
+ARRAYS = ("datetimes", "features", "close", "valid")
+
+
+class MarketTensor:
+    """
+    Every symbol's bars on one shared, sorted datetime axis:
+
+        datetimes  (T,)         union of all symbols' bar times
+        features   (T, S, F)    float32, forward-filled from each symbol's last bar
+        close      (T, S)       float64, forward-filled the same way
+        valid      (T, S)       True where the symbol has a bar at exactly that time
+
+    Before a symbol's first bar its rows are zero. Only `valid` rows can be traded; forward-filled
+    rows keep the observation and valuation at the last known values instead of dropping to zero.
+    """
+
+    def __init__(self, stocks, columns, datetimes, features, close, valid):
+        self.stocks = list(stocks)
+        self.columns = list(columns)
+        self.datetimes = datetimes
+        self.features = features
+        self.close = close
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    # Bars with start <= datetime <= end, as views into this tensor
+    def slice(self, start=None, end=None):
+        lo = np.searchsorted(self.datetimes, np.datetime64(start), "left") if start is not None else 0
+        hi = np.searchsorted(self.datetimes, np.datetime64(end), "right") if end is not None else len(self)
+        return MarketTensor(self.stocks, self.columns, self.datetimes[lo:hi], self.features[lo:hi],
+                            self.close[lo:hi], self.valid[lo:hi])
+
+    # Write the arrays as .npy files plus a meta.json, into a temporary directory renamed into place
+    def save(self, path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump({"stocks": self.stocks, "columns": self.columns}, f)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process finished the same cache first; theirs is identical
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAYS]
+        return cls(meta["stocks"], meta["columns"], *arrays)
+
+
+# Scatter every bar (stock code, datetime, close, features) onto the sorted union of the datetimes and
+# forward-fill the gaps. Sorting the union and one binary search per bar make this O(N log N) overall.
+def align_bars(stocks, columns, codes, datetimes, close, features):
+    axis = np.unique(datetimes)
+    n_steps, n_stocks = len(axis), len(stocks)
+    rows = np.searchsorted(axis, datetimes)
+
+    aligned_features = np.zeros((n_steps, n_stocks, len(columns)), dtype=np.float32)
+    aligned_close = np.zeros((n_steps, n_stocks), dtype=np.float64)
+    valid = np.zeros((n_steps, n_stocks), dtype=bool)
+    aligned_features[rows, codes] = features
+    aligned_close[rows, codes] = close
+    valid[rows, codes] = True
+
+    # Row of each stock's most recent bar at or before every time on the axis (-1 before its first bar)
+    last = np.maximum.accumulate(np.where(valid, np.arange(n_steps)[:, None], -1), axis=0)
+    started = last >= 0
+    last = np.maximum(last, 0)
+    stock_index = np.arange(n_stocks)
+    aligned_features = np.where(started[..., None], aligned_features[last, stock_index], 0).astype(np.float32)
+    aligned_close = np.where(started, aligned_close[last, stock_index], 0.0)
+    return MarketTensor(stocks, columns, axis, aligned_features, aligned_close, valid)
+
+
+# Align a long-format prepared_data frame (symbol, datetime, close, features...)
+def align_frame(data, stocks, columns):
+    codes = data["symbol"].map({stock: i for i, stock in enumerate(stocks)})
+    data = data[codes.notna()]
+    return align_bars(
+        stocks, columns,
+        codes[codes.notna()].to_numpy(dtype=np.int64),
+        pd.to_datetime(data["datetime"]).to_numpy(dtype="datetime64[ns]"),
+        data["close"].to_numpy(dtype=np.float64),
+        data[columns].to_numpy(dtype=np.float32),
+    )
+
+
+# Align straight from the memory-mapped per-symbol arrays of a columnar dataset
+def build_market_tensor(root, stocks, columns):
+    manifest = read_manifest(root)
+    present = [(i, stock) for i, stock in enumerate(stocks) if manifest["symbols"].get(stock)]
+    load = lambda stock, col: np.load(os.path.join(root, stock, f"{col}.npy"), mmap_mode="r")
+    if not present:
+        return align_bars(stocks, columns, np.empty(0, dtype=np.int64), np.empty(0, dtype="datetime64[ns]"),
+                          np.empty(0), np.empty((0, len(columns)), dtype=np.float32))
+    return align_bars(
+        stocks, columns,
+        np.repeat([i for i, _ in present], [manifest["symbols"][stock] for _, stock in present]),
+        np.concatenate([load(stock, "datetime").astype("datetime64[ns]") for _, stock in present]),
+        np.concatenate([load(stock, "close") for _, stock in present]),
+        np.concatenate([np.stack([load(stock, col) for col in columns], axis=1) for _, stock in present]),
+    )
+
+
+def tensor_cache_path(root, stocks, columns):
+    key = json.dumps([read_manifest(root), list(stocks), list(columns)], sort_keys=True)
+    return os.path.join(root, ALIGNED_DIR, hashlib.sha256(key.encode()).hexdigest()[:16])
+
+
+# The aligned tensor of a columnar dataset, built on first use and memory-mapped from the cache after
+# that; with start/end only that date range is returned (as views, so nothing else is read)
+def load_market_tensor(root, stocks, columns, start=None, end=None):
+    path = tensor_cache_path(root, stocks, columns)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        print(f"Aligning {len(stocks)} symbols on a shared datetime axis...")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build_market_tensor(root, stocks, columns).save(path)
+    return MarketTensor.load(path).slice(start, end)
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Columnar prepared-data layout:
+#   <root>/manifest.json            columns, dtypes and per-symbol row counts
+#   <root>/<symbol>/<column>.npy    one array per column per symbol, memory-mappable
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+
+class PreparedDataWriter:
+    """
+    Writes prepared data partitioned by symbol. Frames can be written in any number of
+    calls (each symbol must arrive whole); the manifest is written last on close() and the
+    finished directory atomically replaces any previous dataset at `root`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_root = f"{root}.tmp"
+        self.columns = None
+        self.symbols = {}
+        if os.path.exists(self.tmp_root):
+            shutil.rmtree(self.tmp_root)
+        os.makedirs(self.tmp_root)
+
+    def write(self, df):
+        for symbol, group in df.groupby("symbol", sort=False):
+            if symbol in self.symbols:
+                raise ValueError(f"Symbol {symbol} was already written to {self.root}.")
+            group = group.drop(columns="symbol")
+            if self.columns is None:
+                self.columns = {col: str(group[col].dtype) for col in group.columns}
+                object_columns = [col for col, dtype in self.columns.items() if dtype == "object"]
+                if object_columns:
+                    raise ValueError(f"Columns {object_columns} must be numeric or datetime to be stored.")
+
+            symbol_dir = os.path.join(self.tmp_root, symbol)
+            os.makedirs(symbol_dir)
+            for col, dtype in self.columns.items():
+                values = group[col].to_numpy(dtype=dtype)
+                # View through a fresh dtype: arrays unpickled from worker processes can carry dtype metadata
+                np.save(os.path.join(symbol_dir, f"{col}.npy"), values.view(np.dtype(values.dtype.str)))
+            self.symbols[symbol] = len(group)
+
+    # Carry an unchanged symbol over from an existing dataset by hard-linking its arrays
+    # (copying when the link fails, e.g. across filesystems)
+    def link_symbol(self, source_root, symbol):
+        manifest = read_manifest(source_root)
+        if self.columns is None:
+            self.columns = manifest["columns"]
+        elif manifest["columns"] != self.columns:
+            raise ValueError(f"Columns of {source_root} do not match the dataset being written.")
+        if symbol in self.symbols:
+            raise ValueError(f"Symbol {symbol} was already written to {self.root}.")
+
+        symbol_dir = os.path.join(self.tmp_root, symbol)
+        os.makedirs(symbol_dir)
+        for col in self.columns:
+            src, dst = os.path.join(source_root, symbol, f"{col}.npy"), os.path.join(symbol_dir, f"{col}.npy")
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+        self.symbols[symbol] = manifest["symbols"][symbol]
+
+    def close(self):
+        manifest = {"format_version": FORMAT_VERSION, "columns": self.columns or {}, "symbols": self.symbols}
+        with open(os.path.join(self.tmp_root, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        os.replace(self.tmp_root, self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            shutil.rmtree(self.tmp_root, ignore_errors=True)
+
+
+# Write a whole DataFrame as a columnar dataset
+def save_columnar(df, root):
+    with PreparedDataWriter(root) as writer:
+        writer.write(df)
+
+
+def read_manifest(root):
+    with open(os.path.join(root, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+# Memory-map the requested columns of one symbol; nothing is read until the arrays are touched
+def open_symbol(root, symbol, columns=None):
+    manifest = read_manifest(root)
+    columns = columns or list(manifest["columns"])
+    return {col: np.load(os.path.join(root, symbol, f"{col}.npy"), mmap_mode="r") for col in columns}
+
+
+# Load a DataFrame holding only the requested symbols and columns, optionally only the bars with
+# start <= datetime <= end. Each symbol's range is found by binary search on its memory-mapped
+# datetime array, so bars outside it are never read.
+def load_columnar(root, symbols=None, columns=None, start=None, end=None):
+    manifest = read_manifest(root)
+    columns = columns or list(manifest["columns"])
+    missing = [col for col in columns if col not in manifest["columns"]]
+    if missing:
+        raise ValueError(f"Columns {missing} are not in the prepared dataset at {root}.")
+    symbols = [s for s in (symbols or manifest["symbols"]) if manifest["symbols"].get(s)]
+
+    ranges = {s: slice(0, manifest["symbols"][s]) for s in symbols}
+    if start is not None or end is not None:
+        if "datetime" not in manifest["columns"]:
+            raise ValueError(f"The prepared dataset at {root} has no datetime column to select a date range.")
+        for s in symbols:
+            datetimes = np.load(os.path.join(root, s, "datetime.npy"), mmap_mode="r")
+            lo = np.searchsorted(datetimes, np.datetime64(start), "left") if start is not None else 0
+            hi = np.searchsorted(datetimes, np.datetime64(end), "right") if end is not None else len(datetimes)
+            ranges[s] = slice(int(lo), int(hi))
+        symbols = [s for s in symbols if ranges[s].stop > ranges[s].start]
+
+    counts = [ranges[s].stop - ranges[s].start for s in symbols]
+    frame = {"symbol": np.repeat(np.array(symbols, dtype=object), counts)}
+    for col in columns:
+        parts = [np.load(os.path.join(root, s, f"{col}.npy"), mmap_mode="r")[ranges[s]] for s in symbols]
+        frame[col] = np.concatenate(parts) if parts else np.empty(0, dtype=manifest["columns"][col])
+    return pd.DataFrame(frame)
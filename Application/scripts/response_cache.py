@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+from database import BASE_DIR
+
+# Raw Alpha Vantage responses, one gzip-compressed JSON file per symbol, interval and trading day
+FETCH_CACHE_DIR = os.getenv("FETCH_CACHE_DIR", os.path.join(BASE_DIR, '..', 'data', 'fetch_cache'))
+
+
+class ResponseCache:
+    """
+    Stores the bars of every TIME_SERIES_INTRADAY response exactly as the API sent them, split by
+    trading day at <root>/<interval>/<symbol>/<YYYY-MM-DD>.json.gz. A day's file is the union of every
+    response that covered it, so full and compact responses merge instead of overwriting each other,
+    and load() rebuilds a response-shaped time series from whatever days are cached.
+    """
+
+    def __init__(self, root=FETCH_CACHE_DIR):
+        self.root = root
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, interval, symbol)
+
+    def _read(self, path):
+        with gzip.open(path, "rt") as f:
+            return json.load(f)
+
+    # Trading days cached for a symbol, oldest first
+    def days(self, symbol, interval):
+        directory = self._dir(symbol, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".json.gz")] for name in os.listdir(directory) if name.endswith(".json.gz"))
+
+    # Merge a response's time series ({datetime: bar}) into the per-day files; returns the days written
+    def store(self, symbol, interval, series):
+        by_day = {}
+        for bar_time, bar in series.items():
+            by_day.setdefault(bar_time[:10], {})[bar_time] = bar
+        directory = self._dir(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        for day, bars in by_day.items():
+            path = os.path.join(directory, f"{day}.json.gz")
+            if os.path.exists(path):
+                cached = self._read(path)
+                if all(cached.get(bar_time) == bar for bar_time, bar in bars.items()):
+                    continue
+                bars = dict(cached, **bars)
+            with gzip.open(f"{path}.tmp", "wt", compresslevel=6) as f:
+                json.dump(dict(sorted(bars.items(), reverse=True)), f, separators=(",", ":"))
+            os.replace(f"{path}.tmp", path)
+        return sorted(by_day)
+
+    # The cached bars between two dates (inclusive, "YYYY-MM-DD"), newest first like the API; None if none
+    def load(self, symbol, interval, start=None, end=None):
+        days = [day for day in self.days(symbol, interval) if (start or "") <= day <= (end or "9999")]
+        if not days:
+            return None
+        series = {}
+        for day in reversed(days):
+            series.update(self._read(os.path.join(self._dir(symbol, interval), f"{day}.json.gz")))
+        return series
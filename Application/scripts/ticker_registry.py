@@ -0,0 +1,156 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from database import BASE_DIR, DATABASE_PATH
+
+# CSV the registry is seeded from the first time its table is created, and the default export target
+TICKERS_CSV = os.path.join(BASE_DIR, '..', 'tickers.csv')
+
+
+class TickerRegistry:
+    """
+    The trading universe, stored in a `tickers` table next to the market data. Adding or removing a
+    symbol is one indexed statement, so concurrent writers (dashboard users, pipeline runs) never
+    lose each other's updates. symbols() serves an in-process cached copy that is invalidated by this
+    registry's own writes and, through SQLite's data_version, by commits from any other connection.
+    """
+
+    def __init__(self, database_path=DATABASE_PATH, csv_path=TICKERS_CSV):
+        self.database_path = database_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        self.conn = sqlite3.connect(database_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._cache = None
+        self._cache_version = None
+
+        with self.lock, self.conn:
+            created = not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickers'"
+            ).fetchone()
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS tickers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT NOT NULL UNIQUE,
+                    added_at REAL NOT NULL
+                )
+            """)
+        if created and csv_path and os.path.exists(csv_path):
+            count = self.import_csv(csv_path)
+            print(f"Ticker registry created with {count} symbols from {csv_path}.")
+
+    def _data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _invalidate(self):
+        self._cache = None
+
+    # (ordered symbols, symbol set), re-read only when the table changed since the last read
+    def _view(self):
+        with self.lock:
+            version = self._data_version()
+            if self._cache is None or version != self._cache_version:
+                symbols = [row[0] for row in self.conn.execute("SELECT symbol FROM tickers ORDER BY id")]
+                self._cache = (symbols, frozenset(symbols))
+                self._cache_version = version
+            return self._cache
+
+    # Symbols in the order they were added
+    def symbols(self):
+        return list(self._view()[0])
+
+    def __contains__(self, symbol):
+        return symbol in self._view()[1]
+
+    def __len__(self):
+        return len(self._view()[0])
+
+    # True if the symbol was added, False if it was already registered
+    def add(self, symbol):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO tickers (symbol, added_at) VALUES (?, ?)", (symbol, time.time())
+            )
+            self._invalidate()
+        return cursor.rowcount == 1
+
+    # True if the symbol was removed, False if it was not registered
+    def remove(self, symbol):
+        with self.lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM tickers WHERE symbol = ?", (symbol,))
+            self._invalidate()
+        return cursor.rowcount == 1
+
+    # Add every symbol of a CSV with a Symbol column in one transaction; with replace, the registry
+    # becomes exactly the CSV's symbols. Returns the number of symbols added.
+    def import_csv(self, path, replace=False):
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            symbols = [row["Symbol"].strip() for row in reader if (row.get("Symbol") or "").strip()]
+        now = time.time()
+        with self.lock, self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM tickers")
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tickers (symbol, added_at) VALUES (?, ?)", ((s, now) for s in symbols)
+            )
+            added = self.conn.total_changes - before
+            self._invalidate()
+        return added
+
+    # Write the registry as a tickers.csv-style file, replacing `path` atomically
+    def export_csv(self, path=TICKERS_CSV):
+        symbols = self.symbols()
+        with open(f"{path}.tmp", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Symbol"])
+            writer.writerows([symbol] for symbol in symbols)
+        os.replace(f"{path}.tmp", path)
+        return len(symbols)
+
+    def close(self):
+        self.conn.close()
+
+
+# One registry per database per process
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(database_path=DATABASE_PATH):
+    database_path = os.path.abspath(database_path)
+    with _registries_lock:
+        if database_path not in _registries:
+            _registries[database_path] = TickerRegistry(database_path)
+        return _registries[database_path]
+
+
+# The current trading universe
+def load_symbols(database_path=DATABASE_PATH):
+    return get_registry(database_path).symbols()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--import-csv", metavar="PATH", help="Add the symbols of a CSV with a Symbol column")
+    parser.add_argument("--replace", action="store_true", help="With --import-csv, drop symbols not in the CSV")
+    parser.add_argument("--export-csv", metavar="PATH", help="Write the registry to a CSV")
+    parser.add_argument("--add", nargs="+", default=[], metavar="SYMBOL")
+    parser.add_argument("--remove", nargs="+", default=[], metavar="SYMBOL")
+    args = parser.parse_args()
+
+    registry = get_registry()
+    if args.import_csv:
+        print(f"Imported {registry.import_csv(args.import_csv, replace=args.replace)} new symbols.")
+    for symbol in args.add:
+        print(f"{symbol}: {'added' if registry.add(symbol) else 'already registered'}")
+    for symbol in args.remove:
+        print(f"{symbol}: {'removed' if registry.remove(symbol) else 'not registered'}")
+    if args.export_csv:
+        print(f"Exported {registry.export_csv(args.export_csv)} symbols to {args.export_csv}.")
+    print(f"{len(registry)} symbols: {', '.join(registry.symbols())}")
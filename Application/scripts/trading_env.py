@@ -1,97 +1,236 @@
+import logging
 import gym
 import numpy as np
 from gym import spaces
-import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from market_tensor import align_frame
+from event_log import RateLimitedLogger, get_logger
+
+# Per-stock features exposed in the observation, in order
+FEATURE_COLUMNS = ["ema_8", "ema_21", "rsi_14", "macd", "macd_signal", "vwap"]
+
+
+# Date -> [start, end) row range of every trading day on the shared datetime axis
+def build_date_index(datetimes):
+    if datetimes is None or not len(datetimes):
+        return {}
+    dates, starts = np.unique(np.asarray(datetimes).astype("datetime64[D]"), return_index=True)
+    ends = np.append(starts[1:], len(datetimes))
+    return {str(date): (int(start), int(end)) for date, start, end in zip(dates, starts, ends)}
+
+
+# Apply one bar of actions (0=Hold, 1=Buy, 2=Sell per stock) with the environment's accounting: sells
+# close whole positions first, then the cash is split evenly across the stocks being bought (whole
+# shares only), with transaction_cost charged on traded notional. Stocks without a bar (valid False)
+# are not traded. Updates positions and last_prices in place and returns the new balance.
+def execute_actions(actions, prices, valid, positions, last_prices, balance, transaction_cost=0.0):
+    np.copyto(last_prices, prices, where=valid)
+
+    # Sell: close every held position flagged for sale
+    sell = valid & (actions == 2) & (positions > 0)
+    proceeds = float((positions[sell] * prices[sell]).sum())
+    balance += proceeds * (1 - transaction_cost)
+    positions[sell] = 0
+
+    # Buy: split the cash evenly across the stocks flagged for purchase, whole shares only
+    buy = valid & (actions == 1)
+    n_buy = int(buy.sum())
+    if n_buy:
+        unit_cost = prices[buy] * (1 + transaction_cost)
+        shares = np.floor(balance / n_buy / unit_cost)
+        positions[buy] += shares
+        balance -= float((shares * unit_cost).sum())
+    return balance
+
 
 class TradingEnvironment(gym.Env):
-    def __init__(self, data, stocks, initial_balance=10000):
+    """
+    Multi-stock trading environment. Each step applies one action per stock (0=Hold, 1=Buy,
+    2=Sell) as masked array operations: sells close whole positions first, then the remaining
+    cash is split evenly across the stocks being bought. `transaction_cost` is charged as a
+    fraction of traded notional on both sides. The reward is the change in portfolio value
+    over the step, with positions marked at each stock's last available close.
+
+    All stocks share one datetime axis (see market_tensor.MarketTensor): step t is the same
+    timestamp for every stock, a stock without a bar at t keeps its last features and price and
+    cannot be traded. Pass a prebuilt `market` tensor to skip aligning `data` here.
+
+    By default the observation is the current bar's features for every stock plus the balance,
+    flattened. With `lookback=N` it is a dict holding the last N bars as an (N, stocks, features)
+    read-only view into the feature tensor (zeros before the first bar) and the balance; wrap the
+    env in FlatWindowObservation to feed it to an MlpPolicy.
+
+    `episode` sets what one episode covers: the whole history (None), one trading day ("day"),
+    or chunks of N bars (an int). Each reset() picks the next window in order, or a random one
+    with start_mode="random".
+    """
+
+    def __init__(self, data, stocks, initial_balance=10000, scaler=None, transaction_cost=0.0, lookback=None,
+                 episode=None, start_mode="sequential", seed=None, market=None):
         super(TradingEnvironment, self).__init__()
         self.data = data
         self.stocks = stocks
         self.initial_balance = initial_balance
+        self.transaction_cost = transaction_cost
         self.balance = initial_balance
-        self.positions = {stock: 0 for stock in stocks}
+        self.positions = np.zeros(len(stocks), dtype=np.float64)  # Shares held per stock
+        self.last_prices = np.zeros(len(stocks), dtype=np.float64)  # Last valid close, for valuation
         self.total_value = self.balance
         self.current_step = 0
         self.done = False  # Initialize the 'done' flag
 
-        # Observation space includes features for all stocks + balance
-        obs_space_size = len(self.stocks) * 6 + 1  # Example: 6 features per stock + 1 for balance
-        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(obs_space_size,), dtype=np.float32)
+        # Align every stock on the shared datetime axis once, so step() never touches pandas
+        if market is None:
+            market = align_frame(data, stocks, FEATURE_COLUMNS)
+        elif market.stocks != list(stocks) or market.columns != FEATURE_COLUMNS:
+            raise ValueError("The market tensor was built for different stocks or feature columns.")
+        self.datetimes = market.datetimes
+        self.features, self.close_prices, self.valid_mask = market.features, market.close, market.valid
+        self.started = np.logical_or.accumulate(self.valid_mask, axis=0)  # Stock has had a bar by step t
+        self.lengths = self.valid_mask.sum(axis=0)
+        self.n_steps = self.features.shape[0]
+
+        # Apply the persisted feature normalization once, up front
+        if scaler is not None:
+            mean, scale = scaler.stock_params(stocks, FEATURE_COLUMNS)
+            normalized = (self.features - mean.astype(np.float32)) / scale.astype(np.float32)
+            self.features = np.where(self.started[..., None], normalized, 0).astype(np.float32)
+
+        self.lookback = lookback
+        if lookback is None:
+            # Observation space includes features for all stocks + balance
+            obs_space_size = len(self.stocks) * len(FEATURE_COLUMNS) + 1  # 6 features per stock + 1 for balance
+            self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(obs_space_size,), dtype=np.float32)
+        else:
+            # One contiguous tensor with lookback-1 zero bars in front; every window is a strided view into it
+            window_shape = (lookback, len(self.stocks), len(FEATURE_COLUMNS))
+            padded = np.zeros((self.n_steps + lookback - 1,) + window_shape[1:], dtype=np.float32)
+            padded[lookback - 1:] = self.features
+            self.features = padded[lookback - 1:]
+            self.windows = sliding_window_view(padded, lookback, axis=0).transpose(0, 3, 1, 2)
+            self._empty_window = np.zeros(window_shape, dtype=np.float32)
+            self._obs = {"features": self._empty_window, "balance": np.zeros(1, dtype=np.float32)}
+            self.observation_space = spaces.Dict({
+                "features": spaces.Box(low=-np.inf, high=np.inf, shape=window_shape, dtype=np.float32),
+                "balance": spaces.Box(low=-np.inf, high=np.inf, shape=(1,), dtype=np.float32),
+            })
 
         # Action space allows Buy/Sell/Hold for each stock
         self.action_space = spaces.MultiDiscrete([3] * len(stocks))
 
+        # Diagnostics are rate limited, and skipped entirely when DEBUG is off
+        self.log = RateLimitedLogger(get_logger("trading_env"))
+        self._debug = self.log.enabled_for(logging.DEBUG)
+
+        # Episode windows, resolved once through the date -> row index
+        if start_mode not in ("sequential", "random"):
+            raise ValueError(f"Unknown start_mode: {start_mode}")
+        self.date_index = build_date_index(self.datetimes)
+        self.episode_windows = self._build_episode_windows(episode)
+        self.start_mode = start_mode
+        self._rng = np.random.default_rng(seed)
+        self._next_window = 0
+        self.episode_start, self.episode_end = self.episode_windows[0]
 
 
+
+    # [start, end) row ranges of the episodes; each needs at least two bars to take a step
+    def _build_episode_windows(self, episode):
+        n_bars = self.n_steps
+        if episode is None:
+            windows = [(0, n_bars)]
+        elif episode == "day":
+            if not self.date_index:
+                raise ValueError("Day-long episodes need a datetime column in the data.")
+            windows = list(self.date_index.values())
+        elif isinstance(episode, int) and episode > 1:
+            windows = [(start, min(start + episode, n_bars)) for start in range(0, n_bars, episode)]
+        else:
+            raise ValueError(f"Unknown episode setting: {episode!r}")
+        windows = [window for window in windows if window[1] - window[0] >= 2] or [(0, n_bars)]
+        return np.array(windows, dtype=np.int64)
+
+    def seed(self, seed=None):
+        self._rng = np.random.default_rng(seed)
+        return [seed]
+
     def reset(self):
+        if self.start_mode == "random":
+            index = int(self._rng.integers(len(self.episode_windows)))
+        else:
+            index = self._next_window
+            self._next_window = (index + 1) % len(self.episode_windows)
+        self.episode_start, self.episode_end = (int(row) for row in self.episode_windows[index])
+
         self.balance = self.initial_balance
-        self.positions = {stock: 0 for stock in self.stocks}
+        self.positions = np.zeros(len(self.stocks), dtype=np.float64)
+        self.last_prices = np.zeros(len(self.stocks), dtype=np.float64)
         self.total_value = self.balance
-        self.current_step = 0
+        self.current_step = self.episode_start
         self.done = False  # Reset the 'done' flag
         obs = self._get_observation()
-        print(f"Observation size after reset: {len(obs)}, Expected: {self.observation_space.shape[0]}")
+        if self._debug:
+            self.log.debug("reset", "Reset to bars [%d, %d) of %d", self.episode_start, self.episode_end, self.n_steps)
         return obs
 
 
 
 
     def _get_observation(self):
-        obs = []
-        for stock in self.stocks:
-            stock_data = self.data[self.data["symbol"] == stock]
-            if self.current_step < len(stock_data):  # Check if data exists for the current step
-                stock_row = stock_data.iloc[self.current_step]
-                obs.extend(stock_row[["ema_8", "ema_21", "rsi_14", "macd", "macd_signal", "vwap"]].values)
-            else:
-                print(f"Skipping stock {stock} due to insufficient data at step {self.current_step}")
-                obs.extend([0] * 6)  # Fill with zeros if no data is available for this stock
-        obs.append(self.balance)  # Include the remaining balance
-        obs = np.array(obs, dtype=np.float32)
-        
-        # Debugging print
-        # print(f"Expected observation space size: {self.observation_space.shape[0]}")
-        # print(f"Actual observation size: {len(obs)}")
-        
-        # Ensure the observation matches the defined space
-        assert len(obs) == self.observation_space.shape[0], (
-            f"Observation size mismatch: got {len(obs)}, expected {self.observation_space.shape[0]}"
-        )
+        if self.lookback is not None:
+            return self._get_window_observation()
+        obs = np.zeros(self.observation_space.shape[0], dtype=np.float32)
+        if self.current_step < self.n_steps:
+            obs[:-1] = self.features[self.current_step].reshape(-1)
+        if self._debug:
+            self._log_missing()
+        obs[-1] = self.balance  # Include the remaining balance
         return obs
 
+    def _log_missing(self):
+        if self.current_step < self.n_steps:
+            missing = np.flatnonzero(~self.started[self.current_step])
+        else:
+            missing = range(len(self.stocks))
+        if len(missing):
+            self.log.debug("missing", "No data yet for %d stocks at step %d (%s)", len(missing), self.current_step,
+                           ", ".join(self.stocks[i] for i in missing[:10]))
+
+    # The same dict is returned every step and only its entries are swapped: the window is a view,
+    # so nothing is copied here (vectorized envs copy observations into their own buffers)
+    def _get_window_observation(self):
+        if self.current_step < self.n_steps:
+            self._obs["features"] = self.windows[self.current_step]
+        else:
+            self._obs["features"] = self._empty_window
+        self._obs["balance"][0] = self.balance
+        return self._obs
+
 
     def step(self, actions):
-        for i, stock in enumerate(self.stocks):
-            action = actions[i]
-
-            # Get current stock price
-            stock_data = self.data[self.data["symbol"] == stock]
-            if self.current_step < len(stock_data):
-                current_price = stock_data.iloc[self.current_step]["close"]
-
-                # Handle Buy, Sell, or Hold actions
-                if action == 1:  # Buy
-                    max_shares = self.balance // current_price
-                    self.positions[stock] += max_shares
-                    self.balance -= max_shares * current_price
-                elif action == 2:  # Sell
-                    self.balance += self.positions[stock] * current_price
-                    self.positions[stock] = 0
+        actions = np.asarray(actions)
+        if self.current_step < self.n_steps:
+            prices = self.close_prices[self.current_step]
+            valid = self.valid_mask[self.current_step]
+        else:
+            prices = self.last_prices
+            valid = np.zeros(len(self.stocks), dtype=bool)
+        previous_value = self.total_value
+        self.balance = execute_actions(actions, prices, valid, self.positions, self.last_prices, self.balance,
+                                       self.transaction_cost)
 
         # Update portfolio value
-        self.total_value = self.balance + sum(
-            self.positions[stock] * self.data[self.data["symbol"] == stock].iloc[self.current_step]["close"]
-            for stock in self.stocks if self.current_step < len(self.data[self.data["symbol"] == stock])
-        )
+        self.total_value = self.balance + float(np.dot(self.positions, self.last_prices))
 
         # Advance the step and check if the episode is done
         self.current_step += 1
-        self.done = self.current_step >= len(self.data[self.data["symbol"] == self.stocks[0]]) - 1
+        self.done = self.current_step >= self.episode_end - 1
 
-        # Calculate reward
-        reward = self.total_value - self.balance  # Reward based on portfolio value change
+        # Reward is the change in portfolio value over this step, net of transaction costs
+        reward = self.total_value - previous_value
         obs = self._get_observation()
+        if self.done and self.lookback is not None:
+            obs = dict(obs, balance=obs["balance"].copy())  # Terminal observation must outlive the next reset
 
         return obs, reward, self.done, {}
 
@@ -99,5 +238,34 @@ class TradingEnvironment(gym.Env):
     def render(self, mode="human"):
         print(
             f"Step: {self.current_step}, Balance: {self.balance}, "
-            f"Position: {self.positions}, Total Value: {self.total_value}"
+            f"Position: {dict((stock, shares) for stock, shares in zip(self.stocks, self.positions) if shares)}, "
+            f"Total Value: {self.total_value}"
         )
+
+
+class FlatWindowObservation(gym.Wrapper):
+    """
+    Flattens a lookback observation into one float32 vector for MlpPolicy: the window's features
+    (oldest bar first) followed by the balance. With lookback=1 this is the default observation layout.
+    The vector is written into a buffer allocated once and reused on every step.
+    """
+
+    def __init__(self, env):
+        super(FlatWindowObservation, self).__init__(env)
+        window_shape = env.observation_space["features"].shape
+        self._buffer = np.zeros(int(np.prod(window_shape)) + 1, dtype=np.float32)
+        self._window = self._buffer[:-1].reshape(window_shape)
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=self._buffer.shape, dtype=np.float32)
+
+    def observation(self, obs):
+        np.copyto(self._window, obs["features"])
+        self._buffer[-1] = obs["balance"][0]
+        return self._buffer
+
+    def reset(self, **kwargs):
+        return self.observation(self.env.reset(**kwargs))
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        obs = self.observation(obs)
+        return (obs.copy() if done else obs), reward, done, info
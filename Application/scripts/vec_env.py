@@ -0,0 +1,158 @@
+import multiprocessing as mp
+import time
+import gym
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+from instrumentation import observe
+
+
+# Count steps and time spent inside env.step() so per-worker throughput can be read back
+class StepTimer(gym.Wrapper):
+    def __init__(self, env):
+        super(StepTimer, self).__init__(env)
+        self.step_count = 0
+        self.step_seconds = 0.0
+
+    def step(self, action):
+        start = time.perf_counter()
+        result = self.env.step(action)
+        self.step_seconds += time.perf_counter() - start
+        self.step_count += 1
+        return result
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
+
+
+# Worker loop: observations are written into the shared buffer, only rewards/dones/infos go over the pipe
+def _worker(remote, parent_remote, env_fn_wrapper, shared_obs, index, obs_shape):
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    obs_buffer = np.frombuffer(shared_obs, dtype=np.float32).reshape((-1,) + obs_shape)[index]
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                observation, reward, done, info = env.step(data)
+                if done:
+                    # save final observation where the learner can get it, then reset
+                    info["terminal_observation"] = observation
+                    observation = env.reset()
+                obs_buffer[:] = observation
+                remote.send((reward, done, info))
+            elif cmd == "reset":
+                obs_buffer[:] = env.reset()
+                remote.send(None)
+            elif cmd == "seed":
+                remote.send(env.seed(data) if hasattr(env, "seed") else None)
+            elif cmd == "render":
+                remote.send(env.render(data))
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "env_method":
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(getattr(env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except EOFError:
+            break
+
+
+class SharedMemoryVecEnv(SubprocVecEnv):
+    """
+    SubprocVecEnv variant whose workers write observations into one shared float32 buffer
+    instead of pickling them through the pipe on every step.
+    """
+
+    def __init__(self, env_fns, start_method=None):
+        # Build one copy locally to learn the spaces and size the shared buffer
+        probe = env_fns[0]()
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        n_envs = len(env_fns)
+        obs_shape = observation_space.shape
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self._shared_obs = ctx.RawArray("f", n_envs * int(np.prod(obs_shape)))
+        self._obs = np.frombuffer(self._shared_obs, dtype=np.float32).reshape((n_envs,) + obs_shape)
+
+        self.waiting = False
+        self.closed = False
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), self._shared_obs, index, obs_shape)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos = zip(*results)
+        # Copy out of the shared buffer: SB3 keeps the previous observation until after the next step
+        return self._obs.copy(), np.array(rewards), np.array(dones), list(infos)
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        for remote in self.remotes:
+            remote.recv()
+        return self._obs.copy()
+
+
+# Wrap environment factories in the requested vectorized backend
+def build_vec_env(env_fns, backend="dummy"):
+    env_fns = [lambda env_fn=env_fn: StepTimer(env_fn()) for env_fn in env_fns]
+    if backend == "dummy":
+        return DummyVecEnv(env_fns)
+    if backend == "subproc":
+        return SharedMemoryVecEnv(env_fns)
+    raise ValueError(f"Unknown vectorized env backend: {backend}")
+
+
+# Report overall and per-worker rollout throughput at the end of every rollout, and the time
+# each PPO update took (the gap between one rollout ending and the next starting)
+class ThroughputCallback(BaseCallback):
+    def _on_rollout_start(self):
+        self._rollout_start = time.perf_counter()
+        if getattr(self, "_rollout_end", None) is not None:
+            observe("train.ppo_update_seconds", self._rollout_start - self._rollout_end)
+        self._start_counts = np.array(self.training_env.get_attr("step_count"))
+        self._start_seconds = np.array(self.training_env.get_attr("step_seconds"))
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        elapsed = time.perf_counter() - self._rollout_start
+        steps = np.array(self.training_env.get_attr("step_count")) - self._start_counts
+        busy = np.array(self.training_env.get_attr("step_seconds")) - self._start_seconds
+
+        total_rate = steps.sum() / elapsed
+        self.logger.record("rollout/steps_per_sec", total_rate)
+        observe("train.rollout_seconds", elapsed)
+        observe("train.env_steps_per_sec", total_rate)
+        print(f"Rollout: {steps.sum()} steps in {elapsed:.2f}s ({total_rate:.0f} steps/s across {len(steps)} envs)")
+        for i, (worker_steps, worker_busy) in enumerate(zip(steps, busy)):
+            env_rate = worker_steps / worker_busy if worker_busy > 0 else 0.0
+            print(f"  Worker {i}: {worker_steps / elapsed:.0f} steps/s, {env_rate:.0f} steps/s inside env.step()")
+        self._rollout_end = time.perf_counter()
@@ -0,0 +1,379 @@
+
+# python sweep.py --search random --trials 64 --folds 3 --timesteps 20000
+# python sweep.py --search grid --trials 64 --transaction-cost 0.0005
+# python test_ppo.py --train --new-model --ppo-params sweep_best.json
+
+import os
+import sys
+
+# One BLAS/OpenMP thread per process: the sweep gets its parallelism from worker processes, and
+# each worker fanning out over every core as well would oversubscribe the CPU
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+# Add the scripts directory to the system path
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(BASE_DIR, "scripts"))
+
+import itertools
+import json
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from bar_aggregation import BASE_INTERVAL, interval_minutes, interval_path, normalize_interval
+from database import connect
+from feature_scaler import FeatureScaler
+
+# Paths
+SWEEP_DB = os.path.join(BASE_DIR, "sweep.db")
+LEADERBOARD_FILE = os.path.join(BASE_DIR, "sweep_leaderboard.json")
+BEST_PARAMS_FILE = os.path.join(BASE_DIR, "sweep_best.json")
+
+# Grid search values; random search samples the same choices, except for the (low, high) ranges of
+# RANDOM_RANGES, which are drawn continuously (log-uniform for the learning rate)
+SEARCH_SPACE = {
+    "learning_rate": [3e-5, 1e-4, 3e-4, 1e-3],
+    "n_steps": [1024, 2048, 4096],
+    "batch_size": [64, 128, 256],
+    "gamma": [0.95, 0.99, 0.999],
+    "ent_coef": [0.0, 0.01],
+    "clip_range": [0.1, 0.2, 0.3],
+}
+RANDOM_RANGES = {
+    "learning_rate": (1e-5, 1e-3),
+    "gamma": (0.95, 0.999),
+    "ent_coef": (0.0, 0.02),
+    "clip_range": (0.1, 0.3),
+}
+
+# Training timesteps per fold, and the metric of the out-of-sample windows a trial is ranked by
+SWEEP_TIMESTEPS = 20000
+SCORE_METRIC = "sharpe"
+
+# Median pruning: after each fold, a trial whose mean score so far is below the median of the other
+# trials at the same fold is stopped, once at least PRUNE_MIN_TRIALS of them have reported it
+PRUNE_MIN_TRIALS = 4
+
+LEADERBOARD_SIZE = 10
+
+
+# Every combination of the search space, minus those whose minibatch exceeds the rollout
+def grid_configs(space=SEARCH_SPACE):
+    keys = list(space)
+    configs = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    return [config for config in configs if config["batch_size"] <= config["n_steps"]]
+
+
+def random_configs(n, seed=0, space=SEARCH_SPACE, ranges=RANDOM_RANGES):
+    rng = np.random.default_rng(seed)
+    configs = []
+    while len(configs) < n:
+        config = {}
+        for key, values in space.items():
+            if key == "learning_rate":
+                low, high = ranges[key]
+                config[key] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            elif key in ranges:
+                config[key] = float(rng.uniform(*ranges[key]))
+            else:
+                config[key] = values[rng.integers(len(values))]
+        if config["batch_size"] <= config["n_steps"]:
+            configs.append(config)
+    return configs
+
+
+# The configurations to try: random draws, or the grid (an evenly seeded sample of it when `n` is smaller)
+def sweep_configs(search, n, seed=0):
+    if search == "random":
+        return random_configs(n, seed)
+    configs = grid_configs()
+    if n and n < len(configs):
+        index = np.random.default_rng(seed).choice(len(configs), n, replace=False)
+        configs = [configs[i] for i in sorted(index)]
+    return configs
+
+
+# Walk-forward windows over the shared datetime axis: the axis is cut into n_folds + 1 blocks, and fold k
+# trains on blocks 0..k and is evaluated on block k + 1, so every evaluation window lies after its training data
+def walk_forward_windows(market, n_folds):
+    blocks = np.array_split(np.arange(len(market)), n_folds + 1)
+    if min(len(block) for block in blocks) < 2:
+        raise ValueError(f"Not enough bars for {n_folds} walk-forward folds.")
+    windows = []
+    for k in range(n_folds):
+        train = (market.datetimes[0], market.datetimes[blocks[k][-1]])
+        test = (market.datetimes[blocks[k + 1][0]], market.datetimes[blocks[k + 1][-1]])
+        windows.append((train, test))
+    return windows
+
+
+def ensure_sweep_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sweep_trials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sweep TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            score REAL,
+            folds_done INTEGER NOT NULL DEFAULT 0,
+            seconds REAL,
+            error TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sweep_folds (
+            trial_id INTEGER NOT NULL,
+            fold INTEGER NOT NULL,
+            score REAL,
+            metrics TEXT NOT NULL,
+            PRIMARY KEY (trial_id, fold)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sweep_trials_sweep ON sweep_trials (sweep, status)")
+    conn.commit()
+
+
+# Queue one row per configuration; returns the trial ids in the same order
+def create_trials(conn, sweep, configs):
+    now = time.time()
+    ids = []
+    with conn:
+        for config in configs:
+            cursor = conn.execute(
+                "INSERT INTO sweep_trials (sweep, params, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (sweep, json.dumps(config), now),
+            )
+            ids.append(cursor.lastrowid)
+    return ids
+
+
+# Record a fold and decide whether the trial goes on. Every worker writes to the same database, so the
+# median is taken over whatever the other trials of the sweep have reported so far.
+def report_fold(conn, trial_id, sweep, fold, score, metrics, prune=True):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO sweep_folds (trial_id, fold, score, metrics) VALUES (?, ?, ?, ?)",
+                     (trial_id, fold, score, json.dumps(metrics)))
+        conn.execute("UPDATE sweep_trials SET folds_done = ? WHERE id = ?", (fold + 1, trial_id))
+        rows = conn.execute("""
+            SELECT f.trial_id, AVG(f.score)
+            FROM sweep_folds f JOIN sweep_trials t ON t.id = f.trial_id
+            WHERE t.sweep = ? AND f.fold <= ?
+              AND f.trial_id IN (SELECT trial_id FROM sweep_folds WHERE fold = ?)
+            GROUP BY f.trial_id
+        """, (sweep, fold, fold)).fetchall()
+    running = dict(rows)
+    own = running.pop(trial_id)
+    if not prune or len(running) < PRUNE_MIN_TRIALS:
+        return True
+    return own >= float(np.median(list(running.values())))
+
+
+# Deterministic rollout of the whole evaluation window, scored by the backtest engine
+def evaluate(model, env, periods_per_year=None):
+    from backtest import PERIODS_PER_YEAR, backtest_environment
+
+    obs = env.reset()
+    actions = []
+    done = False
+    while not done:
+        action, _states = model.predict(obs, deterministic=True)
+        obs, reward, done, info = env.step(action)
+        actions.append(action)
+    results = backtest_environment(env, np.array(actions), periods_per_year=periods_per_year or PERIODS_PER_YEAR)
+    return results["metrics"]
+
+
+# Per-worker state: the market and symbols are loaded once per process, not once per trial
+_worker = {}
+
+
+def init_worker(interval=BASE_INTERVAL):
+    import torch
+    import test_ppo
+    from backtest import PERIODS_PER_YEAR
+
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+    symbols = test_ppo.get_stock_symbols()
+    # Folds fit their own scalers; the prepared dataset's scaler only decides global vs per-symbol scaling
+    scaler_file = interval_path(test_ppo.SCALER_FILE, interval)
+    per_symbol = os.path.exists(scaler_file) and FeatureScaler.load(scaler_file).per_symbol
+    _worker.update(market=test_ppo.load_market(symbols, interval), symbols=symbols, per_symbol=per_symbol,
+                   periods_per_year=PERIODS_PER_YEAR / interval_minutes(interval))
+
+
+# Feature scaler fitted on the bars of a fold's training window only, so the test window never leaks into
+# the normalization. Every trial shares the same folds, so each one is fitted once per worker process.
+def fold_scaler(market, train_range, per_symbol=False, chunk_bars=100_000):
+    import pandas as pd
+
+    scalers = _worker.setdefault("fold_scalers", {})
+    if train_range not in scalers:
+        train = market.slice(*train_range)
+        scaler = FeatureScaler(train.columns, per_symbol=per_symbol)
+        for start in range(0, len(train), chunk_bars):
+            steps, stocks = np.nonzero(train.valid[start:start + chunk_bars])
+            features = np.asarray(train.features[start:start + chunk_bars][steps, stocks], dtype=np.float64)
+            df = pd.DataFrame(features, columns=train.columns)
+            df["symbol"] = np.asarray(train.stocks)[stocks]
+            scaler.partial_fit(df)
+        scalers[train_range] = scaler
+    return scalers[train_range]
+
+
+# Train and evaluate one configuration over the walk-forward folds. Returns (trial id, status, score).
+def run_trial(trial_id, sweep, params, windows, timesteps, seed, env_kwargs, database_path=SWEEP_DB, prune=True,
+              metric=SCORE_METRIC):
+    from stable_baselines3 import PPO
+    from test_ppo import make_env
+
+    market, symbols, per_symbol = _worker["market"], _worker["symbols"], _worker["per_symbol"]
+    conn = connect(database_path)
+    conn.execute("UPDATE sweep_trials SET status = 'running' WHERE id = ?", (trial_id,))
+    conn.commit()
+    started = time.perf_counter()
+    status, scores = "complete", []
+    try:
+        for fold, (train_range, test_range) in enumerate(windows):
+            scaler = fold_scaler(market, train_range, per_symbol)
+            train_env = make_env(market.slice(*train_range), symbols, scaler, env_kwargs)
+            model = PPO("MlpPolicy", train_env, verbose=0, device="cpu", seed=seed, **params)
+            model.learn(total_timesteps=timesteps)
+
+            test_kwargs = dict(env_kwargs, episode=None, start_mode="sequential")
+            test_env = make_env(market.slice(*test_range), symbols, scaler, test_kwargs)
+            metrics = evaluate(model, test_env, _worker["periods_per_year"])
+            scores.append(metrics[metric])
+            if not report_fold(conn, trial_id, sweep, fold, metrics[metric], metrics, prune):
+                status = "pruned"
+                break
+        error = None
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    score = float(np.mean(scores)) if scores and status != "failed" else None
+    with conn:
+        conn.execute("UPDATE sweep_trials SET status = ?, score = ?, seconds = ?, error = ? WHERE id = ?",
+                     (status, score, time.perf_counter() - started, error, trial_id))
+    conn.close()
+    return trial_id, status, score
+
+
+# Completed trials of a sweep, best first, with their per-fold metrics
+def leaderboard(conn, sweep, limit=None):
+    rows = conn.execute(
+        "SELECT id, params, score, seconds FROM sweep_trials WHERE sweep = ? AND status = 'complete' "
+        "ORDER BY score DESC" + (f" LIMIT {int(limit)}" if limit else ""),
+        (sweep,),
+    ).fetchall()
+    entries = []
+    for trial_id, params, score, seconds in rows:
+        folds = conn.execute("SELECT metrics FROM sweep_folds WHERE trial_id = ? ORDER BY fold", (trial_id,))
+        entries.append({"trial": trial_id, "score": score, "seconds": seconds, "params": json.loads(params),
+                        "folds": [json.loads(row[0]) for row in folds]})
+    return entries
+
+
+def write_json(data, path):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+# Save the leaderboard and the winning settings (in the form test_ppo.py --ppo-params reads)
+def export_leaderboard(conn, sweep, path=LEADERBOARD_FILE, best_path=BEST_PARAMS_FILE):
+    entries = leaderboard(conn, sweep)
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM sweep_trials WHERE sweep = ? GROUP BY status", (sweep,)))
+    write_json({"sweep": sweep, "metric": SCORE_METRIC, "trials": counts, "leaderboard": entries}, path)
+    if entries:
+        write_json(entries[0]["params"], best_path)
+    return entries
+
+
+def print_leaderboard(entries, limit=LEADERBOARD_SIZE):
+    print(f"{'trial':>6} {'score':>9}  params")
+    for entry in entries[:limit]:
+        params = ", ".join(f"{key}={value:.3g}" if isinstance(value, float) else f"{key}={value}"
+                           for key, value in entry["params"].items())
+        print(f"{entry['trial']:>6} {entry['score']:>9.3f}  {params}")
+
+
+# Usable CPUs (respecting affinity, e.g. under taskset or a container CPU set)
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_sweep(configs, n_folds, timesteps, workers=None, seed=0, env_kwargs=None, prune=True, sweep=None,
+              database_path=SWEEP_DB, interval=BASE_INTERVAL):
+    import test_ppo
+
+    symbols = test_ppo.get_stock_symbols()
+    windows = walk_forward_windows(test_ppo.load_market(symbols, interval), n_folds)
+    sweep = sweep or time.strftime("sweep-%Y%m%d-%H%M%S")
+    conn = connect(database_path)
+    ensure_sweep_tables(conn)
+    trial_ids = create_trials(conn, sweep, configs)
+
+    workers = min(workers or available_cpus(), len(configs))
+    print(f"Sweep {sweep}: {len(configs)} configurations x {n_folds} walk-forward folds of {interval} bars "
+          f"on {workers} workers...")
+    # Workers start from a fresh interpreter, never from a fork of a process that already initialized torch
+    ctx = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker,
+                             initargs=(interval,)) as executor:
+        futures = [
+            executor.submit(run_trial, trial_id, sweep, config, windows, timesteps, seed, env_kwargs or {},
+                            database_path, prune)
+            for trial_id, config in zip(trial_ids, configs)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            trial_id, status, score = future.result()
+            result = f"score {score:.3f}" if score is not None else status
+            print(f"[{done}/{len(configs)}, {time.perf_counter() - started:.0f}s] trial {trial_id} {status}: {result}")
+
+    entries = export_leaderboard(conn, sweep)
+    conn.close()
+    print(f"Leaderboard saved to {LEADERBOARD_FILE}.")
+    if entries:
+        print_leaderboard(entries)
+        print(f"Best settings saved to {BEST_PARAMS_FILE}.")
+    else:
+        print("No trial completed.")
+    return entries
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--search", choices=["grid", "random"], default="random")
+    parser.add_argument("--trials", type=int, default=64, help="Configurations to try (grid: a sample of the grid)")
+    parser.add_argument("--folds", type=int, default=3, help="Walk-forward folds per configuration")
+    parser.add_argument("--timesteps", type=int, default=SWEEP_TIMESTEPS, help="Training timesteps per fold")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per usable CPU)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-prune", action="store_true", help="Run every trial through all folds")
+    parser.add_argument("--name", default=None, help="Sweep name in sweep.db (default: timestamped)")
+    parser.add_argument("--transaction-cost", type=float, default=0.0)
+    parser.add_argument("--lookback", type=int, default=None)
+    parser.add_argument("--episode", default=None, help="Training episode length: 'day' or a number of bars")
+    parser.add_argument("--interval", default=BASE_INTERVAL, help="Bar interval of the prepared data to sweep on")
+    parser.add_argument("--leaderboard", metavar="SWEEP", default=None,
+                        help="Print and export the leaderboard of an earlier sweep instead of running one")
+    args = parser.parse_args()
+
+    if args.leaderboard:
+        conn = connect(SWEEP_DB)
+        ensure_sweep_tables(conn)
+        print_leaderboard(export_leaderboard(conn, args.leaderboard))
+        conn.close()
+    else:
+        episode = int(args.episode) if args.episode and args.episode.isdigit() else args.episode
+        env_kwargs = {"transaction_cost": args.transaction_cost, "lookback": args.lookback, "episode": episode}
+        configs = sweep_configs(args.search, args.trials, args.seed)
+        run_sweep(configs, args.folds, args.timesteps, args.workers, args.seed, env_kwargs,
+                  prune=not args.no_prune, sweep=args.name, interval=normalize_interval(args.interval))
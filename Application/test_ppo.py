@@ -5,71 +5,153 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 # Add the scripts directory to the system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "scripts")))
 
-from trading_env import TradingEnvironment
+from trading_env import TradingEnvironment, FlatWindowObservation, FEATURE_COLUMNS
+from feature_scaler import FeatureScaler
+from prepared_store import load_columnar
+from market_tensor import align_frame, load_market_tensor
+from vec_env import build_vec_env, ThroughputCallback
+from backtest import PERIODS_PER_YEAR, backtest_environment
+from bar_aggregation import BASE_INTERVAL, interval_minutes, interval_path, normalize_interval
+from instrumentation import profile, timer
+from event_log import TradeRecorder
+from ticker_registry import load_symbols
 from stable_baselines3 import PPO
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import csv
+import json
 
 # Paths
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-TICKERS_FILE = os.path.join(BASE_DIR, "tickers.csv")
+PREPARED_DATA_DIR = os.path.join(BASE_DIR, "prepared_data")
 PREPARED_DATA_FILE = os.path.join(BASE_DIR, "prepared_data.csv")
 MODEL_FILE = os.path.join(BASE_DIR, "ppo_day_trade_bot.zip")
+SCALER_FILE = os.path.join(BASE_DIR, "feature_scaler.json")
+PLOT_FILE = "portfolio_plot.png"
 
-# Load stock symbols from tickers.csv
+# PPO settings for a new model (sweep.py searches over these) and the training budget
+PPO_PARAMS = {
+    "learning_rate": 0.0001,
+    "n_steps": 4096,  # Increase rollout steps
+    "batch_size": 256,  # Larger batch size
+    "gamma": 0.99,
+}
+TOTAL_TIMESTEPS = 500
+TRADE_LOG_FILE = "trade_log.txt"
+TRADE_EVENTS_DIR = "trade_events"
+
+# Load stock symbols from the ticker registry
 def get_stock_symbols():
-    if not os.path.exists(TICKERS_FILE):
-        raise FileNotFoundError(f"{TICKERS_FILE} not found.")
-    tickers_df = pd.read_csv(TICKERS_FILE)
-    stock_symbols = tickers_df["Symbol"].dropna().tolist()
+    stock_symbols = load_symbols()
     if not stock_symbols:
-        raise ValueError("No stock symbols found in tickers.csv.")
+        raise ValueError("No stock symbols found in the ticker registry.")
     return stock_symbols
 
-# Load and filter prepared data
-def load_data(stock_symbols):
-    if not os.path.exists(PREPARED_DATA_FILE):
-        raise FileNotFoundError(f"{PREPARED_DATA_FILE} not found.")
-    data = pd.read_csv(PREPARED_DATA_FILE)
-    data = data[data["symbol"].isin(stock_symbols)]
+# Columns the environment needs from the prepared data
+ENV_COLUMNS = ["datetime", "close"] + FEATURE_COLUMNS
+
+# Load and filter prepared data of a bar interval, preferring the columnar dataset over the CSV export
+def load_data(stock_symbols, interval=BASE_INTERVAL):
+    data_dir, data_file = interval_path(PREPARED_DATA_DIR, interval), interval_path(PREPARED_DATA_FILE, interval)
+    if os.path.isdir(data_dir):
+        data = load_columnar(data_dir, symbols=stock_symbols, columns=ENV_COLUMNS)
+    elif os.path.exists(data_file):
+        data = pd.read_csv(data_file, usecols=["symbol"] + ENV_COLUMNS)
+        data = data[data["symbol"].isin(stock_symbols)]
+    else:
+        raise FileNotFoundError(f"Neither {data_dir} nor {data_file} found.")
     if data.empty:
-        raise ValueError("No data available for the stocks listed in tickers.csv.")
+        raise ValueError("No data available for the stocks in the ticker registry.")
     return data
 
+# Load the feature normalization fitted by data_preparation.py, if there is one
+def load_scaler(interval=BASE_INTERVAL):
+    scaler_file = interval_path(SCALER_FILE, interval)
+    if not os.path.exists(scaler_file):
+        print(f"No feature scaler found at {scaler_file}. Using raw features.")
+        return None
+    return FeatureScaler.load(scaler_file)
+
+# All symbols aligned on one shared datetime axis: from the columnar dataset the tensor is built once
+# and cached inside prepared_data/, from the CSV export it is aligned in memory
+def load_market(stock_symbols, interval=BASE_INTERVAL):
+    data_dir = interval_path(PREPARED_DATA_DIR, interval)
+    if os.path.isdir(data_dir):
+        market = load_market_tensor(data_dir, stock_symbols, FEATURE_COLUMNS)
+    else:
+        market = align_frame(load_data(stock_symbols, interval), stock_symbols, FEATURE_COLUMNS)
+    if not market.valid.any():
+        raise ValueError("No data available for the stocks in the ticker registry.")
+    return market
+
+# Split the shared datetime axis into contiguous (first, last) ranges, one per training environment
+def split_date_ranges(market, num_envs):
+    ranges = []
+    for chunk in np.array_split(market.datetimes, num_envs):
+        if len(chunk) < 2:
+            raise ValueError(f"Not enough bars to split the data into {num_envs} date windows.")
+        ranges.append((chunk[0], chunk[-1]))
+    return ranges
+
+# Bars of one date range: memory-mapped from the cached tensor of the columnar dataset at `shard_root`
+# (only that range is read, inside the worker that uses it), or sliced out of the already loaded tensor
+def load_shard(market, stock_symbols, start, end, shard_root=None):
+    if shard_root is not None:
+        return load_market_tensor(shard_root, stock_symbols, FEATURE_COLUMNS, start=start, end=end)
+    return market.slice(start, end)
+
+# Build one environment; lookback windows are flattened for the MlpPolicy
+def make_env(market, stock_symbols, scaler=None, env_kwargs=None):
+    env = TradingEnvironment(None, stocks=stock_symbols, scaler=scaler, market=market, **(env_kwargs or {}))
+    return env if env.lookback is None else FlatWindowObservation(env)
+
+# Build the vectorized training environment: N copies of TradingEnvironment on disjoint date shards
+def make_training_env(market, stock_symbols, num_envs=1, vec_backend="dummy", scaler=None, env_kwargs=None,
+                      shard_root=None):
+    shard_market = None if shard_root is not None else market
+    env_fns = [
+        lambda start=start, end=end: make_env(
+            load_shard(shard_market, stock_symbols, start, end, shard_root), stock_symbols, scaler, env_kwargs
+        )
+        for start, end in split_date_ranges(market, num_envs)
+    ]
+    return build_vec_env(env_fns, backend=vec_backend)
+
 # Initialize and train the PPO model
-def train_model(env):
+def train_model(env, ppo_params=None, total_timesteps=TOTAL_TIMESTEPS, model_file=MODEL_FILE, new_model=False):
     try:
         print("Starting train_model function...")
         
-        # Check if the model file exists
-        if os.path.exists(MODEL_FILE):
-            print(f"Model file found at {MODEL_FILE}. Loading existing model...")
-            model = PPO.load(MODEL_FILE, env=env)
+        # Check if the model file exists, unless a new model was asked for
+        if os.path.exists(model_file) and not new_model:
+            print(f"Model file found at {model_file}. Loading existing model...")
+            model = PPO.load(model_file, env=env)
         else:
-            print(f"No saved model found at {MODEL_FILE}. Creating a new model...")
+            if new_model:
+                print(f"Creating a new model, replacing {model_file} when training finishes...")
+            else:
+                print(f"No saved model found at {model_file}. Creating a new model...")
             model = PPO(
                 "MlpPolicy",
                 env,
                 verbose=1,
                 device="cpu",  # Use "cuda" if GPU is available
-                learning_rate=0.0001,
-                n_steps=4096,  # Increase rollout steps
-                batch_size=256,  # Larger batch size
-                gamma=0.99,
-                tensorboard_log="./ppo_tensorboard/"
+                tensorboard_log="./ppo_tensorboard/",
+                **dict(PPO_PARAMS, **(ppo_params or {}))
             )
             print("New model created successfully.")
         
         print("Starting training process...")
         
         # Train the model
-        model.learn(total_timesteps=500, tb_log_name="PPO_run")
+        with profile("learn"), timer("train.learn"):
+            model.learn(total_timesteps=total_timesteps, tb_log_name="PPO_run", callback=ThroughputCallback())
         print("Training process completed successfully.")
         
         # Save the trained model
-        model.save(MODEL_FILE)
-        print(f"Model saved successfully as {MODEL_FILE}.")
+        model.save(model_file)
+        print(f"Model saved successfully as {model_file}.")
         
         return model
     
@@ -79,45 +161,34 @@ def train_model(env):
 
 
 # Visualize and test the trained model
-def test_model(env, model):
-    buy_count = 0
-    sell_count = 0
-    portfolio_values = []
-    steps = []
+def test_model(env, model, interval=BASE_INTERVAL):
     actions = []  # Log actions
-    prices = []  # Log prices
+    portfolio_values = []
 
     obs = env.reset()
-    step = 0
-
-    # Create a text-based log for actions
-    with open("trade_log.txt", "w") as log:
-        log.write("Step,Action,Price,Portfolio Value\n")  # Header row
 
+    # Trade events are buffered and written in batches, as binary columns plus the text log the web backend follows
+    with TradeRecorder(TRADE_EVENTS_DIR, env.stocks, text_path=TRADE_LOG_FILE) as recorder:
         while True:
             action, _states = model.predict(obs)
             obs, reward, done, info = env.step(action)
 
-            # Increment counters for Buy (1) and Sell (2) actions
-            for i, stock_action in enumerate(action):  # Iterate through actions for each stock
-                if stock_action == 1:
-                    buy_count += 1
-                elif stock_action == 2:
-                    sell_count += 1
-
-            # Log data
+            # Log data (price is the first stock's close at the bar just traded)
+            step = len(actions)
+            actions.append(action)
             portfolio_values.append(env.total_value)
-            prices.append(env.data.iloc[env.current_step]["close"])
-            steps.append(step)
-
-            # Write to text-based log
-            log.write(f"{step},{action},{env.data.iloc[env.current_step]['close']},{env.total_value}\n")
-
-            step += 1
+            recorder.record(step, action, env.close_prices[step, 0], env.total_value)
 
             if done:
                 break
 
+    # Replay the recorded actions through the backtest engine for counts and metrics
+    actions = np.array(actions)
+    steps = np.arange(len(actions))
+    prices = env.close_prices[:len(actions), 0]
+    bar_minutes = interval_minutes(interval)
+    results = backtest_environment(env, actions, periods_per_year=PERIODS_PER_YEAR / bar_minutes)
+
     # Save actions to a CSV for analysis
     with open("actions_log.csv", "w", newline="") as f:
         writer = csv.writer(f)
@@ -125,27 +196,57 @@ def test_model(env, model):
         writer.writerows(zip(steps, actions, prices, portfolio_values))
 
     # Calculate real-world time
-    interval_minutes = 1  # Update this if your data uses a different interval (e.g., 5 for "5min")
     total_steps = len(steps)
-    real_world_minutes = interval_minutes * total_steps
+    real_world_minutes = bar_minutes * total_steps
     real_world_hours = real_world_minutes / 60
     real_world_days = real_world_hours / 24
 
     print(f"\nReal-world time for the simulation: {real_world_minutes} minutes")
     print(f"Equivalent to {real_world_hours:.2f} hours or {real_world_days:.2f} days\n")
-    print(f"Total Buy actions: {buy_count}")
-    print(f"Total Sell actions: {sell_count}")
+    print(f"Total Buy actions: {results['buy_actions']}")
+    print(f"Total Sell actions: {results['sell_actions']}")
+    metrics = results["metrics"]
+    print(f"Final value: {metrics['final_value']:.2f}, Sharpe: {metrics['sharpe']:.2f}, "
+          f"Max drawdown: {metrics['max_drawdown']:.2%}, Turnover: {metrics['turnover']:.1f}")
 
-    # Plot portfolio value and actions
+    # Plot portfolio value and actions (saved to a file so evaluation never blocks on a window)
     plt.figure(figsize=(12, 6))
     plt.plot(steps, portfolio_values, label="Portfolio Value", color="blue")
-    plt.scatter(steps, prices, c=actions, cmap="cool", label="Actions (0=Hold, 1=Buy, 2=Sell)", alpha=0.5)
+    plt.scatter(steps, prices, c=actions[:, 0], cmap="cool", label="Actions (0=Hold, 1=Buy, 2=Sell)", alpha=0.5)
     plt.title("Portfolio Value and Model Actions")
     plt.xlabel("Steps")
     plt.ylabel("Portfolio Value")
     plt.legend()
     plt.grid()
-    plt.show()
+    plt.savefig(PLOT_FILE)
+    plt.close()
+    print(f"Plot saved to {PLOT_FILE}.")
+
+# Train on the prepared dataset of a bar interval (each interval has its own model file), then run
+# the trained policy through a test episode. Returns False (after printing the problem) when the
+# data or environment cannot be set up.
+def run_training(num_envs=1, vec_backend="dummy", env_kwargs=None, ppo_params=None, total_timesteps=TOTAL_TIMESTEPS,
+                 interval=BASE_INTERVAL, new_model=False, model_file=None):
+    try:
+        stock_symbols = get_stock_symbols()
+        market = load_market(stock_symbols, interval)
+        scaler = load_scaler(interval)
+        data_dir = interval_path(PREPARED_DATA_DIR, interval)
+        shard_root = data_dir if os.path.isdir(data_dir) else None
+        train_env = make_training_env(market, stock_symbols, num_envs, vec_backend, scaler, env_kwargs, shard_root)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        return False
+
+    model = train_model(train_env, ppo_params, total_timesteps, model_file or interval_path(MODEL_FILE, interval),
+                        new_model)
+    train_env.close()
+
+    # Test over the whole history in one episode, whatever the training episodes were
+    env = make_env(market, stock_symbols, scaler, dict(env_kwargs or {}, episode=None, start_mode="sequential"))
+    with timer("train.test_model"):
+        test_model(env, model, interval)
+    return True
 
 # Main function
 if __name__ == "__main__":
@@ -153,19 +254,45 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--train", action="store_true", help="Run training and testing")
+    parser.add_argument("--num-envs", type=int, default=1, help="Number of environment copies used for rollouts")
+    parser.add_argument("--vec-backend", choices=["dummy", "subproc"], default="dummy",
+                        help="Run environment copies in-process (dummy) or in worker processes (subproc)")
+    parser.add_argument("--transaction-cost", type=float, default=0.0,
+                        help="Cost per trade as a fraction of traded notional (e.g. 0.0005 for 5 bps)")
+    parser.add_argument("--lookback", type=int, default=None,
+                        help="Observe the last N bars of features instead of only the current one")
+    parser.add_argument("--episode", default=None,
+                        help="Training episode length: 'day' for one trading day, or a number of bars (default: whole shard)")
+    parser.add_argument("--start-mode", choices=["sequential", "random"], default="sequential",
+                        help="Walk training episodes in order or sample them at random")
+    parser.add_argument("--ppo-params", default=None,
+                        help="JSON file of PPO settings for a new model (e.g. sweep_best.json from sweep.py)")
+    parser.add_argument("--new-model", action="store_true",
+                        help="Train a new model from scratch instead of continuing the saved one, replacing it")
+    parser.add_argument("--model-file", default=None,
+                        help="Model to load and save (default: ppo_day_trade_bot.zip, suffixed with the interval)")
+    parser.add_argument("--timesteps", type=int, default=TOTAL_TIMESTEPS, help="Training timesteps")
+    parser.add_argument("--interval", default=BASE_INTERVAL,
+                        help="Bar interval to train on (prepare it first with data_preparation.py --interval)")
     args = parser.parse_args()
 
     if args.train:
-        try:
-            stock_symbols = get_stock_symbols()
-            data = load_data(stock_symbols)
-        except (FileNotFoundError, ValueError) as e:
-            print(f"Error: {e}")
+        episode = int(args.episode) if args.episode and args.episode.isdigit() else args.episode
+        env_kwargs = {"transaction_cost": args.transaction_cost, "lookback": args.lookback,
+                      "episode": episode, "start_mode": args.start_mode}
+        interval = normalize_interval(args.interval)
+        ppo_params = None
+        if args.ppo_params:
+            # A saved model keeps the settings it was created with, so the file would be silently ignored
+            model_file = args.model_file or interval_path(MODEL_FILE, interval)
+            if os.path.exists(model_file) and not args.new_model:
+                print(f"Error: --ppo-params only applies to a new model, but {model_file} exists and would be "
+                      "trained further. Add --new-model to replace it.")
+                exit(1)
+            with open(args.ppo_params) as f:
+                ppo_params = json.load(f)
+        if not run_training(args.num_envs, args.vec_backend, env_kwargs, ppo_params, args.timesteps, interval,
+                            args.new_model, args.model_file):
             exit()
-
-        env = TradingEnvironment(data, stocks=stock_symbols)
-        model = train_model(env)
-        test_model(env, model)
     else:
         print("No action specified. Use --train to start training.")
-
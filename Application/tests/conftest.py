@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The application modules import each other from the scripts directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
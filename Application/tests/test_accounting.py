@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from backtest import run_backtest
+from market_tensor import MarketTensor
+from trading_env import FEATURE_COLUMNS, TradingEnvironment, execute_actions
+
+
+def trade(actions, prices, valid=None, positions=None, balance=1000.0, transaction_cost=0.0):
+    prices = np.asarray(prices, dtype=np.float64)
+    valid = np.ones(len(prices), dtype=bool) if valid is None else np.asarray(valid)
+    positions = np.zeros(len(prices)) if positions is None else np.asarray(positions, dtype=np.float64)
+    last_prices = np.zeros(len(prices))
+    balance = execute_actions(np.asarray(actions), prices, valid, positions, last_prices, balance, transaction_cost)
+    return balance, positions, last_prices
+
+
+def make_env(close, valid, transaction_cost=0.0):
+    n_steps, n_stocks = close.shape
+    stocks = [f"S{i}" for i in range(n_stocks)]
+    market = MarketTensor(stocks, FEATURE_COLUMNS, np.arange(n_steps).astype("datetime64[m]"),
+                          np.zeros((n_steps, n_stocks, len(FEATURE_COLUMNS)), dtype=np.float32), close, valid)
+    return TradingEnvironment(None, stocks, initial_balance=10000, transaction_cost=transaction_cost, market=market)
+
+
+def test_sells_fund_buys_in_the_same_bar():
+    # No cash: the only way to buy stock 1 is with the proceeds of selling stock 0 first
+    balance, positions, _ = trade([2, 1], [10.0, 20.0], positions=[10, 0], balance=0.0)
+    assert positions.tolist() == [0, 5]
+    assert balance == pytest.approx(0.0)
+
+
+def test_cash_is_split_evenly_in_whole_shares():
+    balance, positions, _ = trade([1, 1, 0], [30.0, 70.0, 5.0], balance=1000.0)
+    # 500 each: floor(500 / 30) = 16 shares, floor(500 / 70) = 7 shares
+    assert positions.tolist() == [16, 7, 0]
+    assert balance == pytest.approx(1000.0 - 16 * 30.0 - 7 * 70.0)
+
+
+def test_transaction_cost_is_charged_on_both_sides():
+    balance, positions, _ = trade([1], [10.0], balance=1010.0, transaction_cost=0.01)
+    assert positions.tolist() == [100]  # 10.10 per share including the cost
+    assert balance == pytest.approx(0.0)
+
+    balance, positions, _ = trade([2], [10.0], positions=[100], balance=0.0, transaction_cost=0.01)
+    assert positions.tolist() == [0]
+    assert balance == pytest.approx(990.0)
+
+
+def test_stocks_without_a_bar_are_not_traded():
+    balance, positions, last_prices = trade([1, 2], [10.0, 10.0], valid=[False, False], positions=[0, 5])
+    assert positions.tolist() == [0, 5]
+    assert balance == 1000.0
+    assert last_prices.tolist() == [0, 0]  # and their last price is not overwritten
+
+
+@pytest.mark.parametrize("transaction_cost", [0.0, 0.001])
+def test_env_matches_backtest_and_rewards_sum_to_pnl(transaction_cost):
+    rng = np.random.default_rng(0)
+    n_steps, n_stocks = 200, 4
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_steps, n_stocks)), axis=0))
+    valid = rng.random((n_steps, n_stocks)) > 0.1
+    actions = rng.integers(0, 3, (n_steps - 1, n_stocks))
+
+    env = make_env(close, valid, transaction_cost)
+    env.reset()
+    values, rewards = [], []
+    for action in actions:
+        _, reward, done, _ = env.step(action)
+        values.append(env.total_value)
+        rewards.append(reward)
+    assert done
+
+    result = run_backtest(actions, close[:len(actions)], valid[:len(actions)], initial_balance=10000,
+                          transaction_cost=transaction_cost)
+    np.testing.assert_allclose(values, result["portfolio_value"], rtol=1e-12)
+    assert sum(rewards) == pytest.approx(env.total_value - env.initial_balance)
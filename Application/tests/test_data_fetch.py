@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks")))
+
+import data_fetch
+from response_cache import ResponseCache
+from stub_alpha_vantage import make_intraday_payload, start_stub_server
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    # One call per 0.5s window: a second call inside the window gets the throttle note
+    server, url = start_stub_server(bars=200, calls_per_minute=1, window=0.5)
+    monkeypatch.setattr(data_fetch, "BASE_URL", url)
+    monkeypatch.setattr(data_fetch, "RETRY_BACKOFF_SECONDS", 0.2)
+    monkeypatch.setattr(data_fetch, "MAX_RETRIES", 3)
+    monkeypatch.setattr(data_fetch, "DATABASE_PATH", str(tmp_path / "bars.db"))
+    data_fetch.ensure_table_exists()
+    yield server, ResponseCache(str(tmp_path / "cache"))
+    server.shutdown()
+
+
+def test_stub_bars_do_not_depend_on_the_hash_seed():
+    script = ("from stub_alpha_vantage import make_intraday_payload; "
+              "print(make_intraday_payload('AAPL', bars=5)['Time Series (1min)'])")
+    outputs = {
+        subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)) + "/../benchmarks",
+                       env=dict(os.environ, PYTHONHASHSEED=seed)).stdout
+        for seed in ("1", "2")
+    }
+    assert len(outputs) == 1
+
+
+def test_throttled_call_is_retried(stub, capsys):
+    server, cache = stub
+    first, _ = data_fetch.fetch_symbol("AAPL", cache=cache)
+    second, _ = data_fetch.fetch_symbol("MSFT", cache=cache)  # Throttled at first, served after the backoff
+    assert len(first) == len(second) == 200
+    assert server.calls["full"] == 2
+    assert "MSFT failed (rate limited), retrying" in capsys.readouterr().out
+
+
+def test_invalid_json_skips_only_that_symbol(stub):
+    server, cache = stub
+    server.invalid_json.add("BAD")
+    results = {symbol: data for symbol, data, _, _ in
+               data_fetch.fetch_all(["BAD", "GOOD"], calls_per_minute=600, burst=2, cache=cache)}
+    assert results["BAD"] is None
+    assert len(results["GOOD"]) == 200
+
+
+def test_stored_bars_are_not_inserted_twice(stub):
+    _, cache = stub
+    data, _ = data_fetch.fetch_symbol("AAPL", cache=cache)
+    assert data_fetch.save_to_database("AAPL", data) == (200, 0)
+    assert data_fetch.save_to_database("AAPL", data) == (0, 200)
+
+    conn = data_fetch.connect(data_fetch.DATABASE_PATH)
+    latest = data_fetch.latest_bars(conn, ["AAPL"])
+    conn.close()
+    assert latest == {"AAPL": max(data)}
+    assert data_fetch.new_bars(data, latest["AAPL"]) == {}
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_scaler import GLOBAL_KEY, FeatureScaler
+
+
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"symbol": ["A"] * 50 + ["B"] * 50, "x": np.concatenate([rng.normal(0, 1, 50), rng.normal(10, 5, 50)])})
+
+
+def test_unfitted_symbol_falls_back_to_global_statistics(tmp_path):
+    df = frame()
+    scaler = FeatureScaler(["x"], per_symbol=True).partial_fit(df)
+    path = tmp_path / "scaler.json"
+    scaler.save(path)
+    scaler = FeatureScaler.load(path)
+
+    mean, scale = scaler.stock_params(["A", "NEW"])
+    assert mean[0, 0] == pytest.approx(df.loc[df.symbol == "A", "x"].mean())
+    assert mean[1, 0] == pytest.approx(df["x"].mean())
+    assert scale[1, 0] == pytest.approx(df["x"].std(ddof=0))
+
+
+def test_missing_fit_asks_to_rerun_preparation():
+    scaler = FeatureScaler(["x"], per_symbol=True).partial_fit(frame())
+    del scaler.scalers[GLOBAL_KEY]  # As saved before the global fallback existed
+    with pytest.raises(ValueError, match="data_preparation"):
+        scaler.stock_params(["NEW"])
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "web", "backend")))
+
+from training_jobs import QueueFullError, TrainingScheduler
+
+# Fake trainer: prints an SB3 logger row and a throughput line, writes the --model-file it was given,
+# then sleeps for argv[1] seconds and exits with argv[2]
+FAKE_TRAINER = """
+import sys, time
+args = sys.argv[1:]
+print("|    fps                  | 123      |", flush=True)
+print("Rollout: 2048 steps in 1.0s (2048 steps/s)", flush=True)
+if "--model-file" in args:
+    with open(args[args.index("--model-file") + 1], "a") as f:
+        f.write("trained\\n")
+time.sleep(float(args[0]))
+sys.exit(int(args[1]))
+"""
+
+
+# Never the default model_file: that is the real ppo_day_trade_bot.zip
+def scheduler(tmp_path, seconds=0, exit_code=0, model_file=None, **kwargs):
+    command = [sys.executable, "-c", FAKE_TRAINER, str(seconds), str(exit_code)]
+    return TrainingScheduler(str(tmp_path / "jobs.db"), command, log_dir=str(tmp_path / "logs"),
+                             model_file=model_file, **kwargs)
+
+
+def wait_for(scheduler, job_id, *statuses, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = scheduler.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} stayed {job['status']}, expected {statuses}")
+
+
+def test_job_succeeds_with_progress_and_log(tmp_path):
+    jobs = scheduler(tmp_path, workers=1)
+    job_id = jobs.submit()
+    job = wait_for(jobs, job_id, "succeeded", "failed")
+    assert job["status"] == "succeeded" and job["return_code"] == 0
+    assert job["progress"] == {"fps": 123, "rollout_steps": 2048, "steps_per_sec": 2048}
+    with open(job["log_path"]) as f:
+        assert "Rollout: 2048 steps" in f.read()
+
+
+def test_failed_job_records_exit_code(tmp_path):
+    jobs = scheduler(tmp_path, exit_code=3, workers=1)
+    job = wait_for(jobs, jobs.submit(), "succeeded", "failed")
+    assert job["status"] == "failed" and job["return_code"] == 3 and "3" in job["error"]
+
+
+def test_queue_and_cancel(tmp_path):
+    jobs = scheduler(tmp_path, seconds=60, workers=1, max_queued=1)
+    running = jobs.submit()
+    wait_for(jobs, running, "running")
+    queued = jobs.submit()
+    assert jobs.get(queued)["status"] == "queued"
+    with pytest.raises(QueueFullError):
+        jobs.submit()
+    assert jobs.active() == [running, queued]
+
+    assert jobs.cancel(queued)["status"] == "cancelled"
+    jobs.cancel(running)
+    job = wait_for(jobs, running, "cancelled", "failed", "succeeded")
+    assert job["status"] == "cancelled" and job["finished_at"] is not None
+    assert jobs.active() == []
+
+
+def test_model_is_replaced_only_by_successful_jobs(tmp_path):
+    model = tmp_path / "model.zip"
+    model.write_text("initial\n")
+    jobs = scheduler(tmp_path, workers=1, model_file=str(model))
+    wait_for(jobs, jobs.submit(), "succeeded")
+    assert model.read_text() == "initial\ntrained\n"
+
+    (tmp_path / "failing").mkdir()
+    failing = scheduler(tmp_path / "failing", exit_code=1, workers=1, model_file=str(model))
+    wait_for(failing, failing.submit(), "failed")
+    assert model.read_text() == "initial\ntrained\n"
+    assert list(tmp_path.glob("model_job_*")) == []
@@ -1,101 +1,135 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS  # Import Flask-CORS
 import os
-import subprocess
-import pandas as pd
+import sys
 import threading
-import uuid
-
-
-active_trainings = []
+import time
+from log_stream import get_broadcaster, parse_offset
+from portfolio_cache import get_portfolio_cache
+from training_jobs import QueueFullError, TrainingScheduler
 
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
 # Paths
-APPLICATION_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../application'))
-TICKERS_FILE = os.path.join(APPLICATION_DIR, 'tickers.csv')
+APPLICATION_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../Application'))
 TRADE_LOG = os.path.join(os.path.dirname(__file__), 'trade_log.txt')
+MODEL_FILE = os.path.join(APPLICATION_DIR, 'ppo_day_trade_bot.zip')
+TORCHSCRIPT_FILE = os.path.join(APPLICATION_DIR, 'ppo_day_trade_bot.pt')
+
+# Shared pipeline modules (inference service, etc.)
+sys.path.append(os.path.join(APPLICATION_DIR, 'scripts'))
+
+from instrumentation import configure, load_metrics, observe
+from ticker_registry import get_registry
+
+# Request latency metrics (enabled with PIPELINE_METRICS=1)
+metrics = configure(stage="backend")
+
+# Policy server, loaded on the first /predict request and rebuilt when the model files change
+policy_server = None
+policy_server_files = None
+policy_server_lock = threading.Lock()
+# Seconds a replaced policy server keeps answering requests that were already routed to it
+POLICY_RELOAD_GRACE_SECONDS = 30.0
+
+
+def policy_files():
+    """Modification times of the model and of its TorchScript export, which is ignored when older than the model."""
+    model_mtime = os.path.getmtime(MODEL_FILE)
+    torchscript_mtime = os.path.getmtime(TORCHSCRIPT_FILE) if os.path.exists(TORCHSCRIPT_FILE) else None
+    if torchscript_mtime is not None and torchscript_mtime < model_mtime:
+        torchscript_mtime = None
+    return model_mtime, torchscript_mtime
+
+
+def get_policy_server():
+    """Load the trained policy, preferring an up-to-date TorchScript export, and reload it after retraining."""
+    global policy_server, policy_server_files
+    with policy_server_lock:
+        files = policy_files()
+        if policy_server is None or files != policy_server_files:
+            from inference_service import PolicyServer
+            try:
+                server = PolicyServer(MODEL_FILE, torchscript_path=TORCHSCRIPT_FILE if files[1] else None)
+            except Exception as e:
+                # A model that is still being written fails to load; keep serving the old one until it is complete
+                if policy_server is None:
+                    raise
+                print(f"Error reloading the policy, still serving the previous one: {e}")
+                return policy_server
+            if policy_server is not None:
+                threading.Timer(POLICY_RELOAD_GRACE_SECONDS, policy_server.close).start()
+            policy_server, policy_server_files = server, files
+    return policy_server
+
+
+# Training job scheduler, started on first use so the debug reloader's parent process never runs jobs
+training_scheduler = None
+training_scheduler_lock = threading.Lock()
+
+
+def get_training_scheduler():
+    """Start the scheduler once; queued jobs from a previous run are picked up again."""
+    global training_scheduler
+    with training_scheduler_lock:
+        if training_scheduler is None:
+            training_scheduler = TrainingScheduler()
+    return training_scheduler
+
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        observe(f"http.{request.endpoint}.seconds", time.perf_counter() - start)
+    return response
 
 
 # Routes...
 
 @app.route('/stocks', methods=['GET', 'POST', 'DELETE'])
 def manage_stocks():
-    """Manage stock tickers in tickers.csv."""
+    """Manage stock tickers in the shared ticker registry."""
+    registry = get_registry()
     if request.method == 'GET':
-        try:
-            with open(TICKERS_FILE, 'r') as f:
-                stocks = f.read().splitlines()
-            stocks = [stock for stock in stocks if stock.strip().lower() != "symbol"]
-            return jsonify(stocks)
-        except FileNotFoundError:
-            return jsonify({"error": "tickers.csv not found"}), 404
-
-    elif request.method == 'POST':
-        symbol = request.json.get('symbol')
-        if not symbol:
-            return jsonify({"error": "No symbol provided"}), 400
-
-        try:
-            # Read existing lines and remove empty lines
-            with open(TICKERS_FILE, 'r') as f:
-                lines = [line.strip() for line in f if line.strip()]
-
-            # Add the new stock if it doesn't already exist
-            if symbol in lines:
-                return jsonify({"error": f"Stock {symbol} already exists."}), 400
+        return jsonify(registry.symbols())
 
-            lines.append(symbol)
-
-            # Write back to the file with proper formatting
-            with open(TICKERS_FILE, 'w') as f:
-                f.write('\n'.join(lines) + '\n')
+    symbol = (request.json or {}).get('symbol')
+    if not symbol:
+        return jsonify({"error": "No symbol provided"}), 400
+    symbol = symbol.strip()
 
+    try:
+        if request.method == 'POST':
+            if not registry.add(symbol):
+                return jsonify({"error": f"Stock {symbol} already exists."}), 400
             return jsonify({"message": f"Stock {symbol} added."})
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
-
-
-
-
-    elif request.method == 'DELETE':
-        symbol = request.json.get('symbol')
-        if not symbol:
-            return jsonify({"error": "No symbol provided"}), 400
-
-        try:
-            with open(TICKERS_FILE, 'r') as f:
-                stocks = f.read().splitlines()
-            if symbol not in stocks:
-                return jsonify({"error": f"Stock {symbol} not found"}), 404
-            stocks.remove(symbol)
-            with open(TICKERS_FILE, 'w') as f:
-                f.write('\n'.join(stocks))
-            return jsonify({"message": f"Stock {symbol} removed."})
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
-        
 
+        if not registry.remove(symbol):
+            return jsonify({"error": f"Stock {symbol} not found"}), 404
+        return jsonify({"message": f"Stock {symbol} removed."})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route('/stream-logs', methods=['GET'])
 def stream_logs():
-    """Stream logs without triggering training."""
+    """Follow trade_log.txt as server-sent events, resuming from Last-Event-ID (a byte offset)."""
     log_file = os.path.join(APPLICATION_DIR, "trade_log.txt")
     if not os.path.exists(log_file):
         return Response("Log file not found.", status=404, mimetype="text/plain")
 
-    def generate():
-        with open(log_file, "r") as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                yield f"data: {line}\n\n"
-
-    return Response(generate(), mimetype="text/event-stream")
+    offset = parse_offset(request.headers.get("Last-Event-ID", request.args.get("offset")))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(get_broadcaster(log_file).stream(offset), mimetype="text/event-stream", headers=headers)
 
 
 
@@ -103,55 +137,110 @@ def stream_logs():
 # Trigger Training
 @app.route('/train', methods=['POST'])
 def train_model():
-    """Trigger model training."""
-    session_id = str(uuid.uuid4())  # Unique session ID
-
-    if session_id in active_trainings:
-        return jsonify({"error": "Training session already active"}), 400
-
-    active_trainings.append(session_id)
-
-    def train():
-        try:
-            subprocess.run(
-                ["python", os.path.join(APPLICATION_DIR, "test_ppo.py"), "--train"],
-                check=True,
-                text=True,
-            )
-        except Exception as e:
-            print(f"Error during training: {e}")
-        finally:
-            active_trainings.remove(session_id)
-
-    # Start training in a background thread
-    threading.Thread(target=train, daemon=True).start()
-    return jsonify({"message": "Training started", "session_id": session_id}), 200
+    """Queue a training job; jobs run one per worker slot, never more than TRAINING_WORKERS at once."""
+    try:
+        job_id = get_training_scheduler().submit()
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"message": "Training queued", "session_id": job_id}), 200
+
+
+@app.route('/train/<job_id>', methods=['DELETE'])
+def cancel_training(job_id):
+    """Cancel a queued or running training job."""
+    job = get_training_scheduler().cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Training job {job_id} not found"}), 404
+    return jsonify(job)
+
 
 @app.route('/training-status', methods=['GET'])
 def get_training_status():
-    """Monitor active training sessions."""
-    return jsonify({"active_sessions": len(active_trainings), "sessions": active_trainings})
+    """Monitor training jobs: active ids plus recent jobs with their state and progress."""
+    scheduler = get_training_scheduler()
+    active = scheduler.active()
+    return jsonify({"active_sessions": len(active), "sessions": active, "jobs": scheduler.jobs()})
+
+
+@app.route('/training-status/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """State and progress of one training job."""
+    job = get_training_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Training job {job_id} not found"}), 404
+    return jsonify(job)
 
 
 # Portfolio Data
 @app.route('/portfolio', methods=['GET'])
 def get_portfolio():
-    """Fetch portfolio data from trade_log.txt."""
+    """Fetch portfolio data from trade_log.txt. Supports ?since=step, ?limit= and ?resolution= for the series."""
     if not os.path.exists(TRADE_LOG):
         return jsonify({"error": "Portfolio data not available"}), 404
 
     try:
-        df = pd.read_csv(TRADE_LOG)
-        total_value = df["Portfolio Value"].iloc[-1]
-        portfolio = {
-            "total_value": total_value,
-            "stocks": df.to_dict(orient="records")
-        }
-        return jsonify(portfolio)
+        since = request.args.get('since', type=int)
+        limit = request.args.get('limit', type=int)
+        resolution = request.args.get('resolution', type=int)
+        if (limit is not None and limit < 1) or (resolution is not None and resolution < 1):
+            return jsonify({"error": "limit and resolution must be positive integers"}), 400
+
+        cache = get_portfolio_cache(TRADE_LOG)
+        etag = cache.etag(cache.refresh(), since, limit, resolution)
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        portfolio = cache.query(since, limit, resolution)
+        if portfolio is None:
+            return jsonify({"error": "Portfolio data not available"}), 404
+        response = jsonify(portfolio)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    
+
+# Policy Inference
+@app.route('/predict', methods=['POST'])
+def predict():
+    """Return actions for one observation or a list of observations, micro-batched with concurrent requests."""
+    if not os.path.exists(MODEL_FILE):
+        return jsonify({"error": "Trained model not available"}), 404
+
+    payload = request.json or {}
+    observations = payload.get('observations')
+    if observations is None and 'observation' in payload:
+        observations = [payload['observation']]
+    if not observations:
+        return jsonify({"error": "No observation provided"}), 400
+
+    try:
+        actions = get_policy_server().predict_batch(observations)
+        return jsonify({"actions": actions.tolist()})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/predict/stats', methods=['GET'])
+def predict_stats():
+    """Report inference latency percentiles and throughput."""
+    if policy_server is None:
+        return jsonify({"requests": 0})
+    return jsonify(policy_server.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Pipeline timings: the latest metrics file of each stage plus this server's request latencies."""
+    stages = load_metrics()
+    stages["backend"] = metrics.snapshot()
+    return jsonify(stages)
+
+
 @app.route('/tensorboard', methods=['GET'])
 def serve_tensorboard():
     """Serve TensorBoard iframe link."""
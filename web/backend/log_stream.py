@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import deque
+
+# Seconds between checks of the log file for appended data
+POLL_INTERVAL = float(os.getenv("LOG_STREAM_POLL_SECONDS", "0.5"))
+# Seconds of silence before a heartbeat comment is sent to keep proxies and browsers connected
+HEARTBEAT_INTERVAL = float(os.getenv("LOG_STREAM_HEARTBEAT_SECONDS", "15"))
+# Upper bound on the payload of a single event; larger backlogs are sent as several events
+MAX_EVENT_BYTES = 64 * 1024
+# Recently appended chunks kept in memory so live clients never re-read the file
+CHUNK_CACHE_SIZE = 256
+
+
+class LogBroadcaster:
+    """
+    Tails one log file for any number of SSE clients. A single background thread polls the
+    file and reads each appended block once; clients wait on a shared condition and are
+    served from the in-memory chunks, falling back to a direct ranged read only when they
+    resume from an offset that has already left the cache. Offsets are byte positions at
+    line boundaries and double as SSE event ids.
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.offset = 0          # End of the last complete line read from the file
+        self.inode = None        # Inode of the file being tailed
+        self.generation = 0      # Bumped whenever the file is truncated or replaced
+        self.chunks = deque(maxlen=CHUNK_CACHE_SIZE)
+        self.condition = threading.Condition()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._polled = threading.Event()  # Set once the file has been read up to its end for the first time
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            try:
+                self._poll()
+            except OSError as e:
+                print(f"Error tailing {self.path}: {e}")
+            self._polled.set()
+            with self.condition:
+                self.condition.wait(self.poll_interval)
+
+    def _poll(self):
+        st = os.stat(self.path) if os.path.exists(self.path) else None
+        size, inode = (st.st_size, st.st_ino) if st else (0, self.inode)
+        replaced = self.inode is not None and inode != self.inode
+        self.inode = inode
+        if size < self.offset or replaced:
+            # Rewritten from scratch (e.g. a new test run); clients start over from byte 0
+            with self.condition:
+                self.offset = 0
+                self.generation += 1
+                self.chunks.clear()
+                self.condition.notify_all()
+        if size == self.offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b"\n") + 1  # Only publish complete lines
+        if end == 0:
+            return
+        with self.condition:
+            self.chunks.append((self.offset, self.offset + end, data[:end]))
+            self.offset += end
+            self.condition.notify_all()
+
+    # Bytes from `offset` up to the tailer's position, served from the cache when possible
+    def _read_from(self, offset, limit):
+        with self.condition:
+            chunks = list(self.chunks)
+            available = self.offset
+        # Only the chunks overlapping [offset, offset + limit), sliced through memoryviews so a client
+        # catching up on a large backlog never copies the rest of the cache
+        stop = offset + limit
+        cached = [(start, data) for start, end, data in chunks if end > offset and start < stop]
+        if cached and cached[0][0] <= offset:
+            data = b"".join(memoryview(data)[max(offset - start, 0):stop - start] for start, data in cached)
+        else:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read(min(limit, available - offset))
+        if len(data) > limit:
+            data = data[:limit]
+        if len(data) == limit:
+            # Cut at the last complete line unless a single line is longer than the limit
+            data = data[:data.rfind(b"\n") + 1] or data
+        return data
+
+    # SSE stream starting at byte `offset`: batched line events, heartbeats and resets
+    def stream(self, offset=0, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.start()
+        # Validate the resume offset against the file, not against a watcher that has not read it yet
+        self._polled.wait()
+        with self.condition:
+            generation = self.generation
+        if offset > self.offset:
+            offset = 0  # Resuming past the end means the file was replaced since the client's last event
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.offset != offset or self.generation != generation, heartbeat_interval
+                )
+                reset = self.generation != generation or offset > self.offset
+                generation = self.generation
+                pending = self.offset - offset
+
+            if reset:
+                offset = 0
+                yield "event: reset\nid: 0\ndata: \n\n"
+            elif pending > 0:
+                data = self._read_from(offset, MAX_EVENT_BYTES)
+                if not data:
+                    continue
+                offset += len(data)
+                lines = data.decode("utf-8", errors="replace").splitlines()
+                yield f"id: {offset}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+            else:
+                yield ": heartbeat\n\n"
+
+
+# One broadcaster per file, shared by every connected client
+broadcasters = {}
+broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(path):
+    with broadcasters_lock:
+        if path not in broadcasters:
+            broadcasters[path] = LogBroadcaster(path)
+        return broadcasters[path]
+
+
+# Resume offset from the SSE Last-Event-ID header (sent automatically on reconnect) or a query parameter
+def parse_offset(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
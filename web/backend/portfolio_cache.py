@@ -0,0 +1,114 @@
+import bisect
+import csv
+import os
+import threading
+
+# Columns written by test_model() to trade_log.txt
+LOG_COLUMNS = ["Step", "Action", "Price", "Portfolio Value"]
+
+
+class PortfolioCache:
+    """
+    In-process view of the trade log. Each refresh stats the file and parses only the rows
+    appended since the last one; a shrunk or replaced file is re-read from scratch. Queries
+    slice and downsample the parsed series without touching the file again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, signature):
+        self.signature = signature  # (inode, size, mtime_ns) of the file as last parsed
+        self.offset = 0             # Bytes consumed, always at a line boundary
+        self.columns = None
+        self.steps, self.actions, self.prices, self.values = [], [], [], []
+
+    # Cheap file identity used both for invalidation and as the ETag base
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def refresh(self):
+        with self.lock:
+            signature = self._stat()
+            if signature == self.signature:
+                return signature
+            inode, size, _ = signature
+            if self.signature is None or inode != self.signature[0] or size < self.offset:
+                self._reset(signature)
+
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            end = data.rfind(b"\n") + 1  # A partially written last line is picked up next time
+            self._parse(data[:end].decode("utf-8").splitlines())
+            self.offset += end
+            self.signature = signature
+            return signature
+
+    def _parse(self, lines):
+        rows = csv.reader(lines)
+        if self.columns is None:
+            self.columns = next(rows, None)
+            if self.columns is None:
+                return
+            if self.columns != LOG_COLUMNS:
+                raise ValueError(f"Unexpected trade log columns: {self.columns}")
+        for row in rows:
+            if len(row) != len(LOG_COLUMNS):
+                continue
+            self.steps.append(int(row[0]))
+            self.actions.append(row[1])
+            self.prices.append(float(row[2]))
+            self.values.append(float(row[3]))
+
+    # ETag for one query against the current file contents
+    def etag(self, signature, *params):
+        return "-".join(str(part) for part in signature + params)
+
+    def query(self, since=None, limit=None, resolution=None):
+        """
+        Rows with Step >= since, keeping every `resolution`-th row (plus the latest one),
+        at most `limit` rows. `next_since` is the step to request for the following page.
+        """
+        with self.lock:
+            if not self.steps:
+                return None
+            start = bisect.bisect_left(self.steps, since) if since is not None else 0
+            indices = range(start, len(self.steps), resolution or 1)
+            if resolution and resolution > 1 and indices and indices[-1] != len(self.steps) - 1:
+                indices = list(indices) + [len(self.steps) - 1]
+            next_since = None
+            if limit is not None and len(indices) > limit:
+                next_since = self.steps[indices[limit]]
+                indices = indices[:limit]
+
+            records = [
+                {
+                    "Step": self.steps[i],
+                    "Action": self.actions[i],
+                    "Price": self.prices[i],
+                    "Portfolio Value": self.values[i],
+                }
+                for i in indices
+            ]
+            return {
+                "total_value": self.values[-1],
+                "total_rows": len(self.steps),
+                "next_since": next_since,
+                "stocks": records,
+            }
+
+
+# One cache per log file, shared across requests
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_portfolio_cache(path):
+    with caches_lock:
+        if path not in caches:
+            caches[path] = PortfolioCache(path)
+        return caches[path]
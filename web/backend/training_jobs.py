@@ -0,0 +1,273 @@
+import json
+import os
+import queue
+import re
+import shlex
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.abspath(os.path.join(BACKEND_DIR, '../../Application'))
+
+# Job database and per-job output logs
+JOBS_DATABASE = os.getenv("TRAINING_JOBS_DB", os.path.join(BACKEND_DIR, "training_jobs.db"))
+JOBS_LOG_DIR = os.getenv("TRAINING_JOBS_LOG_DIR", os.path.join(BACKEND_DIR, "training_jobs"))
+
+# Command run for each job; override (e.g. with a fake trainer) through TRAINING_COMMAND
+DEFAULT_COMMAND = [sys.executable, os.path.join(APPLICATION_DIR, "test_ppo.py"), "--train"]
+TRAINING_COMMAND = shlex.split(os.environ["TRAINING_COMMAND"]) if os.getenv("TRAINING_COMMAND") else DEFAULT_COMMAND
+# Model the default command trains; each job trains its own copy (passed as --model-file) and replaces this
+# file only when it succeeds, so concurrent jobs never write the same file and /predict never loads a partial one
+TRAINING_MODEL_FILE = (os.path.join(APPLICATION_DIR, "ppo_day_trade_bot.zip")
+                       if TRAINING_COMMAND == DEFAULT_COMMAND else None)
+
+# Concurrent jobs (each gets a disjoint CPU set) and how many may wait in the queue
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "1"))
+TRAINING_MAX_QUEUED = int(os.getenv("TRAINING_MAX_QUEUED", "4"))
+
+# Seconds between progress writes to the database while a job is producing output
+PROGRESS_FLUSH_SECONDS = 2.0
+# Seconds a cancelled job gets to exit after SIGTERM before it is killed
+CANCEL_GRACE_SECONDS = 10.0
+
+ACTIVE_STATES = ("queued", "running")
+
+# "|    fps                  | 123      |" rows of the SB3 logger table, and its "| time/ | |" section rows
+SB3_ROW = re.compile(r"^\|\s+([\w./-]+)\s+\|\s+([^|]*?)\s*\|$")
+# ThroughputCallback summary line
+ROLLOUT_LINE = re.compile(r"^Rollout: (\d+) steps in ([\d.]+)s \((\d+) steps/s")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# Split the CPUs this process may use into one disjoint set per worker slot
+def partition_cpus(n_slots):
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * n_slots
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < n_slots:
+        return [cpus] * n_slots
+    size = len(cpus) // n_slots
+    return [cpus[i * size:(i + 1) * size] for i in range(n_slots)]
+
+
+# Fold one output line into the job's progress dict; returns True if anything changed
+def parse_progress(line, progress, section):
+    line = line.strip()
+    match = ROLLOUT_LINE.match(line)
+    if match:
+        progress["rollout_steps"] = int(match.group(1))
+        progress["steps_per_sec"] = int(match.group(3))
+        return True
+    match = SB3_ROW.match(line)
+    if not match:
+        return False
+    key, value = match.groups()
+    if key.endswith("/"):
+        section[0] = key
+        return False
+    try:
+        value = float(value)
+        value = int(value) if value.is_integer() else value
+    except ValueError:
+        pass
+    progress[f"{section[0]}{key}"] = value
+    return True
+
+
+# Jobs run in their own session, so signal the whole process group: trainers with --vec-backend subproc
+# have environment workers that would outlive a signal sent to the parent alone. Once the job has exited
+# and been reaped, its group id may already belong to another process, so it is left alone.
+def signal_group(process, sig):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class TrainingScheduler:
+    """
+    Runs training jobs from a bounded queue on a fixed pool of worker threads. Each job is a
+    subprocess pinned to its worker's CPU set, with BLAS/torch thread counts capped to match.
+    Job state, progress parsed from the SB3 logger output and the exit status are stored in
+    SQLite, so /training-status keeps working across backend restarts.
+    """
+
+    def __init__(self, database_path=JOBS_DATABASE, command=TRAINING_COMMAND, workers=TRAINING_WORKERS,
+                 max_queued=TRAINING_MAX_QUEUED, log_dir=JOBS_LOG_DIR, model_file=TRAINING_MODEL_FILE):
+        self.database_path = database_path
+        self.command = list(command)
+        self.model_file = model_file
+        self.max_queued = max_queued
+        self.log_dir = log_dir
+        self.db_lock = threading.Lock()
+        self.conn = sqlite3.connect(database_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS training_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                command TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                pid INTEGER,
+                cpus TEXT,
+                return_code INTEGER,
+                progress TEXT,
+                error TEXT,
+                log_path TEXT
+            )
+        """)
+        self.conn.commit()
+        os.makedirs(log_dir, exist_ok=True)
+
+        self.queue = queue.Queue()
+        self.processes = {}
+        self.cancelled = set()
+        self.lock = threading.Lock()
+        self._recover()
+        for cpus in partition_cpus(workers):
+            threading.Thread(target=self._work, args=(cpus,), daemon=True).start()
+
+    def _execute(self, sql, params=()):
+        with self.db_lock:
+            cursor = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cursor.fetchall()
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE training_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    # Jobs left running by a previous backend process cannot be reattached; queued ones are resumed
+    def _recover(self):
+        self._execute(
+            "UPDATE training_jobs SET status = 'failed', error = 'Interrupted by backend restart', finished_at = ? "
+            "WHERE status = 'running'", (time.time(),)
+        )
+        for row in self._execute("SELECT id FROM training_jobs WHERE status = 'queued' ORDER BY created_at"):
+            self.queue.put(row["id"])
+
+    def submit(self):
+        with self.lock:
+            queued = self._execute("SELECT COUNT(*) AS n FROM training_jobs WHERE status = 'queued'")[0]["n"]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} training jobs are already queued.")
+            job_id = str(uuid.uuid4())
+            self._execute(
+                "INSERT INTO training_jobs (id, status, command, created_at, log_path) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(self.command), time.time(), os.path.join(self.log_dir, f"{job_id}.log")),
+            )
+            self.queue.put(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATES:
+            return job
+        with self.lock:
+            self.cancelled.add(job_id)
+            process = self.processes.get(job_id)
+            if job["status"] == "queued":
+                self._update(job_id, status="cancelled", finished_at=time.time())
+        if process is not None:
+            signal_group(process, signal.SIGTERM)
+            kill = threading.Timer(CANCEL_GRACE_SECONDS, signal_group, (process, signal.SIGKILL))
+            kill.daemon = True
+            kill.start()
+        return self.get(job_id)
+
+    def _job_dict(self, row):
+        job = dict(row)
+        job["command"] = json.loads(job["command"])
+        job["cpus"] = json.loads(job["cpus"]) if job["cpus"] else None
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        return job
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM training_jobs WHERE id = ?", (job_id,))
+        return self._job_dict(rows[0]) if rows else None
+
+    def jobs(self, limit=20):
+        rows = self._execute("SELECT * FROM training_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self._job_dict(row) for row in rows]
+
+    def active(self):
+        rows = self._execute(
+            "SELECT id FROM training_jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATES
+        )
+        return [row["id"] for row in rows]
+
+    def _work(self, cpus):
+        while True:
+            job_id = self.queue.get()
+            with self.lock:
+                if job_id in self.cancelled:
+                    continue
+                self._update(job_id, status="running", started_at=time.time(), cpus=json.dumps(cpus))
+            try:
+                self._run(job_id, cpus)
+            except Exception as e:
+                print(f"Error during training job {job_id}: {e}")
+                self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def _run(self, job_id, cpus):
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        if cpus:
+            threads = str(len(cpus))
+            env.update(OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads, OPENBLAS_NUM_THREADS=threads)
+        pin = (lambda: os.sched_setaffinity(0, cpus)) if cpus else None
+
+        command, job_model = list(self.command), None
+        if self.model_file:
+            root, ext = os.path.splitext(self.model_file)
+            job_model = f"{root}_job_{job_id}{ext}"
+            if os.path.exists(self.model_file):
+                shutil.copyfile(self.model_file, job_model)  # Continue from the current model, as one job would
+            command += ["--model-file", job_model]
+
+        log_path = os.path.join(self.log_dir, f"{job_id}.log")
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                env=env, preexec_fn=pin, start_new_session=True,
+            )
+            with self.lock:
+                self.processes[job_id] = process
+                if job_id in self.cancelled:
+                    signal_group(process, signal.SIGTERM)
+            self._update(job_id, pid=process.pid)
+
+            progress, section, last_flush = {}, [""], time.monotonic()
+            for line in process.stdout:
+                log.write(line)
+                if parse_progress(line, progress, section) and time.monotonic() - last_flush > PROGRESS_FLUSH_SECONDS:
+                    log.flush()
+                    self._update(job_id, progress=json.dumps(progress))
+                    last_flush = time.monotonic()
+            return_code = process.wait()
+
+        with self.lock:
+            self.processes.pop(job_id, None)
+            cancelled = job_id in self.cancelled
+        status = "cancelled" if cancelled else "succeeded" if return_code == 0 else "failed"
+        error = None if status != "failed" else f"Exited with code {return_code}"
+        if job_model and os.path.exists(job_model):
+            if status == "succeeded":
+                os.replace(job_model, self.model_file)  # The last job to finish provides the served model
+            else:
+                os.remove(job_model)
+        self._update(job_id, status=status, return_code=return_code, progress=json.dumps(progress),
+                     error=error, finished_at=time.time())
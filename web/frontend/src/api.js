@@ -46,10 +46,10 @@ export const trainModel = async () => {
     }
 };
 
-// Fetch portfolio data
-export const getPortfolio = async () => {
+// Fetch portfolio data (optional params: since, limit, resolution)
+export const getPortfolio = async (params = {}) => {
     try {
-        const response = await axios.get(`${API_BASE}/portfolio`);
+        const response = await axios.get(`${API_BASE}/portfolio`, { params });
         return response.data;
     } catch (error) {
         console.error("Error fetching portfolio:", error.message);
@@ -10,10 +10,17 @@ const TrainingLogs = () => {
             setLogs((prevLogs) => prevLogs + event.data + "\n");
         };
     
+        // The log was rewritten by a new run; the stream restarts from the beginning
+        eventSource.addEventListener("reset", () => {
+            setLogs("");
+        });
+    
+        // The browser reconnects on its own and resumes from the last event id
         eventSource.onerror = () => {
             console.error("Error connecting to the log stream.");
-            setLogs((prevLogs) => prevLogs + "Error: Unable to connect to logs.\n");
-            eventSource.close();
+            if (eventSource.readyState === EventSource.CLOSED) {
+                setLogs((prevLogs) => prevLogs + "Error: Unable to connect to logs.\n");
+            }
         };
     
         return () => {